@@ -3,19 +3,33 @@
 Веб-сервис для транскрибации видео
 """
 
-from fastapi import FastAPI, Request, UploadFile, File, BackgroundTasks, HTTPException
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
+from starlette.background import BackgroundTask
 import asyncio
+import hashlib
 import json
 import os
+import shutil
+import tempfile
 import time
 import uuid
+import zipfile
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 import logging
 
-from streaming_video_transcriber import StreamingVideoTranscriber
+from job_queue import JobScheduler, QueueFullError
+from task_store import TaskStore, summarize_task, default_task_ttl, default_max_tasks, default_janitor_interval
+from pipeline_pool import PipelinePool
+from live_session import LiveSession, default_max_live_sessions
+from streaming_video_transcriber import SAMPLE_RATE, pipeline_version
+from transcript_cache import TranscriptCache
+from transcript_writer import TRANSCRIPT_WRITERS, remove_stale_parts
+from upload_receiver import UploadReceiver, UploadTooLarge
+from download_cache import DownloadCache
+from metrics import ServiceMetrics
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -23,11 +37,64 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Video Transcriber Service", version="1.0.0")
 
-# Глобальное хранилище задач
-tasks: Dict[str, Dict[str, Any]] = {}
+# Хранилище задач (TASK_STORE): по умолчанию SQLite, общее для процессов uvicorn и переживающее перезапуск
+task_store = TaskStore.from_env()
+# Хранение завершенных задач: срок, число последних и период фоновой очистки
+task_ttl = default_task_ttl()
+max_tasks = default_max_tasks()
+janitor_interval = default_janitor_interval()
+janitor: Optional[asyncio.Task] = None
 
-# Инициализация транскрибатора
-transcriber = StreamingVideoTranscriber()
+# Пул процессов с пайплайнами T-one (размер задается TRANSCRIBER_WORKERS)
+pipeline_pool = PipelinePool()
+
+# Планировщик: не больше задач одновременно, чем воркеров в пуле, остальные ждут в очереди
+scheduler = JobScheduler(workers=pipeline_pool.workers)
+# Отрезки длинных файлов занимают воркеров через планировщик, а не в обход его очереди
+pipeline_pool.scheduler = scheduler
+# Фоновый запуск пула (загрузка и прогрев модели)
+pool_startup: Optional[asyncio.Task] = None
+
+# Кэш транскрипций общий для всех воркеров (каталог на диске), счетчики попаданий ведутся здесь
+transcript_cache = TranscriptCache.from_env(pipeline_version())
+cache_stats = {"hits": 0, "misses": 0}
+download_cache = DownloadCache.from_env()
+
+# Гистограммы времени этапов и задач для /metrics (в пределах процесса сервиса)
+service_metrics = ServiceMetrics()
+
+# Подписчики на события задач (SSE) и фразы, распознанные задачами в обработке
+event_subscribers: Dict[str, List[asyncio.Queue]] = {}
+live_phrases: Dict[str, List[Dict[str, Any]]] = {}
+# Интервал комментария keep-alive в потоке событий и обновления позиции в очереди
+SSE_KEEPALIVE = 15
+SSE_QUEUE_REFRESH = 2
+
+# Допустимый приоритет задач: значения вне диапазона приводятся к границе,
+# чтобы один клиент не мог поставить свои задачи впереди всей очереди сколь угодно далеко
+MIN_PRIORITY = -10
+MAX_PRIORITY = 10
+
+# Размер страницы списка задач по умолчанию и максимальный
+TASKS_PAGE_SIZE = 50
+TASKS_MAX_PAGE_SIZE = 500
+
+# Загружаемые файлы пишутся на диск блоками по мере приема, память на загрузку не зависит от размера файла
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+# Запас на заголовки и границы multipart сверх размера самого файла
+UPLOAD_FORM_OVERHEAD = 1024 * 1024
+max_upload_bytes = int(os.environ.get("TRANSCRIBER_MAX_UPLOAD_MB", "4096")) * 1024 * 1024
+
+# Живые сессии распознавания (WebSocket /api/live)
+max_live_sessions = default_max_live_sessions()
+live_sessions = 0
+
+# Пакетная транскрибация (/api/batch): пути на сервере разрешены только внутри TRANSCRIBER_BATCH_ROOT
+batch_root = Path(os.environ["TRANSCRIBER_BATCH_ROOT"]).resolve() if os.environ.get("TRANSCRIBER_BATCH_ROOT") else None
+batch_max_items = int(os.environ.get("TRANSCRIBER_BATCH_MAX_ITEMS", "1000"))
+batch_runners: set = set()
+# URL задач, которые сейчас в очереди или в работе, и события их завершения
+url_in_flight: Dict[str, asyncio.Event] = {}
 
 @app.on_event("startup")
 async def startup_event():
@@ -44,8 +111,54 @@ async def startup_event():
     logger.info("💡 Для остановки сервера нажмите Ctrl+C")
     logger.info("=" * 50)
     
-    # Инициализация пайплайна T-one
-    transcriber.init_pipeline(use_gpu=False)
+    # Задачи, которые выполнял завершившийся процесс, уже никто не закончит, а ждавшие очереди ставятся заново
+    recovered = task_store.recover_interrupted("Задача прервана перезапуском сервиса")
+    if recovered:
+        runner = asyncio.create_task(requeue_tasks(recovered))
+        batch_runners.add(runner)
+        runner.add_done_callback(batch_runners.discard)
+    
+    # Процессы пула создаются до приема запросов
+    try:
+        pipeline_pool.launch()
+    except Exception as e:
+        logger.error(f"❌ Ошибка запуска пула пайплайнов: {e}")
+    
+    # Модели в воркерах загружаются в фоне: сервис сразу отвечает на /health,
+    # задачи до готовности ждут в очереди, а /ready сообщает о готовности после прогрева модели
+    global janitor, pool_startup
+    pool_startup = asyncio.create_task(start_pipeline_pool())
+    janitor = asyncio.create_task(run_janitor())
+
+async def start_pipeline_pool():
+    """Ожидание загрузки моделей в пуле пайплайнов, затем запуск исполнителей очереди задач"""
+    try:
+        await asyncio.to_thread(pipeline_pool.wait_ready)
+    except Exception as e:
+        # Задачи в очереди завершатся ошибкой пула, а не будут ждать бесконечно
+        logger.error(f"❌ Ошибка запуска пула пайплайнов: {e}")
+    scheduler.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if janitor is not None:
+        janitor.cancel()
+    if pool_startup is not None:
+        pool_startup.cancel()
+    for runner in batch_runners:
+        runner.cancel()
+    await scheduler.shutdown()
+    pipeline_pool.shutdown()
+    task_store.close()
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Отклоняет слишком большие загрузки по Content-Length до чтения тела запроса"""
+    if request.url.path == "/api/transcribe-file":
+        content_length = request.headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > max_upload_bytes + UPLOAD_FORM_OVERHEAD:
+            return upload_too_large_response()
+    return await call_next(request)
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
@@ -362,6 +475,19 @@ async def read_root(request: Request):
                 background: #5a67d8;
             }
             
+            .task-pager {
+                display: flex;
+                justify-content: center;
+                align-items: center;
+                gap: 15px;
+                color: #718096;
+            }
+            
+            .task-pager button {
+                width: auto;
+                padding: 8px 16px;
+            }
+            
             .stats {
                 display: grid;
                 grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
@@ -388,6 +514,24 @@ async def read_root(request: Request):
                 color: #718096;
                 font-weight: 600;
             }
+            
+            .live-phrases {
+                max-height: 300px;
+                overflow-y: auto;
+                margin-top: 20px;
+                font-size: 0.95em;
+                line-height: 1.5;
+            }
+            
+            .live-phrase {
+                padding: 4px 0;
+                border-bottom: 1px solid #edf2f7;
+            }
+            
+            .live-phrase-time {
+                color: #718096;
+                margin-right: 8px;
+            }
         </style>
     </head>
     <body>
@@ -416,6 +560,7 @@ async def read_root(request: Request):
                         <select id="outputFormat" name="output_format">
                             <option value="txt">TXT (Текст)</option>
                             <option value="json">JSON (Данные)</option>
+                            <option value="jsonl">JSON Lines (Фраза на строку)</option>
                         </select>
                     </div>
                     <button type="submit" id="urlSubmitBtn">🚀 Начать транскрибацию</button>
@@ -441,6 +586,7 @@ async def read_root(request: Request):
                         <select id="fileOutputFormat" name="output_format">
                             <option value="txt">TXT (Текст)</option>
                             <option value="json">JSON (Данные)</option>
+                            <option value="jsonl">JSON Lines (Фраза на строку)</option>
                         </select>
                     </div>
                     <button type="submit" id="fileSubmitBtn">🚀 Начать транскрибацию</button>
@@ -451,9 +597,18 @@ async def read_root(request: Request):
             <div id="tasks-tab" class="tab-content">
                 <div class="task-list" id="taskList">
                     <h2>Активные и завершенные задачи</h2>
+                    <div class="form-group">
+                        <select id="taskStatusFilter" onchange="tasksOffset = 0; loadTasks();">
+                            <option value="">Все задачи</option>
+                            <option value="queued,processing">В обработке</option>
+                            <option value="completed">Завершенные</option>
+                            <option value="error">С ошибкой</option>
+                        </select>
+                    </div>
                     <div id="tasksContainer">
                         <!-- Задачи будут добавляться сюда -->
                     </div>
+                    <div class="task-pager" id="taskPager"></div>
                 </div>
                 
                 <div class="stats" id="statsContainer">
@@ -468,6 +623,7 @@ async def read_root(request: Request):
                 <div class="progress-bar-container">
                     <div class="progress-bar" id="progressBar">0%</div>
                 </div>
+                <div id="livePhrases" class="live-phrases"></div>
                 <div id="downloadLinkContainer"></div>
             </div>
         </div>
@@ -490,8 +646,8 @@ async def read_root(request: Request):
                 // Show selected tab content
                 document.getElementById(tabName + '-tab').classList.add('active');
                 
-                // Add active class to clicked tab
-                event.target.classList.add('active');
+                // Add active class to the tab button (also when called from code, not a click)
+                document.querySelector(`.tab[onclick="switchTab('${tabName}')"]`).classList.add('active');
                 
                 // Load tasks if tasks tab is selected
                 if (tabName === 'tasks') {
@@ -585,9 +741,9 @@ async def read_root(request: Request):
                     
                     if (response.ok) {
                         currentTaskId = data.task_id;
-                        pollStatus(currentTaskId);
+                        watchTask(currentTaskId);
                     } else {
-                        showStatus('error', `Ошибка: ${data.message || 'Неизвестная ошибка'}`, 0);
+                        showStatus('error', `Ошибка: ${data.detail || data.message || 'Неизвестная ошибка'}`, 0);
                     }
                 } catch (error) {
                     showStatus('error', `Ошибка при отправке запроса: ${error.message}`, 0);
@@ -608,41 +764,118 @@ async def read_root(request: Request):
                 progressBar.textContent = `${Math.round(progress)}%`;
             }
             
+            // Live updates over Server-Sent Events; polling is the fallback
+            function watchTask(taskId) {
+                document.getElementById('livePhrases').innerHTML = '';
+                document.getElementById('downloadLinkContainer').innerHTML = '';
+                if (!window.EventSource) {
+                    pollStatus(taskId);
+                    return;
+                }
+                
+                const source = new EventSource(`/api/events/${taskId}`);
+                source.addEventListener('status', (e) => {
+                    // The final state is rendered once, from the 'done' event
+                    const taskStatus = JSON.parse(e.data);
+                    if (taskStatus.status === 'queued' || taskStatus.status === 'processing') {
+                        renderStatus(taskStatus, taskId);
+                    }
+                });
+                source.addEventListener('phrase', (e) => appendLivePhrase(JSON.parse(e.data)));
+                source.addEventListener('done', (e) => {
+                    source.close();
+                    renderStatus(JSON.parse(e.data), taskId);
+                });
+                source.onerror = () => {
+                    source.close();
+                    pollStatus(taskId);
+                };
+            }
+            
+            function appendLivePhrase(phrase) {
+                const container = document.getElementById('livePhrases');
+                const atBottom = container.scrollTop + container.clientHeight >= container.scrollHeight - 5;
+                
+                const line = document.createElement('div');
+                line.className = 'live-phrase';
+                const time = document.createElement('span');
+                time.className = 'live-phrase-time';
+                time.textContent = `[${formatDuration(phrase.start)}]`;
+                line.appendChild(time);
+                line.appendChild(document.createTextNode(`${phrase.role}: ${phrase.text}`));
+                container.appendChild(line);
+                
+                if (atBottom) {
+                    container.scrollTop = container.scrollHeight;
+                }
+            }
+            
             async function pollStatus(taskId) {
                 try {
                     const response = await fetch(`/api/status/${taskId}`);
                     const taskStatus = await response.json();
                     
-                    if (taskStatus.status === 'processing') {
-                        showStatus('processing', taskStatus.message, taskStatus.progress);
+                    if (!renderStatus(taskStatus, taskId)) {
                         setTimeout(() => pollStatus(taskId), 2000);
-                    } else if (taskStatus.status === 'completed') {
-                        showStatus('completed', 'Транскрибация завершена!', 100);
-                        
-                        if (taskStatus.result && taskStatus.result.output_path) {
-                            const downloadLink = document.createElement('a');
-                            downloadLink.href = `/api/download/${taskId}`;
-                            downloadLink.className = 'download-link';
-                            downloadLink.textContent = '📥 Скачать результат';
-                            downloadLink.download = '';
-                            document.getElementById('downloadLinkContainer').appendChild(downloadLink);
-                        }
-                        
-                        // Switch to tasks tab to show the completed task
-                        switchTab('tasks');
-                        loadTasks();
-                    } else if (taskStatus.status === 'error') {
-                        showStatus('error', `Ошибка: ${taskStatus.message}`, 0);
                     }
                 } catch (error) {
                     showStatus('error', `Ошибка проверки статуса: ${error.message}`, 0);
                 }
             }
             
+            // Returns true once the task has finished
+            function renderStatus(taskStatus, taskId) {
+                if (taskStatus.status === 'queued') {
+                    const wait = taskStatus.estimated_wait ? `, ожидание ~${formatDuration(taskStatus.estimated_wait)}` : '';
+                    showStatus('processing', `В очереди: позиция ${taskStatus.queue_position}${wait}`, 0);
+                    return false;
+                } else if (taskStatus.status === 'processing') {
+                    showStatus('processing', taskStatus.message, taskStatus.progress);
+                    return false;
+                } else if (taskStatus.status === 'completed') {
+                    showStatus('completed', 'Транскрибация завершена!', 100);
+                    
+                    if (taskStatus.result && taskStatus.result.output_path) {
+                        const downloadLink = document.createElement('a');
+                        downloadLink.href = `/api/download/${taskId}`;
+                        downloadLink.className = 'download-link';
+                        downloadLink.textContent = '📥 Скачать результат';
+                        downloadLink.download = '';
+                        document.getElementById('downloadLinkContainer').appendChild(downloadLink);
+                    }
+                    
+                    // Switch to tasks tab to show the completed task
+                    switchTab('tasks');
+                    loadTasks();
+                    return true;
+                } else if (taskStatus.status === 'error') {
+                    showStatus('error', `Ошибка: ${taskStatus.message}`, 0);
+                    return true;
+                }
+                return false;
+            }
+            
+            // Страница списка задач и ETag последнего ответа: неизмененная страница приходит как 304
+            const TASKS_PAGE_SIZE = 50;
+            let tasksOffset = 0;
+            let tasksEtag = null;
+            
             async function loadTasks() {
                 try {
-                    const response = await fetch('/api/tasks');
-                    const tasks = await response.json();
+                    const params = new URLSearchParams({limit: TASKS_PAGE_SIZE, offset: tasksOffset});
+                    const statusFilter = document.getElementById('taskStatusFilter').value;
+                    if (statusFilter) {
+                        params.set('status', statusFilter);
+                    }
+                    
+                    const response = await fetch(`/api/tasks?${params}`, {
+                        headers: tasksEtag ? {'If-None-Match': tasksEtag} : {}
+                    });
+                    if (response.status === 304) {
+                        return;
+                    }
+                    tasksEtag = response.headers.get('ETag');
+                    const page = await response.json();
                     
                     const tasksContainer = document.getElementById('tasksContainer');
                     const statsContainer = document.getElementById('statsContainer');
@@ -650,20 +883,21 @@ async def read_root(request: Request):
                     // Clear containers
                     tasksContainer.innerHTML = '';
                     statsContainer.innerHTML = '';
+                    renderTaskPager(page);
                     
-                    if (Object.keys(tasks).length === 0) {
+                    if (page.tasks.length === 0) {
                         tasksContainer.innerHTML = '<p style="text-align: center; color: #718096;">Нет активных задач</p>';
                         return;
                     }
                     
                     // Display tasks
-                    Object.values(tasks).forEach(task => {
+                    page.tasks.forEach(task => {
                         const taskElement = createTaskElement(task);
                         tasksContainer.appendChild(taskElement);
                     });
                     
                     // Display stats
-                    const stats = calculateStats(tasks);
+                    const stats = calculateStats(page.counts);
                     statsContainer.innerHTML = `
                         <div class="stat-card">
                             <div class="stat-number">${stats.total}</div>
@@ -687,6 +921,28 @@ async def read_root(request: Request):
                 }
             }
             
+            function renderTaskPager(page) {
+                const pager = document.getElementById('taskPager');
+                pager.innerHTML = '';
+                if (page.total <= page.limit) {
+                    return;
+                }
+                
+                const newer = document.createElement('button');
+                newer.textContent = '← Новее';
+                newer.disabled = page.offset === 0;
+                newer.onclick = () => { tasksOffset = Math.max(0, page.offset - page.limit); loadTasks(); };
+                
+                const older = document.createElement('button');
+                older.textContent = 'Старее →';
+                older.disabled = page.offset + page.tasks.length >= page.total;
+                older.onclick = () => { tasksOffset = page.offset + page.limit; loadTasks(); };
+                
+                const info = document.createElement('span');
+                info.textContent = `${page.offset + 1}–${page.offset + page.tasks.length} из ${page.total}`;
+                pager.append(newer, info, older);
+            }
+            
             function createTaskElement(task) {
                 const taskDiv = document.createElement('div');
                 taskDiv.className = 'task-item';
@@ -720,13 +976,12 @@ async def read_root(request: Request):
                 return taskDiv;
             }
             
-            function calculateStats(tasks) {
-                const taskList = Object.values(tasks);
+            function calculateStats(counts) {
                 return {
-                    total: taskList.length,
-                    completed: taskList.filter(t => t.status === 'completed').length,
-                    processing: taskList.filter(t => t.status === 'processing').length,
-                    error: taskList.filter(t => t.status === 'error').length
+                    total: Object.values(counts).reduce((sum, count) => sum + count, 0),
+                    completed: counts.completed || 0,
+                    processing: (counts.processing || 0) + (counts.queued || 0),
+                    error: counts.error || 0
                 };
             }
             
@@ -753,172 +1008,479 @@ async def read_root(request: Request):
     return HTMLResponse(content=html_content)
 
 @app.post("/api/transcribe-url")
-async def transcribe_video_url(
-    video_data: dict,
-    background_tasks: BackgroundTasks
-):
+async def transcribe_video_url(video_data: dict):
     """API endpoint для транскрибации видео по URL"""
     video_url = video_data.get("video_url")
     output_format = video_data.get("output_format", "txt")
+    priority = parse_priority(video_data.get("priority", 0))
     
     if not video_url:
         raise HTTPException(status_code=400, detail="URL видео не предоставлен")
     
     task_id = str(uuid.uuid4())
-    tasks[task_id] = {
+    in_flight = url_in_flight.get(video_url)
+    task_store.create({
         "id": task_id,
         "video_input": video_url,
         "output_format": output_format,
-        "status": "processing",
-        "message": "Начало транскрибации...",
+        "status": "queued",
+        "message": "Ожидает задачу с тем же URL..." if in_flight is not None else "В очереди...",
         "progress": 0,
         "result": None,
-        "start_time": time.time()
-    }
+        "start_time": time.time(),
+        "priority": priority
+    })
     
-    background_tasks.add_task(
-        process_transcription_task,
-        task_id,
-        video_url,
-        output_format
-    )
+    if in_flight is not None:
+        # Такой же URL уже транскрибируется: задача ждет его вне очереди, не занимая воркер,
+        # и после него ставится в очередь, где ее результат обычно берется из кэша транскрипций
+        runner = asyncio.create_task(follow_url_task(task_id, video_url, output_format, priority, in_flight))
+        batch_runners.add(runner)
+        runner.add_done_callback(batch_runners.discard)
+    else:
+        done = asyncio.Event()
+        url_in_flight[video_url] = done
+        try:
+            await enqueue_task(task_id, lambda: lead_url_task(task_id, video_url, output_format, done), priority)
+        except HTTPException:
+            finish_url_task(video_url, done)
+            raise
     
-    return JSONResponse(content={"message": "Транскрибация запущена", "task_id": task_id})
+    return JSONResponse(content={"message": "Транскрибация поставлена в очередь", "task_id": task_id})
 
-@app.post("/api/transcribe-file")
+@app.post("/api/transcribe-file", openapi_extra={
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["video_file"],
+            "properties": {
+                "video_file": {"type": "string", "format": "binary"},
+                "output_format": {"type": "string"},
+                "priority": {"type": "integer"},
+            },
+        }}},
+    }
+})
 async def transcribe_video_file(
-    video_file: UploadFile = File(...),
-    output_format: str = "txt",
-    background_tasks: BackgroundTasks = None
+    request: Request,
+    output_format: Optional[str] = None,
+    priority: Optional[str] = None
 ):
-    """API endpoint для транскрибации загруженного видео файла"""
-    if not video_file:
-        raise HTTPException(status_code=400, detail="Видео файл не предоставлен")
+    """API endpoint для транскрибации загруженного видео файла
+
+    Тело формы разбирается по мере приема: файл video_file сразу пишется во временный каталог,
+    а размер проверяется на лету, в том числе у загрузок без Content-Length.
+    output_format и priority принимаются параметрами запроса или полями формы; параметр запроса важнее.
+    """
+    # Приоритет из параметра запроса проверяется до приема файла
+    if priority is not None:
+        priority = parse_priority(priority)
+    # Не принимаем файл, если его все равно некуда поставить
+    if scheduler.is_full():
+        raise queue_full_error(scheduler.retry_after())
     
     # Сохраняем загруженный файл во временную директорию
     temp_dir = Path(tempfile.mkdtemp(prefix="uploaded_video_"))
-    temp_file_path = temp_dir / video_file.filename
-    
-    with open(temp_file_path, "wb") as buffer:
-        content = await video_file.read()
-        buffer.write(content)
+    try:
+        upload = await receive_upload(request, temp_dir)
+    except UploadTooLarge:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return upload_too_large_response()
+    except ValueError as e:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        # Клиент оборвал загрузку
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+    temp_file_path = upload.file_path
+    output_format = output_format or upload.fields.get("output_format") or "txt"
+    if priority is None:
+        try:
+            priority = parse_priority(upload.fields.get("priority", 0))
+        except HTTPException:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
     
     task_id = str(uuid.uuid4())
-    tasks[task_id] = {
+    task_store.create({
         "id": task_id,
-        "video_input": video_file.filename,
+        "video_input": upload.filename,
         "output_format": output_format,
-        "status": "processing",
-        "message": "Начало транскрибации...",
+        "status": "queued",
+        "message": "В очереди...",
         "progress": 0,
         "result": None,
         "start_time": time.time(),
+        "priority": priority,
         "temp_file_path": str(temp_file_path)
-    }
+    })
     
-    background_tasks.add_task(
-        process_file_transcription_task,
-        task_id,
-        str(temp_file_path),
-        output_format
-    )
+    try:
+        await enqueue_task(
+            task_id,
+            lambda: process_file_transcription_task(task_id, str(temp_file_path), output_format),
+            priority
+        )
+    except HTTPException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
     
-    return JSONResponse(content={"message": "Транскрибация запущена", "task_id": task_id})
+    return JSONResponse(content={"message": "Транскрибация поставлена в очередь", "task_id": task_id})
 
-async def process_transcription_task(task_id: str, video_url: str, output_format: str):
-    """Обработка задачи транскрибации по URL"""
+async def receive_upload(request: Request, temp_dir: Path) -> UploadReceiver:
+    """Принимает форму загрузки из потока тела запроса; на диск файл пишется блоками от UPLOAD_BLOCK_SIZE"""
+    upload = UploadReceiver(
+        request.headers.get("content-type", ""),
+        temp_dir,
+        max_upload_bytes + UPLOAD_FORM_OVERHEAD,
+        "video_file"
+    )
     try:
-        logger.info(f"🚀 Начало транскрибации URL: {video_url}")
-        tasks[task_id]["message"] = "Инициализация пайплайна..."
-        tasks[task_id]["progress"] = 5
-        
-        # Инициализация пайплайна
-        if not transcriber.pipeline:
-            transcriber.init_pipeline(use_gpu=False)
-        
-        tasks[task_id]["message"] = "Скачивание видео..."
-        tasks[task_id]["progress"] = 10
+        async for block in request.stream():
+            upload.feed(block)
+            if upload.pending >= UPLOAD_BLOCK_SIZE:
+                await asyncio.to_thread(upload.flush)
+        await asyncio.to_thread(upload.finish)
+    finally:
+        upload.close()
+    return upload
+
+def upload_too_large_response() -> JSONResponse:
+    """Ответ 413 с допустимым размером загрузки"""
+    return JSONResponse(
+        status_code=413,
+        content={"detail": f"Файл больше допустимого размера {max_upload_bytes // (1024 * 1024)} МБ"}
+    )
+
+def parse_priority(value: Any) -> int:
+    """Приоритет задачи из запроса, приведенный к MIN_PRIORITY..MAX_PRIORITY; не целое число - ответ 400"""
+    try:
+        if isinstance(value, (bool, float)):
+            raise ValueError(value)
+        priority = int(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Приоритет должен быть целым числом: {value!r}")
+    return min(MAX_PRIORITY, max(MIN_PRIORITY, priority))
+
+def queue_full_error(retry_after: int) -> HTTPException:
+    """Ответ 429 с заголовком Retry-After"""
+    return HTTPException(
+        status_code=429,
+        detail="Очередь задач заполнена, повторите запрос позже",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+async def enqueue_task(task_id: str, job, priority: int = 0):
+    """Ставит задачу в очередь планировщика; при переполнении удаляет ее и отвечает 429"""
+    try:
+        await scheduler.submit(task_id, job, priority)
+    except QueueFullError as e:
+        task_store.delete(task_id)
+        raise queue_full_error(e.retry_after)
+
+def record_job_stats(stats: Dict[str, Any]):
+    """Учитывает статистику завершенной задачи"""
+    if transcript_cache is not None:
+        cache_stats["hits" if stats.get("cache_hit") else "misses"] += 1
+    service_metrics.observe_job("completed", stats)
+
+def task_snapshot(task_id: str, task: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Состояние задачи для клиентов: без полного транскрипта, с позицией в очереди; None, если задачи нет"""
+    task = task if task is not None else task_store.get(task_id)
+    if task is None:
+        return None
+    snapshot = summarize_task(task)
+    queue_info = scheduler.queue_info(task_id)
+    if queue_info:
+        snapshot.update(queue_info)
+    return snapshot
+
+def publish_event(task_id: str, kind: str, data: Dict[str, Any]):
+    """Отправляет событие задачи всем подписчикам"""
+    for subscriber in event_subscribers.get(task_id, []):
+        subscriber.put_nowait((kind, data))
+
+def update_task(task_id: str, **fields):
+    """Обновляет поля задачи и сообщает подписчикам новый статус"""
+    task = task_store.update(task_id, **fields)
+    publish_event(task_id, "status", task_snapshot(task_id, task))
+
+def task_event_handler(task_id: str):
+    """Обработчик событий пайплайна: фразы по мере распознавания и прогресс по обработанным чанкам"""
+    phrases = live_phrases.setdefault(task_id, [])
+
+    def on_event(kind: str, data: Dict[str, Any]):
+        if kind == "phrase":
+            phrases.append(data)
+            publish_event(task_id, "phrase", data)
+        elif kind == "progress":
+            processed, total = data["chunks_processed"], data["total_chunks"]
+            fields = {"chunks_processed": processed, "total_chunks": total}
+            if total:
+                fields["progress"] = 10 + round(85 * processed / total, 1)
+                fields["message"] = f"Распознавание: {processed} из {total} чанков"
+            else:
+                fields["message"] = f"Распознавание: {processed} чанков"
+            update_task(task_id, **fields)
+
+    return on_event
+
+async def run_transcription(task_id: str, video_input: str, output_format: str, stage_message: str):
+    """Транскрибация задачи в пуле с публикацией событий"""
+    try:
+        logger.info(f"🚀 Начало транскрибации: {video_input}")
+        update_task(task_id, status="processing", message=stage_message, progress=10)
         
         # Транскрибация
-        transcript_data, output_file_path = await asyncio.to_thread(
-            transcriber.transcribe_video,
-            video_url,
-            output_format
+        transcript_data, output_file_path, stats = await pipeline_pool.transcribe(
+            video_input,
+            output_format,
+            on_event=task_event_handler(task_id)
         )
+        record_job_stats(stats)
         
-        tasks[task_id]["status"] = "completed"
-        tasks[task_id]["message"] = "Транскрибация завершена!"
-        tasks[task_id]["progress"] = 100
-        tasks[task_id]["result"] = {
-            "transcript": transcript_data,
-            "output_path": str(output_file_path)
-        }
+        # Транскрипт хранится отдельно от задачи, в задаче только метаданные результата
+        await asyncio.to_thread(task_store.save_transcript, task_id, transcript_data.to_list())
+        update_task(
+            task_id,
+            status="completed",
+            message="Транскрибация завершена!",
+            progress=100,
+            result={
+                "phrases": len(transcript_data),
+                "output_path": str(output_file_path),
+                "cache_hit": stats.get("cache_hit", False),
+                "skipped_ratio": stats.get("skipped_ratio"),
+                "audio_seconds": stats.get("audio_seconds"),
+                "processing_seconds": stats.get("processing_seconds"),
+                "real_time_factor": stats.get("real_time_factor"),
+                "stages": stats.get("stages", {})
+            }
+        )
         
         logger.info(f"✅ Транскрибация задачи {task_id} завершена. Результат: {output_file_path}")
         
     except Exception as e:
         logger.error(f"❌ Ошибка при обработке задачи {task_id}: {e}")
-        tasks[task_id]["status"] = "error"
-        tasks[task_id]["message"] = f"Ошибка при транскрибации: {e}"
-        tasks[task_id]["progress"] = 0
+        service_metrics.observe_job("error")
+        update_task(task_id, status="error", message=f"Ошибка при транскрибации: {e}", progress=0)
+    finally:
+        live_phrases.pop(task_id, None)
+        publish_event(task_id, "done", task_snapshot(task_id))
+
+def cleanup_tasks() -> int:
+    """Удаляет устаревшие завершенные задачи вместе с файлами их результатов и брошенные файлы .part"""
+    expired = task_store.expire(task_ttl, max_tasks)
+    for task in expired:
+        output_path = (task.get("result") or {}).get("output_path")
+        if output_path:
+            Path(output_path).unlink(missing_ok=True)
+    if expired:
+        logger.info(f"🧹 Удалено устаревших задач: {len(expired)}")
+    # Файлы .part идущих задач заблокированы их писателями (в любом процессе), удаляются только брошенные
+    stale_parts = remove_stale_parts(pipeline_pool.output_dir)
+    if stale_parts:
+        logger.info(f"🧹 Удалено брошенных файлов .part: {stale_parts}")
+    return len(expired)
+
+async def run_janitor():
+    """Фоновая очистка задач каждые janitor_interval секунд"""
+    while True:
+        try:
+            await asyncio.to_thread(cleanup_tasks)
+        except Exception as e:
+            logger.error(f"❌ Ошибка очистки задач: {e}")
+        await asyncio.sleep(janitor_interval)
+
+async def process_transcription_task(task_id: str, video_url: str, output_format: str):
+    """Обработка задачи транскрибации по URL"""
+    await run_transcription(task_id, video_url, output_format, "Скачивание видео...")
+
+def finish_url_task(video_url: str, done: asyncio.Event):
+    if url_in_flight.get(video_url) is done:
+        del url_in_flight[video_url]
+    done.set()
+
+async def lead_url_task(task_id: str, video_url: str, output_format: str, done: asyncio.Event):
+    """Задача по URL, которую ждут одновременные запросы того же URL"""
+    try:
+        await process_transcription_task(task_id, video_url, output_format)
+    finally:
+        finish_url_task(video_url, done)
+
+async def follow_url_task(task_id: str, video_url: str, output_format: str, priority: int, in_flight: asyncio.Event):
+    """Ставит задачу в очередь после завершения задачи с тем же URL; при заполненной очереди ждет места"""
+    await in_flight.wait()
+    if task_store.get(task_id) is None:
+        return
+    update_task(task_id, message="В очереди...")
+    while True:
+        try:
+            await scheduler.submit(task_id, lambda: process_transcription_task(task_id, video_url, output_format), priority)
+            return
+        except QueueFullError as e:
+            await asyncio.sleep(e.retry_after)
 
 async def process_file_transcription_task(task_id: str, video_file_path: str, output_format: str):
     """Обработка задачи транскрибации загруженного файла"""
     try:
-        logger.info(f"🚀 Начало транскрибации файла: {video_file_path}")
-        tasks[task_id]["message"] = "Инициализация пайплайна..."
-        tasks[task_id]["progress"] = 5
-        
-        # Инициализация пайплайна
-        if not transcriber.pipeline:
-            transcriber.init_pipeline(use_gpu=False)
-        
-        tasks[task_id]["message"] = "Обработка видео файла..."
-        tasks[task_id]["progress"] = 10
-        
-        # Транскрибация
-        transcript_data, output_file_path = await asyncio.to_thread(
-            transcriber.transcribe_video,
-            video_file_path,
-            output_format
-        )
-        
-        tasks[task_id]["status"] = "completed"
-        tasks[task_id]["message"] = "Транскрибация завершена!"
-        tasks[task_id]["progress"] = 100
-        tasks[task_id]["result"] = {
-            "transcript": transcript_data,
-            "output_path": str(output_file_path)
-        }
-        
-        logger.info(f"✅ Транскрибация задачи {task_id} завершена. Результат: {output_file_path}")
-        
-    except Exception as e:
-        logger.error(f"❌ Ошибка при обработке задачи {task_id}: {e}")
-        tasks[task_id]["status"] = "error"
-        tasks[task_id]["message"] = f"Ошибка при транскрибации: {e}"
-        tasks[task_id]["progress"] = 0
+        await run_transcription(task_id, video_file_path, output_format, "Обработка видео файла...")
     finally:
-        # Очистка временного файла
+        # Очистка временного файла и его каталога, если в нем больше ничего нет
         if Path(video_file_path).exists():
             os.remove(video_file_path)
             logger.info(f"🧹 Временный файл удален: {video_file_path}")
+        try:
+            os.rmdir(Path(video_file_path).parent)
+        except OSError:
+            pass
 
 @app.get("/api/status/{task_id}")
 async def get_task_status(task_id: str):
     """Получение статуса задачи"""
-    if task_id not in tasks:
+    task_status = task_store.get(task_id)
+    if task_status is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    
+    result = task_status.get("result")
+    if result and "transcript" not in result:
+        result["transcript"] = await asyncio.to_thread(task_store.load_transcript, task_id)
+    queue_info = scheduler.queue_info(task_id)
+    if queue_info:
+        task_status.update(queue_info)
+    return JSONResponse(content=task_status)
+
+def format_sse(kind: str, data: Dict[str, Any]) -> str:
+    return f"event: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/api/events/{task_id}")
+async def stream_task_events(task_id: str):
+    """Поток событий задачи (Server-Sent Events): статус и прогресс, фразы по мере распознавания, завершение"""
+    task = task_store.get(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="Задача не найдена")
     
-    return JSONResponse(content=tasks[task_id])
+    # Снимок и подписка без переключения event loop, чтобы не потерять события между ними
+    snapshot = task_snapshot(task_id, task)
+    phrases = list(live_phrases.get(task_id, []))
+    finished = snapshot["status"] in ("completed", "error")
+    subscriber: asyncio.Queue = asyncio.Queue()
+    if not finished:
+        event_subscribers.setdefault(task_id, []).append(subscriber)
+    
+    async def event_stream():
+        try:
+            yield format_sse("status", snapshot)
+            for phrase in phrases:
+                yield format_sse("phrase", phrase)
+            if finished:
+                yield format_sse("done", snapshot)
+                return
+            
+            # Задачу другого процесса uvicorn видно только через хранилище: ее состояние опрашивается
+            polling = not scheduler.owns(task_id)
+            while True:
+                refresh = polling or scheduler.queue_info(task_id) is not None
+                try:
+                    kind, data = await asyncio.wait_for(
+                        subscriber.get(), SSE_QUEUE_REFRESH if refresh else SSE_KEEPALIVE
+                    )
+                except asyncio.TimeoutError:
+                    if not refresh:
+                        yield ": keep-alive\n\n"
+                        continue
+                    # Позиция в очереди меняется без событий этой задачи
+                    current = task_snapshot(task_id)
+                    if current is None:
+                        return
+                    if current["status"] in ("completed", "error"):
+                        yield format_sse("done", current)
+                        return
+                    yield format_sse("status", current)
+                    continue
+                yield format_sse(kind, data)
+                if kind == "done":
+                    return
+        finally:
+            subscribers = event_subscribers.get(task_id, [])
+            if subscriber in subscribers:
+                subscribers.remove(subscriber)
+            if not subscribers:
+                event_subscribers.pop(task_id, None)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def parse_live_command(text: str) -> Optional[str]:
+    """Команда живой сессии из текстового сообщения {"event": ...}"""
+    try:
+        command = json.loads(text)
+    except ValueError:
+        return None
+    return command.get("event") if isinstance(command, dict) else None
+
+@app.websocket("/api/live")
+async def live_transcription(websocket: WebSocket):
+    """Живое распознавание: бинарные сообщения - PCM 8 kHz mono s16le, текст {"event": "end"} завершает сессию"""
+    global live_sessions
+    await websocket.accept()
+    
+    if live_sessions >= max_live_sessions:
+        await websocket.close(code=1013, reason="Слишком много живых сессий")
+        return
+    
+    live_sessions += 1
+    try:
+        try:
+            transcriber = await asyncio.to_thread(pipeline_pool.live_transcriber)
+            session = LiveSession(transcriber)
+        except Exception as e:
+            logger.error(f"❌ Не удалось начать живую сессию: {e}")
+            await websocket.send_json({"type": "error", "message": str(e)})
+            await websocket.close(code=1011)
+            return
+        
+        logger.info("🎙️ Живая сессия начата")
+        await websocket.send_json({"type": "ready", "sample_rate": SAMPLE_RATE, "chunk_size": session.chunk_size})
+        
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            
+            if message.get("bytes"):
+                entries = await asyncio.to_thread(session.feed, message["bytes"])
+            elif message.get("text") and parse_live_command(message["text"]) == "end":
+                entries = await asyncio.to_thread(session.finish)
+                for entry in entries:
+                    await websocket.send_json({"type": "phrase", **entry})
+                await websocket.send_json({"type": "done", "phrases": session.phrases, "duration": session.duration})
+                await websocket.close()
+                break
+            else:
+                continue
+            
+            for entry in entries:
+                await websocket.send_json({"type": "phrase", **entry})
+        
+        logger.info(f"✅ Живая сессия завершена: {session.duration:.1f} сек аудио, {session.phrases} фраз")
+    except WebSocketDisconnect:
+        logger.info("🔌 Клиент живой сессии отключился")
+    finally:
+        live_sessions -= 1
 
 @app.get("/api/download/{task_id}")
 async def download_transcript(task_id: str):
     """Скачивание результата транскрибации"""
-    if task_id not in tasks:
+    task = task_store.get(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="Задача не найдена")
     
-    task = tasks[task_id]
     if task["status"] != "completed" or not task["result"] or not task["result"]["output_path"]:
         raise HTTPException(status_code=404, detail="Файл не найден или задача не завершена")
     
@@ -932,10 +1494,317 @@ async def download_transcript(task_id: str):
         media_type="application/octet-stream"
     )
 
+@app.get("/api/cache")
+async def get_cache_stats():
+    """Статистика кэша транскрипций и кэша скачиваний"""
+    if transcript_cache is None:
+        content = {"enabled": False}
+    else:
+        lookups = cache_stats["hits"] + cache_stats["misses"]
+        content = {
+            "enabled": True,
+            **cache_stats,
+            "hit_ratio": round(cache_stats["hits"] / lookups, 3) if lookups else 0.0,
+            **(await asyncio.to_thread(transcript_cache.usage))
+        }
+    
+    content["downloads"] = await asyncio.to_thread(download_cache.usage) if download_cache else {"enabled": False}
+    return JSONResponse(content=content)
+
+@app.get("/health")
+async def health():
+    """Проверка жизни процесса: отвечает сразу после старта, в том числе во время загрузки модели"""
+    return JSONResponse(content={"status": "ok", "ready": pipeline_pool.ready})
+
+@app.get("/ready")
+async def ready():
+    """Готовность к задачам: модель загружена и прогрета во всех воркерах; иначе 503"""
+    content = {
+        "ready": pipeline_pool.ready,
+        "starting": pool_startup is not None and not pool_startup.done(),
+        "workers": pipeline_pool.workers,
+        "mode": "batching" if pipeline_pool.batching else "spawn",
+        "startup_seconds": pipeline_pool.startup_seconds,
+    }
+    return JSONResponse(content=content, status_code=200 if pipeline_pool.ready else 503)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Метрики в текстовом формате Prometheus: гистограммы этапов и задач, очередь, живые сессии, кэш"""
+    queue_stats = scheduler.stats()
+    gauges = {
+        "transcriber_jobs_running": ("Задачи в обработке", queue_stats["running"]),
+        "transcriber_jobs_queued": ("Задачи в очереди", queue_stats["queued"]),
+        "transcriber_workers": ("Воркеры пула пайплайнов", queue_stats["workers"]),
+        "transcriber_live_sessions": ("Открытые живые сессии", live_sessions),
+    }
+    counters = {
+        "transcriber_cache_hits_total": ("Попадания в кэш транскрипций", cache_stats["hits"]),
+        "transcriber_cache_misses_total": ("Промахи кэша транскрипций", cache_stats["misses"]),
+    }
+    return Response(service_metrics.render(gauges, counters), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/api/tasks")
-async def get_all_tasks():
-    """Получение всех задач"""
-    return JSONResponse(content=tasks)
+async def get_all_tasks(request: Request, status: Optional[str] = None, limit: int = TASKS_PAGE_SIZE, offset: int = 0,
+                        batch_id: Optional[str] = None):
+    """Страница задач от новых к старым без транскриптов; status - статусы через запятую, batch_id - задачи пакета"""
+    statuses = [value for value in status.split(",") if value] if status else None
+    limit = min(max(1, limit), TASKS_MAX_PAGE_SIZE)
+    offset = max(0, offset)
+    
+    counts = task_store.counts(batch_id)
+    content = {
+        "tasks": task_store.list(statuses, limit=limit, offset=offset, summary=True, batch_id=batch_id),
+        "total": sum(count for value, count in counts.items() if statuses is None or value in statuses),
+        "counts": counts,
+        "limit": limit,
+        "offset": offset,
+    }
+    body = json.dumps(content, ensure_ascii=False).encode("utf-8")
+    
+    # Клиент, у которого уже есть эта страница, получает 304 без тела
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [value.strip().removeprefix("W/") for value in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def resolve_batch_item(item) -> str:
+    """URL или путь на сервере из элемента манифеста: строка, {"url": ...} или {"path": ...}"""
+    if isinstance(item, str):
+        item = {"url": item} if item.startswith(("http://", "https://")) else {"path": item}
+    if not isinstance(item, dict):
+        raise ValueError("ожидается строка или объект с полем url или path")
+    
+    if item.get("url"):
+        url = str(item["url"])
+        if not url.startswith(("http://", "https://")):
+            raise ValueError(f"URL должен начинаться с http:// или https://: {url}")
+        return url
+    
+    if item.get("path"):
+        if batch_root is None:
+            raise ValueError("пути на сервере не разрешены: не задан TRANSCRIBER_BATCH_ROOT")
+        path = (batch_root / str(item["path"])).resolve()
+        if not path.is_relative_to(batch_root):
+            raise ValueError(f"путь вне TRANSCRIBER_BATCH_ROOT: {item['path']}")
+        if not path.is_file():
+            raise ValueError(f"файл не найден: {item['path']}")
+        return str(path)
+    
+    raise ValueError("ожидается поле url или path")
+
+def resolve_manifest(items: List[Any]) -> tuple[List[str], List[Dict[str, Any]]]:
+    """Входы всех элементов манифеста и ошибки с номерами элементов"""
+    inputs, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            inputs.append(resolve_batch_item(item))
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+    return inputs, errors
+
+def stage_message(video_input: str) -> str:
+    return "Скачивание видео..." if video_input.startswith(("http://", "https://")) else "Обработка видео файла..."
+
+async def requeue_tasks(tasks: List[Dict[str, Any]]):
+    """Ставит заново задачи, ждавшие очереди до перезапуска сервиса; при заполненной очереди ждет места
+
+    Задачи пакетов возвращаются через run_batch, чтобы большой пакет и после перезапуска
+    не занимал очередь целиком; одиночные задачи ставятся в планировщик сразу.
+    """
+    batches: Dict[str, List[Dict[str, Any]]] = {}
+    standalone = []
+    for task in tasks:
+        if task.get("batch_id"):
+            batches.setdefault(task["batch_id"], []).append(task)
+        else:
+            standalone.append(task)
+    for batch_id, items in batches.items():
+        runner = asyncio.create_task(run_batch(items, items[0]["output_format"], items[0].get("priority", 0)))
+        batch_runners.add(runner)
+        runner.add_done_callback(batch_runners.discard)
+        logger.info(f"🔁 Пакет {batch_id} продолжен после перезапуска: {len(items)} задач")
+    
+    requeued = 0
+    for task in standalone:
+        temp_file_path = task.get("temp_file_path")
+        if temp_file_path and not Path(temp_file_path).exists():
+            update_task(task["id"], status="error", message="Загруженный файл не сохранился после перезапуска сервиса")
+            continue
+        while True:
+            try:
+                await scheduler.submit(task["id"], recovered_job(task), task.get("priority", 0))
+                break
+            except QueueFullError as e:
+                await asyncio.sleep(e.retry_after)
+        requeued += 1
+    logger.info(f"🔁 Снова в очереди после перезапуска: {requeued} задач")
+
+def recovered_job(task: Dict[str, Any]):
+    """Задача планировщика для восстановленной одиночной записи: загруженный файл удаляется после обработки"""
+    if task.get("temp_file_path"):
+        return lambda: process_file_transcription_task(task["id"], task["temp_file_path"], task["output_format"])
+    return lambda: run_transcription(task["id"], task["video_input"], task["output_format"], stage_message(task["video_input"]))
+
+async def run_batch(items: List[Dict[str, Any]], output_format: str, priority: int):
+    """Подает задачи пакета в планировщик так, чтобы в очереди и в работе их было не больше, чем воркеров
+
+    Пакет из сотен записей не занимает всю очередь: одиночные запросы встают между его задачами,
+    а сам пакет не упирается в TRANSCRIBER_MAX_QUEUE.
+    """
+    slots = asyncio.Semaphore(pipeline_pool.workers)
+    
+    async def run_item(task: Dict[str, Any]):
+        try:
+            await run_transcription(task["id"], task["video_input"], output_format, stage_message(task["video_input"]))
+        finally:
+            slots.release()
+    
+    for task in items:
+        await slots.acquire()
+        while True:
+            try:
+                await scheduler.submit(task["id"], lambda task=task: run_item(task), priority)
+                break
+            except QueueFullError as e:
+                await asyncio.sleep(e.retry_after)
+
+@app.post("/api/batch")
+async def transcribe_batch(batch_data: dict):
+    """Пакетная транскрибация: манифест URL и путей на сервере, один batch_id на все задачи"""
+    items = batch_data.get("items")
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail="Манифест пакета пуст: ожидается непустой список items")
+    if len(items) > batch_max_items:
+        raise HTTPException(status_code=400, detail=f"В пакете больше {batch_max_items} записей")
+    
+    output_format = batch_data.get("output_format", "txt")
+    if output_format not in TRANSCRIPT_WRITERS:
+        raise HTTPException(status_code=400, detail=f"Неподдерживаемый формат: {output_format}")
+    priority = parse_priority(batch_data.get("priority", 0))
+    
+    inputs, errors = await asyncio.to_thread(resolve_manifest, items)
+    if errors:
+        raise HTTPException(status_code=400, detail={"message": "Ошибки в манифесте пакета", "errors": errors})
+    
+    batch_id = str(uuid.uuid4())
+    now = time.time()
+    batch_tasks = [
+        {
+            "id": str(uuid.uuid4()),
+            "video_input": video_input,
+            "output_format": output_format,
+            "status": "queued",
+            "message": "В очереди пакета...",
+            "progress": 0,
+            "result": None,
+            "start_time": now,
+            "priority": priority,
+            "batch_id": batch_id,
+            "batch_index": index
+        }
+        for index, video_input in enumerate(inputs)
+    ]
+    # Сначала задачи, потом пакет: очистка удаляет пакеты без задач
+    await asyncio.to_thread(task_store.create_many, batch_tasks)
+    task_store.create_batch({
+        "id": batch_id,
+        "created": now,
+        "output_format": output_format,
+        "priority": priority,
+        "total": len(batch_tasks)
+    })
+    
+    runner = asyncio.create_task(run_batch(batch_tasks, output_format, priority))
+    batch_runners.add(runner)
+    runner.add_done_callback(batch_runners.discard)
+    
+    logger.info(f"📦 Пакет {batch_id}: {len(batch_tasks)} задач")
+    return JSONResponse(content={"message": "Пакет поставлен в очередь", "batch_id": batch_id, "total": len(batch_tasks)})
+
+@app.get("/api/batch/{batch_id}")
+async def get_batch_status(batch_id: str):
+    """Сводный статус пакета: число задач по статусам и общий прогресс"""
+    batch = task_store.get_batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Пакет не найден")
+    
+    counts = task_store.counts(batch_id)
+    total = sum(counts.values())
+    finished = counts.get("completed", 0) + counts.get("error", 0)
+    # Незавершенный прогресс есть только у выполняемых задач, их не больше числа воркеров
+    running = task_store.list(["processing"], summary=True, batch_id=batch_id)
+    progress = (100 * finished + sum(task.get("progress", 0) for task in running)) / total if total else 100
+    
+    if finished == total:
+        status = "completed"
+    elif finished or running:
+        status = "processing"
+    else:
+        status = "queued"
+    
+    return JSONResponse(content={
+        **batch,
+        "status": status,
+        "progress": round(progress, 1),
+        "counts": counts,
+        "tasks": total
+    })
+
+def batch_tasks_in_order(batch_id: str) -> List[Dict[str, Any]]:
+    return sorted(task_store.list(summary=True, batch_id=batch_id), key=lambda task: task.get("batch_index", 0))
+
+def batch_jsonl_lines(tasks: List[Dict[str, Any]]):
+    """Строка JSONL на задачу пакета; транскрипты читаются из хранилища по одному"""
+    for task in tasks:
+        line = {
+            "index": task.get("batch_index"),
+            "task_id": task["id"],
+            "input": task["video_input"],
+            "status": task["status"],
+        }
+        if task["status"] == "completed":
+            line["phrases"] = task_store.load_transcript(task["id"]) or []
+        else:
+            line["message"] = task.get("message")
+        yield json.dumps(line, ensure_ascii=False) + "\n"
+
+def build_batch_zip(tasks: List[Dict[str, Any]]) -> str:
+    """ZIP с файлами результатов завершенных задач пакета во временном файле"""
+    fd, zip_path = tempfile.mkstemp(prefix="batch_", suffix=".zip")
+    with os.fdopen(fd, "wb") as f, zipfile.ZipFile(f, "w", zipfile.ZIP_DEFLATED) as archive:
+        for task in tasks:
+            output_path = (task.get("result") or {}).get("output_path")
+            if task["status"] == "completed" and output_path and Path(output_path).exists():
+                archive.write(output_path, f"{task.get('batch_index', 0):05d}_{Path(output_path).name}")
+    return zip_path
+
+@app.get("/api/batch/{batch_id}/download")
+async def download_batch(batch_id: str, format: str = "jsonl"):
+    """Результаты пакета одним файлом: JSONL (транскрипт каждой задачи строкой) или ZIP с файлами результатов"""
+    if task_store.get_batch(batch_id) is None:
+        raise HTTPException(status_code=404, detail="Пакет не найден")
+    if format not in ("jsonl", "zip"):
+        raise HTTPException(status_code=400, detail="Формат выгрузки пакета: jsonl или zip")
+    
+    tasks = await asyncio.to_thread(batch_tasks_in_order, batch_id)
+    filename = f"batch_{batch_id}.{format}"
+    if format == "jsonl":
+        return StreamingResponse(
+            batch_jsonl_lines(tasks),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+    
+    zip_path = await asyncio.to_thread(build_batch_zip, tasks)
+    return FileResponse(
+        path=zip_path,
+        filename=filename,
+        media_type="application/zip",
+        background=BackgroundTask(os.remove, zip_path)
+    )
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Разбиение длинной записи на отрезки по паузам и склейка их транскрипций
+"""
+
+import os
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from phrase_log import PhraseLog
+
+# Длина кадра при поиске самого тихого места, сек
+SILENCE_FRAME = 0.05
+# Граница отрезка ищется в окне +-segment_seconds * SILENCE_SEARCH_FRACTION, но не шире +-SILENCE_SEARCH_MAX сек
+SILENCE_SEARCH_FRACTION = 0.1
+SILENCE_SEARCH_MAX = 30.0
+# Фраза из перекрытия считается дублем, если пересекается с уже принятой больше чем на эту долю своей длины
+DUPLICATE_OVERLAP = 0.5
+
+
+def default_segment_seconds() -> float:
+    """Длина отрезка параллельной транскрибации: TRANSCRIBER_SEGMENT_SECONDS (по умолчанию 0 - выключено)"""
+    return float(os.environ.get("TRANSCRIBER_SEGMENT_SECONDS", "0"))
+
+
+def default_segment_overlap() -> float:
+    """Перекрытие соседних отрезков: TRANSCRIBER_SEGMENT_OVERLAP (по умолчанию 5 сек)"""
+    return float(os.environ.get("TRANSCRIBER_SEGMENT_OVERLAP", "5"))
+
+
+def find_quietest_point(samples: np.ndarray, sample_rate: int) -> float:
+    """Смещение (сек) середины кадра с наименьшей энергией"""
+    frame = int(SILENCE_FRAME * sample_rate)
+    frames = len(samples) // frame
+    if frames == 0:
+        return len(samples) / sample_rate / 2
+
+    energy = np.square(samples[:frames * frame].astype(np.float64)).reshape(frames, frame).mean(axis=1)
+    return (int(np.argmin(energy)) + 0.5) * frame / sample_rate
+
+
+def plan_segments(duration: float, segment_seconds: float, overlap: float,
+                  read_window: Callable[[float, float], np.ndarray], sample_rate: int) -> List[Dict[str, float]]:
+    """Делит запись на отрезки около segment_seconds с границами в самых тихих местах
+
+    read_window(start, length) возвращает отсчеты отрезка записи; читаются только окна поиска границ.
+    Отрезок распознается на [start, end) - с перекрытием overlap по обе стороны, а его фразы
+    берутся из [owns_from, owns_to): перекрытие дает пайплайну контекст у границы.
+    """
+    search = min(segment_seconds * SILENCE_SEARCH_FRACTION, SILENCE_SEARCH_MAX)
+    boundaries = [0.0]
+    target = segment_seconds
+    # Хвост короче половины отрезка присоединяется к последнему отрезку
+    while duration - target > segment_seconds / 2:
+        window_start = max(boundaries[-1] + search, target - search)
+        window = read_window(window_start, 2 * search)
+        boundaries.append(window_start + find_quietest_point(window, sample_rate))
+        target = boundaries[-1] + segment_seconds
+    boundaries.append(duration)
+
+    return [
+        {
+            "start": max(0.0, owns_from - overlap),
+            "end": min(duration, owns_to + overlap),
+            "owns_from": owns_from,
+            "owns_to": owns_to,
+        }
+        for owns_from, owns_to in zip(boundaries, boundaries[1:])
+    ]
+
+
+def merge_segments(segments: List[Dict[str, float]], results: List[PhraseLog]) -> PhraseLog:
+    """Склеивает фразы отрезков в общую хронологию без дублей из перекрытий
+
+    Фраза принадлежит отрезку, в границы [owns_from, owns_to) которого попадает ее середина.
+    Соседние отрезки могут по-разному разбить речь у границы на фразы, поэтому новая фраза
+    сравнивается со всеми принятыми фразами, которые еще могут с ней пересекаться: новая фраза,
+    почти целиком покрытая принятой, отбрасывается, а принятая, почти целиком покрытая новой, заменяется ею.
+    """
+    dialogue_log = PhraseLog()
+    # Принятые фразы, с которыми могут пересечься следующие фразы; остальные сразу уходят в dialogue_log
+    window: List[Dict[str, Any]] = []
+    last_index = len(segments) - 1
+    for index, (segment, entries) in enumerate(zip(segments, results)):
+        next_start = segments[index + 1]["start"] if index < last_index else float("inf")
+        for entry in entries:
+            middle = (entry["start"] + entry["end"]) / 2
+            if middle < segment["owns_from"] or (middle >= segment["owns_to"] and index < last_index):
+                continue
+
+            # Фразы отрезка идут по порядку, а фразы следующего отрезка начинаются не раньше next_start
+            while window and window[0]["end"] <= min(entry["start"], next_start):
+                dialogue_log.append(window.pop(0))
+
+            if any(_shared_seconds(entry, accepted) > DUPLICATE_OVERLAP * _length(entry) for accepted in window):
+                continue
+            window = [accepted for accepted in window
+                      if _shared_seconds(entry, accepted) <= DUPLICATE_OVERLAP * _length(accepted)]
+            window.append(entry)
+
+    for entry in window:
+        dialogue_log.append(entry)
+    return dialogue_log
+
+
+def _shared_seconds(a: Dict[str, Any], b: Dict[str, Any]) -> float:
+    return min(a["end"], b["end"]) - max(a["start"], b["start"])
+
+
+def _length(entry: Dict[str, Any]) -> float:
+    return max(entry["end"] - entry["start"], 1e-6)
+
+
+def owned_seconds(segment: Dict[str, float], ranges: List[Tuple[float, float]]) -> float:
+    """Сколько секунд из интервалов ranges (от начала файла) попадает в [owns_from, owns_to) отрезка"""
+    return sum(
+        max(0.0, min(end, segment["owns_to"]) - max(start, segment["owns_from"]))
+        for start, end in ranges
+    )
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк потребления памяти при чтении аудио для транскрибации, скорости нарезки на чанки и памяти dialogue_log,
+набор замеров пайплайна транскрибации с результатом в JSON для сравнения между коммитами
+"""
+
+import argparse
+import json
+import os
+import pickle
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import soundfile as sf
+
+SAMPLE_RATE = 8000
+CHUNK_SIZE = 2400  # Размер чанка T-one (300 мс при 8 kHz)
+
+# Синтетическая "речь" для набора замеров пайплайна: секунды звука и паузы
+SPEECH_SECONDS = 3
+PAUSE_SECONDS = 1
+
+
+def generate_synthetic_wav(path: Path, seconds: int, block_seconds: int = 60, speech_like: bool = False):
+    """Генерирует синтетический WAV (8 kHz mono PCM_16) блоками, не держа весь сигнал в памяти
+
+    С speech_like шум чередуется с тихими паузами (SPEECH_SECONDS звука, затем PAUSE_SECONDS почти тишины),
+    чтобы заглушка пайплайна выдавала фразы, как на записи разговора.
+    """
+    rng = np.random.default_rng(0)
+    with sf.SoundFile(path, 'w', samplerate=SAMPLE_RATE, channels=1, subtype='PCM_16') as f:
+        written = 0
+        while written < seconds * SAMPLE_RATE:
+            n = min(block_seconds * SAMPLE_RATE, seconds * SAMPLE_RATE - written)
+            block = rng.integers(-8000, 8000, n, dtype=np.int16)
+            if speech_like:
+                position = (np.arange(written, written + n) // SAMPLE_RATE) % (SPEECH_SECONDS + PAUSE_SECONDS)
+                pause = position >= SPEECH_SECONDS
+                block[pause] = rng.integers(-50, 50, int(pause.sum()), dtype=np.int16)
+            f.write(block)
+            written += n
+
+
+def peak_rss_mb() -> float:
+    """Пиковый RSS текущего процесса в МБ"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_full_load(audio_path: str) -> int:
+    """Старый способ: весь файл в float32 и полная копия в int32"""
+    audio_data, _ = sf.read(audio_path, dtype='float32')
+    audio_data = np.clip(audio_data, -1.0, 1.0)
+    audio_data = (audio_data * 32767).astype(np.int32)
+    return len(audio_data)
+
+
+def run_chunked(audio_path: str) -> int:
+    """Новый способ: генератор чанков фиксированного размера"""
+    from streaming_video_transcriber import StreamingVideoTranscriber
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        transcriber = StreamingVideoTranscriber(output_dir=output_dir)
+        try:
+            total = 0
+            for chunk in transcriber.read_audio_chunks(audio_path, CHUNK_SIZE):
+                total += len(chunk)
+            return total
+        finally:
+            transcriber.cleanup()
+
+
+CASES = {
+    "full_load": run_full_load,
+    "chunked": run_chunked,
+}
+
+
+def frame_by_slicing(audio_path: str) -> int:
+    """Старая нарезка: файл целиком, полные проходы clip и astype, срез на каждый чанк, последний дополняется через concatenate"""
+    audio_data, _ = sf.read(audio_path, dtype='float32')
+    audio_data = np.clip(audio_data, -1.0, 1.0)
+    audio_data = (audio_data * 32767).astype(np.int32)
+    count = 0
+    for i in range(0, len(audio_data), CHUNK_SIZE):
+        chunk = audio_data[i:i + CHUNK_SIZE]
+        if len(chunk) < CHUNK_SIZE:
+            chunk = np.concatenate([chunk, np.zeros(CHUNK_SIZE - len(chunk), dtype=np.int32)])
+        count += 1
+    return count
+
+
+def frame_with_reader(audio_path: str) -> int:
+    """Новая нарезка, как в сервисе: read_audio_chunks читает блоки soundfile и раскладывает их ChunkFramer.put"""
+    from streaming_video_transcriber import StreamingVideoTranscriber
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        transcriber = StreamingVideoTranscriber(output_dir=output_dir)
+        try:
+            count = 0
+            for _ in transcriber.read_audio_chunks(audio_path, CHUNK_SIZE):
+                count += 1
+            return count
+        finally:
+            transcriber.cleanup()
+
+
+FRAMING_CASES = {
+    "slicing": frame_by_slicing,
+    "reader": frame_with_reader,
+}
+
+
+def measure_framing(case: str, audio_path: str) -> dict:
+    """Время чтения и нарезки файла на чанки и пик выделенной при этом памяти (tracemalloc)
+
+    tracemalloc замедляет выделения, поэтому время и память замеряются в разных прогонах.
+    """
+    started = time.perf_counter()
+    chunks = FRAMING_CASES[case](audio_path)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    FRAMING_CASES[case](audio_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"case": case, "chunks": chunks, "seconds": elapsed, "peak_alloc_mb": peak / 1024 / 1024}
+
+
+def run_framing_benchmark(hours_list: list):
+    # Импорт модуля не должен попадать в замер
+    import streaming_video_transcriber
+
+    print("📊 Микробенчмарк чтения и нарезки аудио на чанки")
+    print("=" * 60)
+    with tempfile.TemporaryDirectory(prefix="transcriber_bench_") as temp_dir:
+        for hours in hours_list:
+            # Входной файл создается заранее и не входит в измерение
+            audio_path = Path(temp_dir) / f"synthetic_{hours:g}h.wav"
+            generate_synthetic_wav(audio_path, int(hours * 3600))
+            for case in FRAMING_CASES:
+                stats = measure_framing(case, str(audio_path))
+                print(f"{hours:g} ч | {case:<8} | {stats['seconds']:7.3f} сек, "
+                      f"{stats['seconds'] / stats['chunks'] * 1e6:6.2f} мкс/чанк | "
+                      f"выделено до {stats['peak_alloc_mb']:8.1f} МБ")
+            audio_path.unlink()
+    print("=" * 60)
+
+
+# Синтетические фразы для сравнения представлений dialogue_log
+PHRASE_WORDS = ["здравствуйте", "заказ", "номер", "доставка", "спасибо", "оператор", "минуту", "подскажите", "да", "конечно"]
+PHRASE_ROLES = ["Оператор", "Клиент"]
+
+
+def build_phrases(count: int) -> list:
+    """Распознанные фразы как (роль, текст): роли общие, как значения RoleDetector, тексты - отдельные строки"""
+    rng = np.random.default_rng(0)
+    return [
+        (PHRASE_ROLES[i % 2], " ".join(rng.choice(PHRASE_WORDS, size=int(rng.integers(3, 12)))))
+        for i in range(count)
+    ]
+
+
+def phrases_as_dicts(phrases: list):
+    # Время вычисляется здесь: у пайплайна каждая фраза получает свои float
+    return [{"role": role, "text": text, "start": i * 3.0, "end": i * 3.0 + 2.5} for i, (role, text) in enumerate(phrases)]
+
+
+def phrases_as_log(phrases: list):
+    from phrase_log import PhraseLog
+
+    log = PhraseLog()
+    for i, (role, text) in enumerate(phrases):
+        log.add(role, text, i * 3.0, i * 3.0 + 2.5)
+    return log
+
+
+PHRASE_CASES = {
+    "dicts": phrases_as_dicts,
+    "phrase_log": phrases_as_log,
+}
+
+
+def run_phrases_benchmark(counts: list):
+    """Память dialogue_log из словарей и PhraseLog (без строк текста, общих для обоих) и размер pickle между процессами"""
+    import phrase_log
+
+    print("📊 Память dialogue_log: список словарей и PhraseLog")
+    print("=" * 60)
+    for count in counts:
+        phrases = build_phrases(count)
+        for case, build in PHRASE_CASES.items():
+            tracemalloc.start()
+            container = build(phrases)
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            pickled = len(pickle.dumps(container, protocol=pickle.HIGHEST_PROTOCOL))
+            print(f"{count:>7} фраз | {case:<10} | в памяти {current / 1024 / 1024:7.2f} МБ "
+                  f"({current / count:5.0f} байт/фразу) | pickle {pickled / 1024 / 1024:6.2f} МБ")
+            del container
+    print("=" * 60)
+
+
+# Длительности входов набора замеров пайплайна (--suite)
+SUITE_LENGTHS = {"1m": 60, "1h": 3600, "5h": 5 * 3600}
+# Замер, отличающийся меньше чем на эту величину (сек), не считается регрессией: это шум измерения
+SUITE_MIN_SECONDS = 0.05
+# Заглушка пайплайна считает чанк звуком, если его пик выше этого уровня
+STUB_SILENCE_LEVEL = 1000
+
+StubPhrase = namedtuple("StubPhrase", "text start_time end_time")
+
+
+class StubPipeline:
+    """Заглушка StreamingCTCPipeline для замеров без модели и сети: фраза на каждый участок звука между паузами
+
+    Стоимость forward почти нулевая, поэтому замер со заглушкой показывает накладные расходы сервиса
+    вокруг модели: декодирование, нарезку, определение ролей и запись результата.
+    """
+
+    CHUNK_SIZE = CHUNK_SIZE
+
+    def forward(self, chunk: np.ndarray, state, is_last: bool = False):
+        seen, start = state or (0, None)
+        loud = int(np.abs(chunk).max()) > STUB_SILENCE_LEVEL
+        phrases = []
+        if loud and start is None:
+            start = seen
+        if start is not None and (not loud or is_last):
+            end = seen + len(chunk) if loud else seen
+            words = [PHRASE_WORDS[(start // CHUNK_SIZE + i) % len(PHRASE_WORDS)] for i in range(5)]
+            phrases.append(StubPhrase(" ".join(words), start / SAMPLE_RATE, end / SAMPLE_RATE))
+            start = None
+        return phrases, (seen + len(chunk), start)
+
+
+def run_suite_child(audio_path: str, real: bool, use_ffmpeg: bool):
+    """Один вход набора в отдельном процессе: время этапов задачи, сериализация результата и пиковый RSS"""
+    baseline = peak_rss_mb()
+    from streaming_video_transcriber import StreamingVideoTranscriber
+    from metrics import finish_job_stats
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        transcriber = StreamingVideoTranscriber(output_dir=output_dir)
+        try:
+            started = time.perf_counter()
+            if real:
+                if not transcriber.init_pipeline():
+                    raise SystemExit("Не удалось инициализировать пайплайн T-one")
+            else:
+                from tone.demo.enhanced_website import RoleDetector
+                transcriber.pipeline = StubPipeline()
+                transcriber.role_detector = RoleDetector()
+            load_seconds = time.perf_counter() - started
+
+            stats = {}
+            started = time.perf_counter()
+            if use_ffmpeg:
+                dialogue_log, _ = transcriber.transcribe_video_stream(audio_path, "json", stats)
+            else:
+                dialogue_log, _ = transcriber.transcribe_audio_file(audio_path, "json", stats)
+            processing_seconds = time.perf_counter() - started
+            # finish_job_stats округляет до миллисекунд, на коротком входе этапы нужны точнее
+            stages = {stage: round(seconds, 6) for stage, seconds in stats.get("stages", {}).items()}
+            finish_job_stats(stats, processing_seconds)
+
+            # Так результат отдается в /api/status
+            started = time.perf_counter()
+            json.dumps(dialogue_log.to_list(), ensure_ascii=False)
+            serialize_seconds = time.perf_counter() - started
+        finally:
+            transcriber.cleanup()
+
+    print(json.dumps({
+        "audio_seconds": stats["audio_seconds"],
+        "phrases": len(dialogue_log),
+        "load_seconds": round(load_seconds, 3),
+        "processing_seconds": round(processing_seconds, 6),
+        "real_time_factor": stats["real_time_factor"],
+        "stages": stages,
+        "serialize_seconds": round(serialize_seconds, 6),
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }))
+
+
+def measure_suite(audio_path: Path, real: bool, use_ffmpeg: bool) -> dict:
+    command = [sys.executable, __file__, "--suite-child", str(audio_path)]
+    command += ["--real"] if real else []
+    command += ["--ffmpeg"] if use_ffmpeg else []
+    # Кэш транскрипций и пропуск тишины исказили бы замер
+    env = {**os.environ, "TRANSCRIPT_CACHE": "0", "TRANSCRIBER_VAD": "0"}
+    result = subprocess.run(command, capture_output=True, text=True, check=True, env=env)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def stage_throughput(result: dict) -> dict:
+    """Секунды аудио на секунду каждого этапа (чем больше, тем быстрее)"""
+    seconds = dict(result["stages"], serialize=result["serialize_seconds"])
+    return {stage: round(result["audio_seconds"] / value, 1) if value else None for stage, value in seconds.items()}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare_suite(report: dict, baseline: dict, max_regression: float) -> list:
+    """Регрессии относительно прошлого отчета: время или пиковый RSS выросли больше чем на max_regression"""
+    regressions = []
+    previous = {result["length"]: result for result in baseline.get("results", [])}
+    for result in report["results"]:
+        old = previous.get(result["length"])
+        if old is None:
+            continue
+        values = [("processing_seconds", result["processing_seconds"], old["processing_seconds"]),
+                  ("serialize_seconds", result["serialize_seconds"], old["serialize_seconds"]),
+                  ("peak_rss_mb", result["peak_rss_mb"], old["peak_rss_mb"])]
+        values += [(f"stages.{stage}", seconds, old["stages"].get(stage)) for stage, seconds in result["stages"].items()]
+        for name, new_value, old_value in values:
+            if old_value is None or (name != "peak_rss_mb" and new_value - old_value < SUITE_MIN_SECONDS):
+                continue
+            if new_value > old_value * (1 + max_regression):
+                regressions.append(f"{result['length']} {name}: {old_value:g} -> {new_value:g}")
+    return regressions
+
+
+def run_suite(lengths: list, real: bool, use_ffmpeg: bool, output: Path, compare: Optional[Path] = None,
+              max_regression: float = 0.2) -> int:
+    """Набор замеров пайплайна на синтетических входах; отчет в JSON, с compare - проверка регрессий"""
+    pipeline = "t-one" if real else "stub"
+    print(f"📊 Набор замеров пайплайна ({pipeline}, декодирование {'ffmpeg' if use_ffmpeg else 'soundfile'})")
+    print("=" * 60)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="transcriber_bench_") as temp_dir:
+        # Чтение и нарезка не зависят от длины входа: замер на 10 минутах аудио
+        audio_path = Path(temp_dir) / "synthetic_framing.wav"
+        generate_synthetic_wav(audio_path, 600)
+        framing = measure_framing("reader", str(audio_path))
+        framing["throughput"] = round(600 / framing["seconds"], 1)
+        audio_path.unlink()
+        print(f"нарезка   | {framing['throughput']:10.1f} сек аудио/сек")
+
+        for length in lengths:
+            audio_path = Path(temp_dir) / f"synthetic_{length}.wav"
+            generate_synthetic_wav(audio_path, SUITE_LENGTHS[length], speech_like=True)
+            result = {"length": length, **measure_suite(audio_path, real, use_ffmpeg)}
+            result["throughput"] = stage_throughput(result)
+            results.append(result)
+            audio_path.unlink()
+
+            stages = ", ".join(f"{stage} {speed:.0f}x" for stage, speed in result["throughput"].items() if speed)
+            print(f"{length:<9} | {result['phrases']} фраз за {result['processing_seconds']:.3f} сек, "
+                  f"RTF {result['real_time_factor']}, пиковый RSS {result['peak_rss_mb']:.1f} МБ")
+            print(f"          | {stages}")
+    print("=" * 60)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "pipeline": pipeline,
+        "decoder": "ffmpeg" if use_ffmpeg else "soundfile",
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "framing": framing,
+        "results": results,
+    }
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"💾 Отчет: {output}")
+
+    if compare is None:
+        return 0
+    regressions = compare_suite(report, json.loads(compare.read_text(encoding="utf-8")), max_regression)
+    for regression in regressions:
+        print(f"❌ Регрессия: {regression}")
+    if not regressions:
+        print(f"✅ Регрессий относительно {compare} нет")
+    return 1 if regressions else 0
+
+
+def run_child(case: str, audio_path: str):
+    """Запуск одного сценария в отдельном процессе, чтобы пиковый RSS не смешивался"""
+    baseline = peak_rss_mb()
+    samples = CASES[case](audio_path)
+    print(json.dumps({"case": case, "samples": samples, "baseline_rss_mb": baseline, "peak_rss_mb": peak_rss_mb()}))
+
+
+def measure(case: str, audio_path: Path) -> dict:
+    result = subprocess.run(
+        [sys.executable, __file__, "--child", case, str(audio_path)],
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк пикового RSS при чтении аудио и набор замеров пайплайна")
+    parser.add_argument("--hours", type=float, nargs="+", default=[1, 5], help="Длительность синтетических входов в часах")
+    parser.add_argument("--framing", action="store_true", help="Микробенчмарк чтения и нарезки на чанки вместо замера RSS")
+    parser.add_argument("--phrases", type=int, nargs="*", metavar="COUNT",
+                        help="Сравнение памяти dialogue_log для заданного числа фраз (по умолчанию 10000 и 100000)")
+    parser.add_argument("--suite", nargs="*", choices=list(SUITE_LENGTHS), metavar="LENGTH",
+                        help="Набор замеров пайплайна на входах 1m, 1h, 5h (по умолчанию все) с отчетом в JSON")
+    parser.add_argument("--real", action="store_true", help="Настоящий StreamingCTCPipeline вместо заглушки (нужна модель)")
+    parser.add_argument("--ffmpeg", action="store_true", help="Декодировать входы через ffmpeg, как загруженные видео")
+    parser.add_argument("--output", type=Path, default=Path("benchmark_results.json"), help="Файл отчета набора замеров")
+    parser.add_argument("--compare", type=Path, help="Прошлый отчет: код возврата 1 при регрессии")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Допустимый рост времени и памяти относительно --compare (по умолчанию 0.2 - 20%%)")
+    parser.add_argument("--child", nargs=2, metavar=("CASE", "AUDIO_PATH"), help=argparse.SUPPRESS)
+    parser.add_argument("--suite-child", metavar="AUDIO_PATH", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+
+    if args.suite_child:
+        run_suite_child(args.suite_child, args.real, args.ffmpeg)
+        return
+
+    if args.suite is not None:
+        return run_suite(args.suite or list(SUITE_LENGTHS), args.real, args.ffmpeg, args.output,
+                         args.compare, args.max_regression)
+
+    if args.framing:
+        run_framing_benchmark(args.hours)
+        return
+
+    if args.phrases is not None:
+        run_phrases_benchmark(args.phrases or [10000, 100000])
+        return
+
+    print("📊 Бенчмарк пикового RSS при чтении аудио")
+    print("=" * 60)
+    with tempfile.TemporaryDirectory(prefix="transcriber_bench_") as temp_dir:
+        for hours in args.hours:
+            audio_path = Path(temp_dir) / f"synthetic_{hours:g}h.wav"
+            generate_synthetic_wav(audio_path, int(hours * 3600))
+
+            for case in CASES:
+                stats = measure(case, audio_path)
+                print(f"{hours:g} ч | {case:<10} | пиковый RSS: {stats['peak_rss_mb']:8.1f} МБ "
+                      f"(базовый {stats['baseline_rss_mb']:.1f} МБ)")
+
+            audio_path.unlink()
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Микро-батчинг чанков из нескольких одновременных потоков транскрибации
+"""
+
+import copy
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def default_max_wait() -> float:
+    """Максимальное ожидание добора батча: TRANSCRIBER_BATCH_WAIT_MS (по умолчанию 10 мс)"""
+    return float(os.environ.get("TRANSCRIBER_BATCH_WAIT_MS", "10")) / 1000
+
+
+# Типы входов ONNX-сессии и соответствующие dtype numpy
+ONNX_DTYPES = {
+    "tensor(int16)": np.int16,
+    "tensor(int32)": np.int32,
+    "tensor(int64)": np.int64,
+    "tensor(float16)": np.float16,
+    "tensor(float)": np.float32,
+}
+# Допустимое расхождение logprobs батчевого и одиночного прохода при самопроверке
+SELF_CHECK_TOLERANCE = 1e-3
+# Сколько чанков подряд проходит каждый из потоков самопроверки (переносы состояния между чанками)
+SELF_CHECK_CHUNKS = 4
+
+
+def model_session(model) -> Optional[Tuple[str, Any]]:
+    """Имя атрибута и ONNX-сессия модели пайплайна (pipeline.model) или None"""
+    attributes = getattr(model, "__dict__", {})
+    return next(
+        ((name, value) for name, value in attributes.items() if hasattr(value, "run") and hasattr(value, "get_inputs")),
+        None
+    )
+
+
+class BatchedState:
+    """Состояние потока при батчевом проходе: состояние модели (строка батча) и остальное состояние пайплайна"""
+
+    __slots__ = ("model_state", "pipeline_state")
+
+    def __init__(self, model_state: np.ndarray, pipeline_state: Any):
+        self.model_state = model_state
+        self.pipeline_state = pipeline_state
+
+
+class _ReplayModel:
+    """Подменяет pipeline.model при разборе батча: возвращает уже посчитанный результат строки батча"""
+
+    def __init__(self):
+        self.result: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        # Во время самопроверки - список выданных результатов
+        self.returned: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None
+
+    def forward(self, audio_chunk: np.ndarray, state: Any = None):
+        if self.returned is not None:
+            self.returned.append(self.result)
+        return self.result
+
+
+class _RecordingModel:
+    """Обертка pipeline.model для самопроверки: запоминает результаты одиночных вызовов модели"""
+
+    def __init__(self, model):
+        self._model = model
+        self.results: List[Tuple[np.ndarray, np.ndarray]] = []
+
+    def forward(self, audio_chunk: np.ndarray, state: Any = None):
+        result = self._model.forward(audio_chunk, state)
+        self.results.append(result)
+        return result
+
+
+def _same_arrays(expected: Any, actual: Any) -> bool:
+    return np.shape(expected) == np.shape(actual) and np.allclose(expected, actual, atol=SELF_CHECK_TOLERANCE)
+
+
+def _same_phrases(expected: List[Any], actual: List[Any]) -> bool:
+    return len(expected) == len(actual) and all(
+        a.text == b.text and abs(a.start_time - b.start_time) < SELF_CHECK_TOLERANCE
+        and abs(a.end_time - b.end_time) < SELF_CHECK_TOLERANCE
+        for a, b in zip(expected, actual)
+    )
+
+
+class BatchedPipeline:
+    """Батчевый проход StreamingCTCPipeline: одна ONNX-сессия модели на чанки всех потоков батча
+
+    pipeline.forward в T-one прогоняет чанк через акустическую модель (pipeline.model - ONNX-граф
+    с состоянием и динамической размерностью батча), а затем разбивает logprobs на фразы и декодирует их.
+    Здесь модель вызывается один раз на батч со сложенными чанками и состояниями, а разбивка
+    и декодирование выполняются прежним pipeline.forward каждого потока, которому модель
+    подменена результатом его строки батча.
+    """
+
+    def __init__(self, pipeline, session, signal_input, state_input):
+        self.pipeline = pipeline
+        self._session = session
+        self._signal_name = signal_input.name
+        self._signal_rank = len(signal_input.shape)
+        self._signal_dtype = ONNX_DTYPES[signal_input.type]
+        self._state_name = state_input.name
+        self._state_shape = tuple(state_input.shape[1:])
+        self._state_dtype = ONNX_DTYPES[state_input.type]
+        # Копия пайплайна, у которой модель отдает заранее посчитанные строки батча
+        self._replay_model = _ReplayModel()
+        self._replay = copy.copy(pipeline)
+        self._replay.model = self._replay_model
+
+    @classmethod
+    def from_pipeline(cls, pipeline) -> Optional["BatchedPipeline"]:
+        """Адаптер для пайплайна или None, если модель пайплайна нельзя выполнить батчем
+
+        Адаптер возвращается, только если forward_batch на пробных чанках совпал с pipeline.forward.
+        """
+        found = model_session(getattr(pipeline, "model", None))
+        if found is None:
+            logger.warning("⚠️ У пайплайна нет ONNX-сессии модели (pipeline.model), батчевый проход невозможен")
+            return None
+        _, session = found
+
+        inputs = session.get_inputs()
+        state_input = next((item for item in inputs if "float" in item.type), None)
+        signal_input = next((item for item in inputs if item is not state_input), None)
+        if (len(inputs) != 2 or state_input is None or signal_input.type not in ONNX_DTYPES
+                or state_input.type not in ONNX_DTYPES
+                or not all(isinstance(size, int) for size in state_input.shape[1:])):
+            logger.warning(f"⚠️ Неизвестные входы модели {[(item.name, item.type, item.shape) for item in inputs]}, "
+                           "батчевый проход невозможен")
+            return None
+
+        batched = cls(pipeline, session, signal_input, state_input)
+        try:
+            matches = batched._self_check()
+        except Exception as e:
+            logger.warning(f"⚠️ Батчевый проход модели не удался: {e}")
+            return None
+        if not matches:
+            logger.warning("⚠️ Батчевый проход модели расходится с pipeline.forward, батчинг отключен")
+            return None
+        return batched
+
+    def _self_check(self) -> bool:
+        """Прогоняет два потока по несколько чанков через forward_batch и через pipeline.forward
+
+        Совпасть должны фразы и результаты модели на каждом шаге, включая форму следующего состояния,
+        а копия пайплайна должна обращаться к модели ровно раз на чанк: иначе подмена модели
+        результатом строки батча не соответствует тому, как pipeline.forward ее использует.
+        """
+        rng = np.random.default_rng(0)
+        steps = rng.integers(-8000, 8000, (SELF_CHECK_CHUNKS, 2, self.pipeline.CHUNK_SIZE)).astype(np.int32)
+
+        reference = copy.copy(self.pipeline)
+        recorder = reference.model = _RecordingModel(self.pipeline.model)
+        expected = []
+        for stream in range(steps.shape[1]):
+            state = None
+            for step, chunks in enumerate(steps):
+                recorder.results.clear()
+                phrases, state = reference.forward(chunks[stream], state, is_last=step == len(steps) - 1)
+                if len(recorder.results) != 1:
+                    return False
+                expected.append((stream, step, phrases, recorder.results[0]))
+
+        states: List[Any] = [None] * steps.shape[1]
+        actual = {}
+        for step, chunks in enumerate(steps):
+            self._replay_model.returned = []
+            try:
+                results = self.forward_batch(chunks, states, [step == len(steps) - 1] * len(states))
+                returned = self._replay_model.returned
+            finally:
+                self._replay_model.returned = None
+            if len(returned) != len(states):
+                return False
+            for stream, ((phrases, state), model_result) in enumerate(zip(results, returned)):
+                states[stream] = state
+                actual[stream, step] = (phrases, model_result)
+
+        for stream, step, phrases, (logprobs, next_state) in expected:
+            batched_phrases, (batched_logprobs, batched_state) = actual[stream, step]
+            if (not _same_phrases(phrases, batched_phrases) or not _same_arrays(logprobs, batched_logprobs)
+                    or not _same_arrays(next_state, batched_state)):
+                return False
+        return True
+
+    def _run_model(self, chunks: np.ndarray, model_states: List[Optional[np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Один вызов сессии на батч; None в model_states - начальное (нулевое) состояние"""
+        signal = chunks.astype(self._signal_dtype, copy=False)
+        if self._signal_rank == 3:
+            signal = signal[:, :, None]
+        states = np.stack([
+            np.zeros(self._state_shape, dtype=self._state_dtype) if state is None else state
+            for state in model_states
+        ])
+        logprobs, next_states = self._session.run(None, {self._signal_name: signal, self._state_name: states})
+        return logprobs, next_states
+
+    def forward_batch(self, chunks: np.ndarray, states: List[Any], is_last: List[bool]) -> List[Tuple[List[Any], Any]]:
+        """Результаты pipeline.forward для каждого потока батча: (фразы, BatchedState)"""
+        logprobs, next_states = self._run_model(
+            chunks, [state.model_state if state is not None else None for state in states]
+        )
+        results = []
+        for index, (chunk, state, last) in enumerate(zip(chunks, states, is_last)):
+            self._replay_model.result = (logprobs[index], next_states[index:index + 1])
+            phrases, pipeline_state = self._replay.forward(
+                chunk, state.pipeline_state if state is not None else None, is_last=last
+            )
+            results.append((phrases, BatchedState(next_states[index], pipeline_state)))
+        return results
+
+
+class _ChunkRequest:
+    __slots__ = ("chunk", "state", "is_last", "future")
+
+    def __init__(self, chunk: np.ndarray, state: Any, is_last: bool):
+        self.chunk = chunk
+        self.state = state
+        self.is_last = is_last
+        self.future: Future = Future()
+
+
+class ChunkBatcher:
+    """Собирает очередной чанк от каждого активного потока и выполняет их одним проходом модели
+
+    Каждый поток хранит свое состояние state и вызывает forward() как обычный pipeline.forward.
+    Батч отправляется, когда чанк прислали все активные потоки, набран max_batch_size
+    или истек max_wait с момента прихода первого чанка.
+
+    batched - объект с методом forward_batch(chunks, states, is_last) -> [(phrases, state), ...],
+    где chunks - массив (B, CHUNK_SIZE): BatchedPipeline или пайплайн с собственным forward_batch.
+    """
+
+    def __init__(self, batched, max_batch_size: int = 8, max_wait: Optional[float] = None):
+        self.max_batch_size = max_batch_size
+        self.max_wait = default_max_wait() if max_wait is None else max_wait
+        self._forward_batch = batched.forward_batch
+        self._requests: "queue.Queue[Optional[_ChunkRequest]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._active_streams = 0
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._batched_chunks = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="chunk-batcher", daemon=True)
+        self._thread.start()
+        logger.info(f"📦 Батчер чанков запущен: до {self.max_batch_size} чанков, ожидание {self.max_wait * 1000:.0f} мс")
+
+    def stop(self):
+        if self._thread is not None:
+            self._requests.put(None)
+            self._thread.join()
+            self._thread = None
+
+    @contextmanager
+    def stream(self):
+        """Регистрирует поток транскрибации, чтобы батч не ждал дедлайна, когда все потоки уже прислали чанк"""
+        with self._lock:
+            self._active_streams += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._active_streams -= 1
+
+    def forward(self, chunk: np.ndarray, state: Any = None, is_last: bool = False) -> Tuple[List[Any], Any]:
+        """Аналог pipeline.forward: блокирует вызывающий поток до обработки батча с этим чанком"""
+        request = _ChunkRequest(chunk, state, is_last)
+        self._requests.put(request)
+        return request.future.result()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self._batches,
+            "avg_batch_size": round(self._batched_chunks / self._batches, 2) if self._batches else 0.0,
+        }
+
+    def _loop(self):
+        while True:
+            first = self._requests.get()
+            if first is None:
+                return
+
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            stopping = False
+            while len(batch) < self.max_batch_size and len(batch) < self._active_streams:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+
+            self._run_batch(batch)
+            if stopping:
+                return
+
+    def _run_batch(self, batch: List[_ChunkRequest]):
+        self._batches += 1
+        self._batched_chunks += len(batch)
+
+        try:
+            results = self._forward_batch(
+                np.stack([request.chunk for request in batch]),
+                [request.state for request in batch],
+                [request.is_last for request in batch]
+            )
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        for request, result in zip(batch, results):
+            request.future.set_result(result)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Кэш скачанного по URL аудио с объединением одновременных скачиваний
+"""
+
+import fcntl
+import logging
+import os
+import re
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+
+def _is_same_file(file, path: Path) -> bool:
+    """Открытый файл все еще лежит по пути path (его не удалили и не заменили)"""
+    try:
+        return os.path.samestat(os.fstat(file.fileno()), os.stat(path))
+    except FileNotFoundError:
+        return False
+
+
+class DownloadCache:
+    """Дисковый кэш аудио, скачанного по URL, с ключом extractor_key-id из yt-dlp
+
+    Запись - каталог с одним аудиофайлом (имя файла сохраняется, чтобы не терять название видео).
+    Блокировки на файлах работают между процессами пула: запросы одного URL во время скачивания
+    ждут его завершения и получают тот же файл, а вытеснение не трогает используемые записи.
+    URL, которые транскрибируются прогрессивно (ffmpeg читает медиапоток напрямую), через кэш не проходят.
+    """
+
+    def __init__(self, cache_dir: str, ttl: float, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_env(cls) -> Optional["DownloadCache"]:
+        """Кэш по настройкам окружения; None, если DOWNLOAD_CACHE=0"""
+        if os.environ.get("DOWNLOAD_CACHE", "1").lower() in ("0", "false", "no"):
+            return None
+        return cls(
+            cache_dir=os.environ.get("DOWNLOAD_CACHE_DIR", "cache/downloads"),
+            ttl=float(os.environ.get("DOWNLOAD_CACHE_TTL", "3600")),
+            max_bytes=int(os.environ.get("DOWNLOAD_CACHE_MAX_MB", "2048")) * 1024 * 1024
+        )
+
+    @staticmethod
+    def make_key(info_dict: Dict[str, Any]) -> str:
+        """Ключ записи по метаданным yt-dlp"""
+        key = f"{info_dict['extractor_key']}-{info_dict['id']}"
+        return re.sub(r"[^A-Za-z0-9_.-]", "_", key)
+
+    def _entry_file(self, key: str) -> Optional[Path]:
+        """Файл действующей (не просроченной) записи"""
+        entry_dir = self.cache_dir / key
+        try:
+            if time.time() - entry_dir.stat().st_mtime > self.ttl:
+                return None
+        except FileNotFoundError:
+            return None
+        files = [path for path in entry_dir.iterdir() if path.is_file()]
+        return files[0] if files else None
+
+    def contains(self, key: str) -> bool:
+        """Есть ли действующая запись для ключа"""
+        return self._entry_file(key) is not None
+
+    def _open_lock(self, key: str, operation: int):
+        """Открывает и блокирует файл блокировки записи; None, если неблокирующая блокировка занята
+
+        Файл блокировки удаляется вместе с записью, поэтому после блокировки проверяется,
+        что он все еще лежит по своему пути, иначе блокировка берется заново.
+        """
+        path = self.cache_dir / f"{key}.lock"
+        while True:
+            lock = open(path, "a")
+            try:
+                fcntl.flock(lock, operation)
+            except BlockingIOError:
+                lock.close()
+                return None
+            if _is_same_file(lock, path):
+                return lock
+            lock.close()
+
+    @contextmanager
+    def entry(self, key: str, download: Callable[[Path], Optional[str]]) -> Iterator[Optional[str]]:
+        """Отдает путь к аудио для ключа, скачивая его не более одного раза на все процессы
+
+        download(target_dir) скачивает аудио в target_dir и возвращает путь к файлу или None.
+        Путь действителен до выхода из блока with.
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        while True:
+            # Эксклюзивная блокировка на время проверки и скачивания: остальные запросы этого URL ждут здесь
+            lock = self._open_lock(key, fcntl.LOCK_EX)
+            try:
+                audio_path = self._entry_file(key)
+                if audio_path is not None:
+                    logger.info(f"⚡ Аудио найдено в кэше скачиваний: {audio_path}")
+                else:
+                    audio_path = self._download(key, download)
+                # Разделяемая блокировка до конца использования защищает запись от вытеснения.
+                # Смена блокировки не атомарна: в этот момент запись может вытеснить другой процесс,
+                # тогда все начинается заново
+                fcntl.flock(lock, fcntl.LOCK_SH)
+            except BaseException:
+                lock.close()
+                raise
+            if audio_path is None or (audio_path.exists() and _is_same_file(lock, self.cache_dir / f"{key}.lock")):
+                break
+            lock.close()
+
+        with lock:
+            yield str(audio_path) if audio_path is not None else None
+
+        self.evict()
+
+    def _download(self, key: str, download: Callable[[Path], Optional[str]]) -> Optional[Path]:
+        entry_dir = self.cache_dir / key
+        partial_dir = self.cache_dir / f"{key}.part"
+        shutil.rmtree(partial_dir, ignore_errors=True)
+        partial_dir.mkdir()
+
+        try:
+            downloaded = download(partial_dir)
+            if downloaded is None:
+                return None
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(partial_dir, entry_dir)
+            return entry_dir / Path(downloaded).name
+        finally:
+            shutil.rmtree(partial_dir, ignore_errors=True)
+
+    def evict(self):
+        """Удаляет просроченные записи и самые старые записи сверх max_bytes, кроме используемых"""
+        if not self.cache_dir.exists():
+            return
+
+        entries = []
+        for entry_dir in self.cache_dir.iterdir():
+            if not entry_dir.is_dir() or entry_dir.suffix == ".part":
+                continue
+            try:
+                size = sum(path.stat().st_size for path in entry_dir.iterdir())
+                entries.append((entry_dir, entry_dir.stat().st_mtime, size))
+            except FileNotFoundError:
+                continue
+
+        total = sum(size for _, _, size in entries)
+        now = time.time()
+        for entry_dir, mtime, size in sorted(entries, key=lambda entry: entry[1]):
+            if now - mtime <= self.ttl and total <= self.max_bytes:
+                continue
+            if self._remove_if_unused(entry_dir):
+                total -= size
+
+        self._remove_orphan_locks()
+
+    def _remove_if_unused(self, entry_dir: Path) -> bool:
+        lock = self._open_lock(entry_dir.name, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if lock is None:
+            return False
+        with lock:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            (self.cache_dir / f"{entry_dir.name}.lock").unlink(missing_ok=True)
+            logger.info(f"🧹 Запись кэша скачиваний удалена: {entry_dir.name}")
+            return True
+
+    def _remove_orphan_locks(self):
+        """Удаляет файлы блокировок без записей (после неудачных скачиваний и упавших процессов)"""
+        for path in self.cache_dir.glob("*.lock"):
+            if (self.cache_dir / path.stem).exists():
+                continue
+            lock = self._open_lock(path.stem, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            if lock is None:
+                continue
+            with lock:
+                if not (self.cache_dir / path.stem).exists():
+                    path.unlink(missing_ok=True)
+
+    def usage(self) -> Dict[str, Any]:
+        """Число записей и занимаемый объем"""
+        entries: List[Path] = [
+            path for path in self.cache_dir.glob("*")
+            if path.is_dir() and path.suffix != ".part"
+        ] if self.cache_dir.exists() else []
+        size = sum(path.stat().st_size for entry in entries for path in entry.iterdir() if path.is_file())
+        return {"entries": len(entries), "size_bytes": size, "max_bytes": self.max_bytes, "ttl": self.ttl}
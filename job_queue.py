@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Очередь задач транскрибации с ограниченной параллельностью и контролем допуска
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import os
+import time
+from typing import Optional, Dict, Any, List, Callable, Awaitable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Начальная оценка длительности задачи, пока нет ни одной завершенной
+DEFAULT_JOB_DURATION = 60.0
+# Вес последней задачи в скользящей средней длительности
+DURATION_SMOOTHING = 0.2
+
+
+class QueueFullError(Exception):
+    """Очередь заполнена, задача не принята"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Очередь задач заполнена")
+        self.retry_after = retry_after
+
+
+def default_max_queue_size() -> int:
+    """Максимальная длина очереди: TRANSCRIBER_MAX_QUEUE (по умолчанию 100)"""
+    return max(1, int(os.environ.get("TRANSCRIBER_MAX_QUEUE", "100")))
+
+
+class JobScheduler:
+    """Планировщик задач: приоритетная FIFO-очередь и фиксированное число исполнителей
+
+    Задачи с меньшим значением priority выполняются раньше, при равном приоритете - в порядке поступления.
+    Выполняющаяся задача может занять свободных исполнителей под свои части (отрезки длинного файла)
+    через try_borrow(), но только пока очередь пуста: занятые так исполнители не берут новых задач,
+    пока части не вернут их release_borrowed().
+    """
+
+    def __init__(self, workers: int, max_queue_size: Optional[int] = None):
+        self.workers = workers
+        self.max_queue_size = max_queue_size or default_max_queue_size()
+        self._pending: List[Tuple[int, int, str]] = []
+        self._jobs: Dict[str, Callable[[], Awaitable[Any]]] = {}
+        self._running: Dict[str, float] = {}
+        self._borrowed = 0
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Condition] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._avg_duration: Optional[float] = None
+
+    def start(self):
+        """Запускает исполнителей в текущем event loop"""
+        if self._worker_tasks:
+            return
+        self._wakeup = asyncio.Condition()
+        self._worker_tasks = [asyncio.create_task(self._worker_loop(i)) for i in range(self.workers)]
+        logger.info(f"🚦 Планировщик задач запущен: {self.workers} исполнителей, очередь до {self.max_queue_size}")
+
+    async def shutdown(self):
+        """Останавливает исполнителей, задачи в очереди отбрасываются"""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def is_full(self) -> bool:
+        return len(self._pending) >= self.max_queue_size
+
+    def retry_after(self) -> int:
+        """Через сколько секунд вероятно освободится место в очереди"""
+        return max(1, math.ceil(self.job_duration() / self.workers))
+
+    def job_duration(self) -> float:
+        """Скользящая средняя длительность задачи"""
+        return self._avg_duration if self._avg_duration is not None else DEFAULT_JOB_DURATION
+
+    async def submit(self, job_id: str, job: Callable[[], Awaitable[Any]], priority: int = 0):
+        """Ставит задачу в очередь или отклоняет ее с QueueFullError; до start задачи ждут запуска исполнителей"""
+        if self.is_full():
+            raise QueueFullError(self.retry_after())
+
+        heapq.heappush(self._pending, (priority, next(self._counter), job_id))
+        self._jobs[job_id] = job
+        if self._wakeup is not None:
+            async with self._wakeup:
+                self._wakeup.notify()
+
+    def try_borrow(self) -> bool:
+        """Занимает свободного исполнителя для части выполняющейся задачи; False, если свободных нет или очередь не пуста"""
+        if self._pending or len(self._running) + self._borrowed >= self.workers:
+            return False
+        self._borrowed += 1
+        return True
+
+    async def release_borrowed(self):
+        """Возвращает исполнителя, занятого try_borrow()"""
+        self._borrowed -= 1
+        if self._wakeup is not None:
+            async with self._wakeup:
+                self._wakeup.notify()
+
+    def _has_free_worker(self) -> bool:
+        return len(self._running) + self._borrowed < self.workers
+
+    def owns(self, job_id: str) -> bool:
+        """Задача в очереди или выполняется в этом процессе"""
+        return job_id in self._jobs or job_id in self._running
+
+    def queue_info(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Позиция задачи в очереди (с 1) и оценка ожидания в секундах; None, если задача не в очереди"""
+        entry = next((item for item in self._pending if item[2] == job_id), None)
+        if entry is None:
+            return None
+
+        ahead = sum(1 for item in self._pending if item < entry)
+        # Задача стартует, когда освободится исполнитель после всех задач впереди
+        rounds = ahead // self.workers + (0 if self._has_free_worker() else 1)
+        return {
+            "queue_position": ahead + 1,
+            "estimated_wait": round(rounds * self.job_duration(), 1),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "running": len(self._running),
+            "borrowed": self._borrowed,
+            "queued": len(self._pending),
+            "max_queue_size": self.max_queue_size,
+            "avg_job_duration": round(self.job_duration(), 1),
+        }
+
+    async def _worker_loop(self, worker_index: int):
+        while True:
+            async with self._wakeup:
+                await self._wakeup.wait_for(lambda: bool(self._pending) and self._has_free_worker())
+                _, _, job_id = heapq.heappop(self._pending)
+
+            job = self._jobs.pop(job_id)
+            started = time.monotonic()
+            self._running[job_id] = started
+            try:
+                await job()
+            except Exception as e:
+                logger.error(f"❌ Необработанная ошибка задачи {job_id}: {e}")
+            finally:
+                del self._running[job_id]
+                duration = time.monotonic() - started
+                if self._avg_duration is None:
+                    self._avg_duration = duration
+                else:
+                    self._avg_duration += DURATION_SMOOTHING * (duration - self._avg_duration)
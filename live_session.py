@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Живое распознавание потока PCM (софтфон, запись звонка) с сохранением состояния пайплайна
+"""
+
+import logging
+import os
+from typing import Dict, Any, List
+
+import numpy as np
+
+from streaming_video_transcriber import StreamingVideoTranscriber, SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Байт на отсчет в PCM s16le
+SAMPLE_WIDTH = 2
+
+
+def default_max_live_sessions() -> int:
+    """Максимум одновременных живых сессий: TRANSCRIBER_LIVE_MAX_SESSIONS (по умолчанию 4)"""
+    return max(1, int(os.environ.get("TRANSCRIBER_LIVE_MAX_SESSIONS", "4")))
+
+
+class LiveSession:
+    """Сессия живого распознавания: копит PCM 8 kHz mono s16le и прогоняет каждый полный чанк через пайплайн
+
+    У сессии свой state пайплайна, поэтому фразы возвращаются по мере поступления аудио,
+    с задержкой не больше одного чанка (CHUNK_SIZE отсчетов) плюс время его обработки.
+    Методы блокирующие; вызываются последовательно, из одного потока за раз.
+    """
+
+    def __init__(self, transcriber: StreamingVideoTranscriber):
+        if transcriber.pipeline is None:
+            raise Exception("Пайплайн не инициализирован. Вызовите init_pipeline() сначала.")
+
+        self.transcriber = transcriber
+        self.chunk_size = transcriber.pipeline.CHUNK_SIZE
+        # В режиме батчинга чанки сессии объединяются с чанками задач пула
+        self._forward = transcriber.batcher.forward if transcriber.batcher is not None else transcriber.pipeline.forward
+        self._buffer = bytearray()
+        self._state = None
+        self.samples_received = 0
+        self.phrases = 0
+
+    def feed(self, data: bytes) -> List[Dict[str, Any]]:
+        """Принимает очередной фрагмент PCM произвольной длины и возвращает распознанные фразы"""
+        self._buffer += data
+        self.samples_received += len(data) // SAMPLE_WIDTH
+
+        chunk_bytes = self.chunk_size * SAMPLE_WIDTH
+        entries = []
+        while len(self._buffer) >= chunk_bytes:
+            chunk = np.frombuffer(self._buffer, dtype="<i2", count=self.chunk_size).astype(np.int32)
+            del self._buffer[:chunk_bytes]
+            entries.extend(self._process(chunk, is_last=False))
+        return entries
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Дополняет остаток нулями до чанка и завершает распознавание"""
+        samples = len(self._buffer) // SAMPLE_WIDTH
+        chunk = np.zeros(self.chunk_size, dtype=np.int32)
+        chunk[:samples] = np.frombuffer(self._buffer, dtype="<i2", count=samples)
+        self._buffer.clear()
+        return self._process(chunk, is_last=True)
+
+    @property
+    def duration(self) -> float:
+        """Длительность принятого аудио в секундах"""
+        return self.samples_received / SAMPLE_RATE
+
+    def _process(self, chunk: np.ndarray, is_last: bool) -> List[Dict[str, Any]]:
+        phrases, self._state = self._forward(chunk, self._state, is_last=is_last)
+        entries = [self.transcriber.phrase_entry(phrase) for phrase in phrases]
+        for entry in entries:
+            logger.info(f"🎙️ [{entry['role']}] {entry['text']}")
+        self.phrases += len(entries)
+        return entries
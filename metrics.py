@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Время этапов транскрибации и метрики сервиса в формате Prometheus
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Iterable, Iterator, Tuple
+
+# Этапы задачи, время которых записывается в stats["stages"]:
+# metadata - сведения о видео (yt-dlp), download - скачивание, extract - извлечение аудио в WAV,
+# hash - проход для ключа кэша транскрипций, decode - ожидание очередного чанка от источника,
+# forward - pipeline.forward, roles - определение ролей, save - запись результата
+
+# Границы корзин гистограмм: время этапа и задачи (сек) и коэффициент реального времени
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+RTF_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5)
+
+
+def add_stage_time(stats: Optional[Dict[str, Any]], stage: str, seconds: float):
+    """Прибавляет время к этапу в stats["stages"]"""
+    if stats is None:
+        return
+    stages = stats.setdefault("stages", {})
+    stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def stage_timer(stats: Optional[Dict[str, Any]], stage: str):
+    """Учитывает время блока with как этап stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_stage_time(stats, stage, time.perf_counter() - started)
+
+
+def timed_iter(iterable: Iterable, stats: Optional[Dict[str, Any]], stage: str) -> Iterator:
+    """Элементы iterable; время ожидания каждого учитывается как этап stage"""
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            add_stage_time(stats, stage, time.perf_counter() - started)
+        yield item
+
+
+def finish_job_stats(stats: Dict[str, Any], processing_seconds: float):
+    """Округляет время этапов и добавляет общее время и коэффициент реального времени (время обработки / длительность аудио)"""
+    stats["stages"] = {stage: round(seconds, 3) for stage, seconds in stats.get("stages", {}).items()}
+    stats["processing_seconds"] = round(processing_seconds, 3)
+    audio_seconds = stats.get("audio_seconds")
+    stats["real_time_factor"] = round(processing_seconds / audio_seconds, 4) if audio_seconds else None
+
+
+def format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escape = lambda value: str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+
+class Histogram:
+    """Гистограмма Prometheus с фиксированными корзинами и метками"""
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series: Dict[Tuple[Tuple[str, str], ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        # Счетчики корзин, затем сумма и количество наблюдений
+        series = self._series.setdefault(tuple(sorted(labels.items())), [0.0] * (len(self.buckets) + 2))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{format_labels(labels + (('le', f'{bound:g}'),))} {count:g}")
+            lines.append(f"{self.name}_bucket{format_labels(labels + (('le', '+Inf'),))} {series[-1]:g}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {series[-2]:.6g}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {series[-1]:g}")
+        return lines
+
+
+class ServiceMetrics:
+    """Метрики задач процесса: гистограммы времени этапов, задач и коэффициента реального времени, счетчики"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_seconds = Histogram(
+            "transcriber_stage_seconds", "Время этапа транскрибации одной задачи", SECONDS_BUCKETS
+        )
+        self.job_seconds = Histogram(
+            "transcriber_job_seconds", "Время обработки задачи от начала до сохранения результата", SECONDS_BUCKETS
+        )
+        self.real_time_factor = Histogram(
+            "transcriber_real_time_factor", "Время обработки, деленное на длительность аудио", RTF_BUCKETS
+        )
+        self.jobs: Dict[str, int] = {}
+        self.audio_seconds = 0.0
+
+    def observe_job(self, status: str, stats: Optional[Dict[str, Any]] = None):
+        """Учитывает завершенную задачу; stats - статистика успешной задачи"""
+        with self._lock:
+            self.jobs[status] = self.jobs.get(status, 0) + 1
+            if not stats:
+                return
+            cached = "true" if stats.get("cache_hit") else "false"
+            for stage, seconds in stats.get("stages", {}).items():
+                self.stage_seconds.observe(seconds, stage=stage)
+            if stats.get("processing_seconds") is not None:
+                self.job_seconds.observe(stats["processing_seconds"], cache_hit=cached)
+            if stats.get("real_time_factor") is not None and not stats.get("cache_hit"):
+                self.real_time_factor.observe(stats["real_time_factor"])
+            self.audio_seconds += stats.get("audio_seconds") or 0.0
+
+    def render(self, gauges: Dict[str, Tuple[str, float]], counters: Optional[Dict[str, Tuple[str, float]]] = None) -> str:
+        """Текст для /metrics; gauges и counters - значения, которые ведутся вне ServiceMetrics: {имя: (описание, значение)}"""
+        with self._lock:
+            lines = ["# HELP transcriber_jobs_total Завершенные задачи по статусу", "# TYPE transcriber_jobs_total counter"]
+            lines += [f'transcriber_jobs_total{{status="{status}"}} {count}' for status, count in sorted(self.jobs.items())]
+            lines += [
+                "# HELP transcriber_audio_seconds_total Длительность распознанного аудио",
+                "# TYPE transcriber_audio_seconds_total counter",
+                f"transcriber_audio_seconds_total {self.audio_seconds:.6g}",
+            ]
+            for histogram in (self.stage_seconds, self.job_seconds, self.real_time_factor):
+                lines += histogram.render()
+        for kind, values in (("counter", counters or {}), ("gauge", gauges)):
+            for name, (help_text, value) in values.items():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value:g}"]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Компактное хранение dialogue_log: фразы в колонках вместо словаря на каждую фразу
+"""
+
+import json
+import sys
+from array import array
+from typing import Dict, Any, List, Iterable, Iterator, TextIO
+
+
+class PhraseLog:
+    """dialogue_log в колонках: время начала и конца в array('d'), роль - номер в таблице ролей, текст - список строк
+
+    Фраза занимает ~25 байт плюс строку текста вместо словаря с четырьмя ключами и двумя float (~250 байт).
+    Итерация и индексация возвращают привычные записи {"role", "text", "start", "end"}, поэтому
+    PhraseLog подходит везде, где dialogue_log только читается; сериализуется он напрямую, по фразе.
+    """
+
+    __slots__ = ("role_names", "_role_ids", "_roles", "texts", "starts", "ends")
+
+    def __init__(self):
+        self.role_names: List[str] = []
+        self._role_ids: Dict[str, int] = {}
+        self._roles = array("B")
+        self.texts: List[str] = []
+        self.starts = array("d")
+        self.ends = array("d")
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Dict[str, Any]]) -> "PhraseLog":
+        """PhraseLog из записей dialogue_log (например, прочитанных из JSON)"""
+        log = cls()
+        for entry in entries:
+            log.append(entry)
+        return log
+
+    def add(self, role: str, text: str, start: float, end: float):
+        role_id = self._role_ids.get(role)
+        if role_id is None:
+            role_id = self._role_ids[role] = len(self.role_names)
+            self.role_names.append(sys.intern(role))
+        self._roles.append(role_id)
+        self.texts.append(text)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def append(self, entry: Dict[str, Any]):
+        """Добавляет запись dialogue_log"""
+        self.add(entry["role"], entry["text"], entry["start"], entry["end"])
+
+    def shift(self, offset: float):
+        """Сдвигает время всех фраз на offset секунд"""
+        for i in range(len(self.starts)):
+            self.starts[i] += offset
+            self.ends[i] += offset
+
+    def role(self, index: int) -> str:
+        return self.role_names[self._roles[index]]
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("индекс фразы вне диапазона")
+        return {"role": self.role(index), "text": self.texts[index], "start": self.starts[index], "end": self.ends[index]}
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, PhraseLog):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """dialogue_log списком словарей (например, для JSON-ответа API)"""
+        return list(self)
+
+    def write_json(self, f: TextIO, indent: str = ""):
+        """JSON-массив записей; каждая запись сериализуется отдельно, без промежуточного списка"""
+        f.write("[")
+        for index in range(len(self)):
+            f.write(",\n" if index else "\n")
+            f.write(indent + "  " + json.dumps(self[index], ensure_ascii=False))
+        f.write(f"\n{indent}]" if len(self) else "]")
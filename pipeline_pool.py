@@ -0,0 +1,561 @@
+#!/usr/bin/env python3
+"""
+Пул процессов с предзагруженными пайплайнами T-one
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from multiprocessing import util
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Callable
+
+from audio_segments import default_segment_seconds, default_segment_overlap
+from chunk_batcher import BatchedPipeline, ChunkBatcher
+from phrase_log import PhraseLog
+from streaming_video_transcriber import StreamingVideoTranscriber
+
+logger = logging.getLogger(__name__)
+
+# Время ожидания загрузки моделей во всех воркерах при старте пула
+STARTUP_TIMEOUT = 600
+# Сколько ждать доставки последних событий задачи после получения ее результата
+EVENTS_DRAIN_TIMEOUT = 5
+# Как часто отрезки длинного файла пробуют занять освободившихся исполнителей планировщика
+SEGMENT_BORROW_INTERVAL = 1.0
+
+# Транскрибатор текущего процесса-воркера (у каждого воркера свой пайплайн)
+_worker_transcriber: Optional[StreamingVideoTranscriber] = None
+_startup_barrier = None
+# Очередь событий задач (фразы, прогресс) из воркеров в основной процесс
+_worker_events = None
+
+
+def default_workers() -> int:
+    """Количество воркеров: TRANSCRIBER_WORKERS или число ядер"""
+    value = os.environ.get("TRANSCRIBER_WORKERS")
+    if value:
+        return max(1, int(value))
+    return max(1, os.cpu_count() or 1)
+
+
+def default_worker_threads(workers: int) -> int:
+    """Потоки ONNX Runtime на воркер: TRANSCRIBER_WORKER_THREADS или ядра, поделенные между воркерами"""
+    value = os.environ.get("TRANSCRIBER_WORKER_THREADS")
+    if value:
+        return max(1, int(value))
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def default_batching() -> bool:
+    """Режим микро-батчинга: TRANSCRIBER_BATCHING=1"""
+    return os.environ.get("TRANSCRIBER_BATCHING", "0").lower() in ("1", "true", "yes")
+
+
+def _init_worker(output_dir: str, threads: int, startup_barrier, events):
+    """Инициализация процесса-воркера: загрузка собственного пайплайна T-one и прогрев"""
+    global _worker_transcriber, _startup_barrier, _worker_events
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    _startup_barrier = startup_barrier
+    _worker_events = events
+
+    _worker_transcriber = StreamingVideoTranscriber(output_dir=output_dir)
+    # Процессы пула завершаются без atexit, временные файлы чистим через финализатор multiprocessing
+    util.Finalize(_worker_transcriber, _worker_transcriber.cleanup, exitpriority=10)
+
+    # Ошибку загрузки не пробрасываем, иначе пул станет неработоспособным;
+    # transcribe_video повторит инициализацию и вернет понятную ошибку задаче
+    _worker_transcriber.init_pipeline(use_gpu=False, threads=threads)
+
+    # Готовность сообщается событием без задачи: основной процесс не ждет ее в потоке, который создает воркеры
+    events.put((None, "worker_ready", {"pid": os.getpid(), "ready": _warm_up(_worker_transcriber)}))
+
+
+def _warm_up(transcriber: StreamingVideoTranscriber) -> bool:
+    """Прогревает загруженный пайплайн; False, если модель не загружена или прогрев не удался"""
+    if transcriber.pipeline is None:
+        return False
+    try:
+        transcriber.warm_up()
+        return True
+    except Exception as e:
+        logger.error(f"❌ Ошибка прогрева пайплайна: {e}")
+        return False
+
+
+def _hold_worker():
+    """Задача запуска: держит воркер, пока не запустятся и не загрузят модель все воркеры пула"""
+    _startup_barrier.wait(STARTUP_TIMEOUT)
+
+
+def _run_job(transcriber: StreamingVideoTranscriber, events, job_id: str, video_input: str,
+             output_format: str) -> tuple[PhraseLog, str, Dict[str, Any]]:
+    """Транскрибация с отправкой событий задачи в очередь events; последним всегда идет событие end"""
+    stats: Dict[str, Any] = {}
+    try:
+        dialogue_log, output_file_path = transcriber.transcribe_video(
+            video_input,
+            output_format,
+            stats=stats,
+            on_event=lambda kind, data: events.put((job_id, kind, data))
+        )
+        return dialogue_log, str(output_file_path), stats
+    finally:
+        events.put((job_id, "end", {}))
+
+
+def _transcribe_in_worker(job_id: str, video_input: str, output_format: str) -> tuple[PhraseLog, str, Dict[str, Any]]:
+    """Транскрибация в процессе-воркере"""
+    return _run_job(_worker_transcriber, _worker_events, job_id, video_input, output_format)
+
+
+def _transcribe_segment(transcriber: StreamingVideoTranscriber, media_path: str, start: float,
+                        end: float) -> tuple[PhraseLog, Dict[str, Any]]:
+    stats: Dict[str, Any] = {}
+    return transcriber.transcribe_segment(media_path, start, end, stats), stats
+
+
+def _transcribe_segment_in_worker(media_path: str, start: float, end: float) -> tuple[PhraseLog, Dict[str, Any]]:
+    """Распознавание отрезка файла в процессе-воркере"""
+    return _transcribe_segment(_worker_transcriber, media_path, start, end)
+
+
+class PipelinePool:
+    """Пул из N процессов, в каждом из которых загружен свой StreamingCTCPipeline
+
+    Задача занимает свободный воркер на время транскрибации и возвращает его после;
+    если все воркеры заняты, задачи ждут в очереди пула.
+
+    В режиме батчинга (batching=True) задачи выполняются в N потоках текущего процесса
+    с одним пайплайном, а чанки одновременных задач объединяются ChunkBatcher в батчи и проходят
+    через модель одним вызовом (BatchedPipeline). Если модель пайплайна нельзя выполнить батчем,
+    пул запускается в обычном режиме процессов.
+
+    Если задан segment_seconds, локальные файлы длиннее двух отрезков делятся на отрезки
+    по паузам, которые распознаются во всех воркерах параллельно и затем склеиваются.
+    С планировщиком (scheduler) задача распознает в своем воркере по одному отрезку, а остальных
+    воркеров занимает через scheduler.try_borrow(), только пока в очереди нет других задач.
+
+    Пул готов (ready), когда каждый воркер загрузил модель и выполнил прогревочный проход.
+
+    Запуск делится на launch() - создание процессов - и wait_ready() - ожидание загрузки моделей,
+    которое можно вынести в поток.
+    """
+
+    def __init__(self, workers: Optional[int] = None, output_dir: str = "transcriptions", batching: Optional[bool] = None,
+                 segment_seconds: Optional[float] = None):
+        self.workers = workers or default_workers()
+        # В режиме батчинга одна сессия на все потоки, и ее пул потоков не ограничивается
+        self.worker_threads = default_worker_threads(self.workers)
+        self.output_dir = output_dir
+        self.batching = default_batching() if batching is None else batching
+        self.segment_seconds = default_segment_seconds() if segment_seconds is None else segment_seconds
+        self.segment_overlap = default_segment_overlap()
+        self.executor: Optional[Executor] = None
+        # Планировщик задач сервиса, с которым отрезки длинных файлов делят воркеры
+        self.scheduler = None
+        self.transcriber: Optional[StreamingVideoTranscriber] = None
+        self.batcher: Optional[ChunkBatcher] = None
+        self._live_transcriber: Optional[StreamingVideoTranscriber] = None
+        # Транскрайбер без пайплайна для разбиения, склейки и сохранения отрезков в текущем процессе
+        self._coordinator: Optional[StreamingVideoTranscriber] = None
+        self._events = None
+        self._handlers: Dict[str, Callable[[str, Dict[str, Any]], None]] = {}
+        self._events_thread: Optional[threading.Thread] = None
+        self._submitted = 0
+        self._lock = threading.Lock()
+        # Загрузка модели для живых сессий идет под своей блокировкой: _lock берут submit() из цикла событий
+        # и поток событий пула, и они не должны ждать загрузки
+        self._live_lock = threading.Lock()
+        # Модель загружена и прогрета во всех воркерах; время запуска пула
+        self.ready = False
+        self.startup_seconds: Optional[float] = None
+        self._started: Optional[float] = None
+        # Готовность воркеров текущего пула процессов по PID
+        self._worker_states: Dict[int, bool] = {}
+        self._ready_changed = threading.Condition(self._lock)
+        self._restarting = False
+        self._closing = False
+
+    def start(self):
+        """Запускает воркеры и дожидается загрузки модели и прогрева в каждом из них"""
+        self.launch()
+        self.wait_ready()
+
+    def launch(self):
+        """Создает процессы-воркеры, которые загружают модель в фоне
+
+        В режиме батчинга процессов нет, и запуск целиком выполняет wait_ready().
+        """
+        if self._started is not None:
+            return
+        self._started = time.monotonic()
+        if not self.batching:
+            self._start_processes()
+
+    def wait_ready(self):
+        """Дожидается загрузки и прогрева модели в воркерах, но не дольше STARTUP_TIMEOUT
+
+        Если время вышло, пул продолжает запуск: ready станет True, когда модель загрузят все воркеры.
+        """
+        self.launch()
+        if self.batching and self.executor is None:
+            self._start_batching()
+            if not self.batching:
+                self._start_processes()
+        if self.batching:
+            self.startup_seconds = round(time.monotonic() - self._started, 1)
+            logger.info(f"{'✅' if self.ready else '⚠️'} Пул пайплайнов запущен за {self.startup_seconds} сек, "
+                        f"модель {'готова' if self.ready else 'не загружена'}")
+            return
+        if self.executor is None:
+            raise Exception("Пул пайплайнов не запущен.")
+
+        with self._ready_changed:
+            loaded = self._ready_changed.wait_for(lambda: len(self._worker_states) >= self.workers, STARTUP_TIMEOUT)
+        if not loaded:
+            logger.warning(f"⚠️ Воркеры не загрузили модель за {STARTUP_TIMEOUT} сек, пул станет готов после загрузки")
+
+    def _start_processes(self):
+        logger.info(f"🚀 Запуск пула пайплайнов T-one: {self.workers} воркеров по {self.worker_threads} потоков модели")
+        self._create_executor(multiprocessing.get_context("spawn"))
+
+    def _create_executor(self, context):
+        """Создает процессы-воркеры; о загрузке и прогреве модели они сообщают событием worker_ready"""
+        startup_barrier = context.Barrier(self.workers)
+        self._events = context.Queue()
+        with self._lock:
+            self._worker_states = {}
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.output_dir, self.worker_threads, startup_barrier, self._events)
+        )
+
+        # Пока нет свободных воркеров, каждая задача порождает новый процесс (все процессы
+        # сразу при первой задаче), а барьер не дает одному воркеру забрать несколько задач запуска
+        for _ in range(self.workers):
+            self.executor.submit(_hold_worker)
+        self._start_events_thread()
+
+    def _on_worker_ready(self, data: Dict[str, Any]):
+        """Отмечает воркер, загрузивший модель; когда отметились все, пул готов"""
+        with self._ready_changed:
+            self._worker_states[data["pid"]] = data["ready"]
+            if len(self._worker_states) < self.workers:
+                return
+            self.ready = all(self._worker_states.values())
+            if self.startup_seconds is None:
+                self.startup_seconds = round(time.monotonic() - self._started, 1)
+            pids = list(self._worker_states)
+            self._ready_changed.notify_all()
+        logger.info(f"{'✅' if self.ready else '⚠️'} Воркеры пула запущены, модель {'готова' if self.ready else 'не загружена'}, "
+                    f"PID воркеров: {pids}")
+
+    def _restart_broken(self):
+        """Пул процессов сломан аварийным завершением воркера (OOM, падение в нативном коде): пересоздает его в фоне"""
+        with self._lock:
+            if self.batching or self.executor is None or self._restarting or self._closing:
+                return
+            self._restarting = True
+            self.ready = False
+            broken = self.executor
+        logger.error("❌ Воркер пула аварийно завершился, пул процессов перезапускается")
+        threading.Thread(target=self._restart_processes, args=(broken,), name="pool-restart", daemon=True).start()
+
+    def _restart_processes(self, broken: Executor):
+        try:
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._stop_events_thread()
+            if not self._closing:
+                self._create_executor(multiprocessing.get_context("spawn"))
+        except Exception as e:
+            logger.error(f"❌ Ошибка перезапуска пула пайплайнов: {e}")
+        finally:
+            with self._lock:
+                self._restarting = False
+
+    def _check_broken(self, future: Future):
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._restart_broken()
+
+    def _start_batching(self):
+        """Запуск потоков с общим пайплайном и батчером; без батчевого прохода модели режим выключается"""
+        logger.info(f"🚀 Запуск пула в режиме батчинга: {self.workers} потоков, один пайплайн T-one")
+        transcriber = StreamingVideoTranscriber(output_dir=self.output_dir)
+        if transcriber.init_pipeline(use_gpu=False):
+            batched = BatchedPipeline.from_pipeline(transcriber.pipeline)
+            if batched is None:
+                # Последовательный forward в одном потоке медленнее пула процессов; загруженная
+                # модель остается для живых сессий
+                logger.warning("⚠️ Режим батчинга недоступен для этого пайплайна, запуск пула процессов")
+                self.batching = False
+                self._live_transcriber = transcriber
+                return
+            self.ready = _warm_up(transcriber)
+            self.batcher = ChunkBatcher(batched, max_batch_size=self.workers)
+            self.batcher.start()
+            transcriber.batcher = self.batcher
+
+        self.transcriber = transcriber
+        self._events = queue.Queue()
+        self._start_events_thread()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="transcriber")
+
+    def live_transcriber(self) -> StreamingVideoTranscriber:
+        """Транскрайбер текущего процесса для живых сессий
+
+        В режиме батчинга это общий транскрайбер пула (чанки сессий попадают в батчи), иначе отдельный
+        пайплайн, который загружается при первом вызове.
+        """
+        if self.batching:
+            return self.transcriber
+
+        with self._live_lock:
+            if self._live_transcriber is None:
+                logger.info("🎙️ Загрузка пайплайна T-one для живых сессий")
+                transcriber = StreamingVideoTranscriber(output_dir=self.output_dir)
+                if not transcriber.init_pipeline(use_gpu=False):
+                    transcriber.cleanup()
+                    raise Exception("Не удалось инициализировать пайплайн для живых сессий.")
+                with self._lock:
+                    self._live_transcriber = transcriber
+            return self._live_transcriber
+
+    def _transcribe_in_thread(self, job_id: str, video_input: str, output_format: str) -> tuple[PhraseLog, str, Dict[str, Any]]:
+        return _run_job(self.transcriber, self._events, job_id, video_input, output_format)
+
+    def _stop_events_thread(self):
+        if self._events_thread is not None:
+            self._events.put(None)
+            self._events_thread.join()
+            self._events_thread = None
+
+    def _start_events_thread(self):
+        self._events_thread = threading.Thread(target=self._dispatch_events, name="pool-events", daemon=True)
+        self._events_thread.start()
+
+    def _dispatch_events(self):
+        """Передает события задач из очереди их обработчикам"""
+        while True:
+            item = self._events.get()
+            if item is None:
+                return
+            job_id, kind, data = item
+            if kind == "worker_ready":
+                self._on_worker_ready(data)
+                continue
+            handler = self._handlers.pop(job_id, None) if kind == "end" else self._handlers.get(job_id)
+            if handler is not None:
+                try:
+                    handler(kind, data)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка обработчика событий задачи {job_id}: {e}")
+
+    def submit(self, video_input: str, output_format: str = "txt",
+               on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+               job_id: Optional[str] = None) -> Future:
+        """Ставит задачу транскрибации в пул
+
+        on_event вызывается из служебного потока пула для событий "phrase", "progress" и завершающего "end".
+        """
+        if self.executor is None:
+            raise Exception("Пул пайплайнов не запущен.")
+
+        job_id = job_id or uuid.uuid4().hex
+        if on_event is not None:
+            self._handlers[job_id] = on_event
+
+        with self._lock:
+            self._submitted += 1
+
+        job = self._transcribe_in_thread if self.batching else _transcribe_in_worker
+        try:
+            future = self.executor.submit(job, job_id, video_input, output_format)
+        except Exception as e:
+            self._handlers.pop(job_id, None)
+            with self._lock:
+                self._submitted -= 1
+            if isinstance(e, BrokenProcessPool):
+                self._restart_broken()
+                raise Exception("Пул пайплайнов перезапускается после аварийного завершения воркера.") from e
+            raise
+        future.add_done_callback(self._on_done)
+        return future
+
+    async def transcribe(self, video_input: str, output_format: str = "txt",
+                         on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> tuple[PhraseLog, Path, Dict[str, Any]]:
+        """Асинхронная транскрибация в свободном воркере; возвращает также статистику обработки
+
+        on_event вызывается в текущем event loop; все события задачи доставляются до возврата результата.
+        """
+        if self.segment_seconds and await asyncio.to_thread(self._is_long_local_file, video_input):
+            return await self._transcribe_segmented(video_input, output_format, on_event)
+
+        loop = asyncio.get_running_loop()
+        ended = asyncio.Event()
+
+        def handler(kind: str, data: Dict[str, Any]):
+            if kind == "end":
+                loop.call_soon_threadsafe(ended.set)
+            elif on_event is not None:
+                loop.call_soon_threadsafe(on_event, kind, data)
+
+        job_id = uuid.uuid4().hex
+        # Если задача не поставлена, событий не будет и ждать их не нужно
+        future = self.submit(video_input, output_format, handler, job_id)
+        try:
+            dialogue_log, output_file_path, stats = await asyncio.wrap_future(future)
+        finally:
+            if future.done() and not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+                # Воркер аварийно завершился и уже не отправит "end"
+                self._handlers.pop(job_id, None)
+            else:
+                try:
+                    await asyncio.wait_for(ended.wait(), EVENTS_DRAIN_TIMEOUT)
+                except asyncio.TimeoutError:
+                    self._handlers.pop(job_id, None)
+        return dialogue_log, Path(output_file_path), stats
+
+    def _is_long_local_file(self, video_input: str) -> bool:
+        if video_input.startswith(('http://', 'https://')) or not Path(video_input).is_file():
+            return False
+        duration = self._get_coordinator().probe_duration(video_input)
+        return duration is not None and duration >= 2 * self.segment_seconds
+
+    def _get_coordinator(self) -> StreamingVideoTranscriber:
+        if self.batching:
+            return self.transcriber
+        with self._lock:
+            if self._coordinator is None:
+                self._coordinator = StreamingVideoTranscriber(output_dir=self.output_dir)
+            return self._coordinator
+
+    async def _transcribe_segmented(self, media_path: str, output_format: str,
+                                    on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> tuple[PhraseLog, Path, Dict[str, Any]]:
+        """Транскрибация длинного файла отрезками во всех воркерах пула"""
+        loop = asyncio.get_running_loop()
+        emit = None
+        if on_event is not None:
+            emit = lambda kind, data: loop.call_soon_threadsafe(on_event, kind, data)
+
+        stats: Dict[str, Any] = {}
+        dialogue_log, output_file_path = await asyncio.to_thread(
+            self._get_coordinator().transcribe_segmented,
+            media_path,
+            output_format,
+            partial(self._run_segments, media_path, loop),
+            self.segment_seconds,
+            self.segment_overlap,
+            stats,
+            emit
+        )
+        return dialogue_log, output_file_path, stats
+
+    def _run_segments(self, media_path: str, loop: asyncio.AbstractEventLoop, segments: List[Dict[str, float]],
+                      on_segment_done: Callable[[int], None]) -> List[tuple[PhraseLog, Dict[str, Any]]]:
+        """Распознает отрезки в воркерах пула и возвращает фразы и статистику в порядке отрезков
+
+        Один отрезок всегда идет в воркере самой задачи, каждый следующий одновременно с ним -
+        в воркере, занятом у планировщика, поэтому отрезки не обгоняют задачи, ждущие в очереди.
+        """
+        if self.executor is None:
+            raise Exception("Пул пайплайнов не запущен.")
+
+        job = partial(_transcribe_segment, self.transcriber) if self.batching else _transcribe_segment_in_worker
+        waiting = deque(enumerate(segments))
+        running: Dict[Future, int] = {}
+        borrowed = 0
+        results: List[tuple[PhraseLog, Dict[str, Any]]] = [(PhraseLog(), {}) for _ in segments]
+        try:
+            while waiting or running:
+                while waiting and (not running or self._borrow_worker(loop)):
+                    if running:
+                        borrowed += 1
+                    index, segment = waiting.popleft()
+                    try:
+                        future = self.executor.submit(job, media_path, segment["start"], segment["end"])
+                    except BrokenProcessPool:
+                        self._restart_broken()
+                        raise Exception("Пул пайплайнов перезапускается после аварийного завершения воркера.")
+                    future.add_done_callback(self._check_broken)
+                    running[future] = index
+
+                done, _ = wait(running, timeout=SEGMENT_BORROW_INTERVAL if waiting else None,
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    results[index] = future.result()
+                    on_segment_done(index)
+                while borrowed > max(0, len(running) - 1):
+                    borrowed -= 1
+                    self._release_worker(loop)
+        except Exception:
+            for future in running:
+                future.cancel()
+            raise
+        finally:
+            for _ in range(borrowed):
+                self._release_worker(loop)
+        return results
+
+    def _borrow_worker(self, loop: asyncio.AbstractEventLoop) -> bool:
+        if self.scheduler is None:
+            return True
+        return asyncio.run_coroutine_threadsafe(self._try_borrow(), loop).result()
+
+    async def _try_borrow(self) -> bool:
+        return self.scheduler.try_borrow()
+
+    def _release_worker(self, loop: asyncio.AbstractEventLoop):
+        if self.scheduler is not None:
+            asyncio.run_coroutine_threadsafe(self.scheduler.release_borrowed(), loop).result()
+
+    def _on_done(self, future: Future):
+        with self._lock:
+            self._submitted -= 1
+        self._check_broken(future)
+
+    def stats(self) -> Dict[str, Any]:
+        """Состояние пула: число воркеров, занятых и ожидающих задач"""
+        with self._lock:
+            submitted = self._submitted
+        busy = min(submitted, self.workers)
+        stats = {"workers": self.workers, "busy": busy, "queued": submitted - busy}
+        if self.batcher is not None:
+            stats["batching"] = self.batcher.stats()
+        return stats
+
+    def shutdown(self):
+        """Останавливает воркеры"""
+        self._closing = True
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        if self.batcher is not None:
+            self.batcher.stop()
+            self.batcher = None
+        if self.transcriber is not None:
+            self.transcriber.cleanup()
+            self.transcriber = None
+        if self._live_transcriber is not None:
+            self._live_transcriber.cleanup()
+            self._live_transcriber = None
+        if self._coordinator is not None:
+            self._coordinator.cleanup()
+            self._coordinator = None
+        self._stop_events_thread()
+        self.ready = False
+        self._started = None
+        logger.info("🛑 Пул пайплайнов остановлен")
@@ -35,13 +35,18 @@ def main():
     transcriptions_dir.mkdir(exist_ok=True)
     print(f"📁 Директория транскрипций: {transcriptions_dir.absolute()}")
     
+    # Перезапуск при изменении кода заново загружает модель, поэтому он только для разработки
+    reload = os.environ.get("TRANSCRIBER_RELOAD", "0").lower() in ("1", "true", "yes")
+    if reload:
+        print("🔄 Автоперезапуск при изменении кода включен (TRANSCRIBER_RELOAD)")
+    
     try:
         # Запускаем сервер
         uvicorn.run(
             "app:app",
             host="0.0.0.0",
             port=8086,
-            reload=True,
+            reload=reload,
             log_level="info"
         )
     except KeyboardInterrupt:
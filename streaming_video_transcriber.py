@@ -3,28 +3,113 @@
 Потоковый транскрибатор видео для веб-сервиса
 """
 
+import argparse
 import asyncio
-import json
+import glob
+import hashlib
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from multiprocessing import util
 import os
 import tempfile
 import time
-from datetime import datetime
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Iterable, Iterator, Tuple, Callable
 import yt_dlp
 import subprocess
 import threading
 import queue
 import numpy as np
-import librosa
 import soundfile as sf
 
 from tone.pipeline import StreamingCTCPipeline, TextPhrase
 from tone.demo.enhanced_website import RoleDetector, DialogLogger
 
+from audio_segments import plan_segments, merge_segments, owned_seconds
+from chunk_batcher import ChunkBatcher, model_session
+from phrase_log import PhraseLog
+from download_cache import DownloadCache
+from metrics import stage_timer, timed_iter, add_stage_time, finish_job_stats
+from transcript_cache import TranscriptCache, file_alias
+from transcript_writer import TranscriptWriter, open_transcript_writer
+
 logger = logging.getLogger(__name__)
 
+# Частота дискретизации, с которой работает T-one
+SAMPLE_RATE = 8000
+
+# Версия обработки (чанкование, определение ролей); входит в ключ кэша транскрипций
+PIPELINE_VERSION = "1"
+
+# Протоколы yt-dlp, которые ffmpeg может читать напрямую по мере скачивания
+PROGRESSIVE_PROTOCOLS = ('http', 'https', 'm3u8', 'm3u8_native')
+
+# Минимальный интервал между событиями прогресса, сек
+PROGRESS_INTERVAL = 0.5
+
+# Обработчик событий задачи: ("phrase", запись dialogue_log) и ("progress", счетчики чанков)
+EventCallback = Callable[[str, Dict[str, Any]], None]
+
+# Сколько тихих чанков подряд еще подается в пайплайн, прежде чем поток закрывается и тишина пропускается
+VAD_HANGOVER_CHUNKS = 3
+
+
+def default_vad_threshold() -> Optional[float]:
+    """Порог RMS (в единицах int16) для пропуска тихих чанков: TRANSCRIBER_VAD=1 и TRANSCRIBER_VAD_THRESHOLD_DB
+    (по умолчанию -50 dBFS); None, если пропуск выключен"""
+    if os.environ.get("TRANSCRIBER_VAD", "0").lower() not in ("1", "true", "yes"):
+        return None
+    threshold_db = float(os.environ.get("TRANSCRIBER_VAD_THRESHOLD_DB", "-50"))
+    return 32768.0 * 10 ** (threshold_db / 20)
+
+
+def pipeline_version() -> str:
+    """Версия обработки для ключа кэша: пропуск тишины меняет результат, поэтому его порог входит в версию"""
+    threshold = default_vad_threshold()
+    return PIPELINE_VERSION if threshold is None else f"{PIPELINE_VERSION}+vad{threshold:.1f}"
+
+
+def iter_with_last_flag(items: Iterable[Any]) -> Iterator[Tuple[Any, bool]]:
+    """Возвращает элементы вместе с признаком последнего элемента (с опережающим чтением)"""
+    iterator = iter(items)
+    try:
+        current = next(iterator)
+    except StopIteration:
+        return
+    for item in iterator:
+        yield current, False
+        current = item
+    yield current, True
+
+
+class ChunkFramer:
+    """Раскладывает отсчеты int16 по чанкам int32 фиксированного размера без выделения памяти на каждый чанк
+
+    Чанки - строки небольшого кольца заранее выделенных буферов, преобразование int16 -> int32
+    выполняется копированием прямо в буфер. Чанк действителен, пока не запрошены два следующих:
+    этого хватает для опережающего чтения iter_with_last_flag; дольше чанк нужно копировать.
+    """
+
+    BUFFERS = 2
+
+    def __init__(self, chunk_size: int):
+        self.chunk_size = chunk_size
+        self._ring = np.zeros((self.BUFFERS, chunk_size), dtype=np.int32)
+        self._next = 0
+
+    def put(self, samples: np.ndarray) -> np.ndarray:
+        """Копирует до chunk_size отсчетов в очередной буфер, дополняя его нулями"""
+        chunk = self._ring[self._next]
+        self._next = (self._next + 1) % self.BUFFERS
+        count = len(samples)
+        np.copyto(chunk[:count], samples)
+        if count < self.chunk_size:
+            chunk[count:] = 0
+        return chunk
+
+
 class StreamingVideoTranscriber:
     """Потоковый транскрибатор видео с поддержкой различных источников"""
     
@@ -34,18 +119,29 @@ class StreamingVideoTranscriber:
         self.pipeline: Optional[StreamingCTCPipeline] = None
         self.role_detector: Optional[RoleDetector] = None
         self.dialog_logger: Optional[DialogLogger] = None
+        # Если задан, чанки идут через общий батчер вместо прямого pipeline.forward
+        self.batcher: Optional[ChunkBatcher] = None
+        self.cache: Optional[TranscriptCache] = TranscriptCache.from_env(pipeline_version())
+        # Порог пропуска тихих чанков (None - все чанки идут в пайплайн)
+        self.vad_threshold: Optional[float] = default_vad_threshold()
+        self.download_cache: Optional[DownloadCache] = DownloadCache.from_env()
+        # Прогрессивная транскрибация URL (TRANSCRIBER_PROGRESSIVE=0 отключает)
+        self.progressive = os.environ.get("TRANSCRIBER_PROGRESSIVE", "1").lower() not in ("0", "false", "no")
         self.temp_dir = Path(tempfile.mkdtemp(prefix="video_transcriber_"))
         
         logger.info(f"StreamingVideoTranscriber инициализирован. Выходная директория: {self.output_dir}")
     
-    def init_pipeline(self, use_gpu: bool = False):
-        """Инициализация пайплайна T-one"""
+    def init_pipeline(self, use_gpu: bool = False, threads: Optional[int] = None):
+        """Инициализация пайплайна T-one; threads ограничивает intra-op потоки ONNX-сессии модели"""
         if self.pipeline is not None:
             return True
         
         try:
             logger.info("Инициализация пайплайна T-one...")
-            self.pipeline = StreamingCTCPipeline.from_hugging_face()
+            pipeline = StreamingCTCPipeline.from_hugging_face()
+            if threads:
+                self._limit_model_threads(pipeline, threads)
+            self.pipeline = pipeline
             self.role_detector = RoleDetector()
             self.dialog_logger = DialogLogger(self.output_dir)
             
@@ -55,27 +151,77 @@ class StreamingVideoTranscriber:
         except Exception as e:
             logger.error(f"❌ Ошибка инициализации пайплайна: {e}")
             return False
+
+    @staticmethod
+    def _limit_model_threads(pipeline: StreamingCTCPipeline, threads: int):
+        """Пересоздает ONNX-сессию модели пайплайна с intra_op_num_threads=threads
+
+        По умолчанию сессия ONNX Runtime запускает по потоку на физическое ядро, и воркеры пула
+        с собственными сессиями конкурируют за ядра. Сессию создает from_hugging_face() без SessionOptions,
+        поэтому здесь она создается заново из той же модели с теми же провайдерами и опциями.
+        """
+        import onnxruntime
+
+        found = model_session(pipeline.model)
+        # Путь или байты модели ONNX Runtime хранит в сессии, открытого API для них нет
+        source = found and (getattr(found[1], "_model_path", None) or getattr(found[1], "_model_bytes", None))
+        if not source:
+            logger.warning(f"⚠️ Не удалось ограничить потоки модели до {threads}: сессия модели не найдена")
+            return
+        name, session = found
+        options = session.get_session_options()
+        options.intra_op_num_threads = threads
+        setattr(pipeline.model, name, onnxruntime.InferenceSession(source, options, providers=session.get_providers()))
+
+    def warm_up(self) -> float:
+        """Прогревочный проход тихого чанка через пайплайн и определение роли; возвращает время в секундах
+
+        Первый forward выполняет ленивую инициализацию рантайма модели (выделение буферов, выбор ядер),
+        после прогрева ее не ждет первая задача.
+        """
+        started = time.perf_counter()
+        self.pipeline.forward(np.zeros(self.pipeline.CHUNK_SIZE, dtype=np.int32), None, is_last=True)
+        self.role_detector.detect_role("")
+        elapsed = time.perf_counter() - started
+        logger.info(f"🔥 Пайплайн прогрет за {elapsed:.2f} сек")
+        return elapsed
     
-    def download_video_audio(self, video_url: str) -> Optional[str]:
-        """Скачивание аудио из видео URL"""
+    def download_video_audio(self, video_url: str, target_dir: Optional[Path] = None, native_audio: bool = True,
+                             info_dict: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Скачивание аудио из видео URL (по умолчанию во временную директорию)
+
+        При native_audio=True дорожка сохраняется в исходном контейнере (m4a, webm, ...) без
+        перекодирования в WAV: она декодируется в 8 kHz mono PCM один раз, при чтении чанков.
+        Метаданные info_dict, уже полученные из yt-dlp, скачиваются без повторного извлечения.
+        """
         logger.info(f"📥 Скачивание аудио из: {video_url}")
+        target_dir = target_dir or self.temp_dir
         
         ydl_opts = {
             'format': 'bestaudio/best',
-            'outtmpl': str(self.temp_dir / '%(title)s.%(ext)s'),
-            'postprocessors': [{
+            'outtmpl': str(target_dir / '%(title)s.%(ext)s'),
+            'noplaylist': True,
+        }
+        if not native_audio:
+            ydl_opts['postprocessors'] = [{
                 'key': 'FFmpegExtractAudio',
                 'preferredcodec': 'wav',
                 'preferredquality': '192',
-            }],
-            'noplaylist': True,
-        }
+            }]
         
         try:
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info_dict = ydl.extract_info(video_url, download=True)
+                if info_dict is not None:
+                    info_dict = ydl.process_ie_result(info_dict, download=True)
+                else:
+                    info_dict = ydl.extract_info(video_url, download=True)
                 # Находим скачанный файл
-                downloaded_files = list(self.temp_dir.glob(f"{info_dict['title']}*.wav"))
+                if native_audio:
+                    downloads = info_dict.get('requested_downloads') or [{}]
+                    audio_path = downloads[0].get('filepath') or ydl.prepare_filename(info_dict)
+                    downloaded_files = [Path(audio_path)] if Path(audio_path).exists() else []
+                else:
+                    downloaded_files = list(target_dir.glob(f"{info_dict['title']}*.wav"))
                 if downloaded_files:
                     audio_path = str(downloaded_files[0])
                     logger.info(f"✅ Аудио скачано: {audio_path}")
@@ -116,8 +262,159 @@ class StreamingVideoTranscriber:
         except Exception as e:
             logger.error(f"❌ Ошибка извлечения аудио: {e}")
             return None
-    
-    def transcribe_audio_file(self, audio_path: str, output_format: str = "txt") -> tuple[List[Dict[str, Any]], Path]:
+
+    def stream_audio_from_video(self, video_path: str, chunk_size: int,
+                                http_headers: Optional[Dict[str, str]] = None,
+                                start: Optional[float] = None, duration: Optional[float] = None) -> Iterator[np.ndarray]:
+        """Потоковое декодирование аудио через ffmpeg в pipe (8 kHz mono s16le) чанками по chunk_size
+
+        video_path может быть и прямой ссылкой на медиапоток (HTTP, HLS): тогда ffmpeg
+        декодирует данные по мере их получения, а http_headers передаются в запросы.
+        start и duration (сек) ограничивают декодируемый отрезок.
+        """
+        logger.info(f"🎵 Потоковое декодирование аудио из: {video_path[:200]}")
+
+        input_options = []
+        if http_headers:
+            input_options = ['-headers', ''.join(f"{name}: {value}\r\n" for name, value in http_headers.items())]
+        if start:
+            input_options += ['-ss', f"{start:.3f}"]
+        if duration is not None:
+            input_options += ['-t', f"{duration:.3f}"]
+
+        cmd = [
+            'ffmpeg',
+            '-nostdin',
+            '-loglevel', 'error',
+            *input_options,
+            '-i', video_path,
+            '-vn',                   # без видео
+            '-f', 's16le',           # сырой PCM без заголовка
+            '-acodec', 'pcm_s16le',
+            '-ar', str(SAMPLE_RATE), # 8kHz sample rate
+            '-ac', '1',              # mono
+            'pipe:1'
+        ]
+
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        # stderr читаем в отдельном потоке, чтобы ffmpeg не заблокировался на заполненном pipe
+        stderr_lines: List[str] = []
+        stderr_thread = threading.Thread(
+            target=lambda: stderr_lines.extend(
+                line.decode('utf-8', errors='replace') for line in process.stderr
+            ),
+            daemon=True
+        )
+        stderr_thread.start()
+
+        # PCM читается прямо в заранее выделенный буфер int16 и раскладывается по переиспользуемым чанкам
+        framer = ChunkFramer(chunk_size)
+        pcm = np.empty(chunk_size, dtype='<i2')
+        pcm_bytes = memoryview(pcm).cast('B')
+        total_samples = 0
+        try:
+            while True:
+                filled = 0
+                while filled < len(pcm_bytes):
+                    read = process.stdout.readinto(pcm_bytes[filled:])
+                    if not read:
+                        break
+                    filled += read
+                if filled < 2:
+                    break
+
+                samples = filled // 2  # s16le: 2 байта на сэмпл
+                total_samples += samples
+                yield framer.put(pcm[:samples])
+                if filled < len(pcm_bytes):
+                    break
+
+            process.wait()
+            stderr_thread.join()
+            if process.returncode != 0:
+                raise Exception(f"Ошибка декодирования аудио ffmpeg: {''.join(stderr_lines).strip()}")
+
+            logger.info(f"📊 Аудио: {total_samples} сэмплов, {SAMPLE_RATE} Hz")
+            logger.info(f"⏱️ Длительность: {total_samples / SAMPLE_RATE:.2f} сек")
+        finally:
+            # Если потребитель прервал чтение, ffmpeg больше не нужен
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+
+    def transcribe_video_stream(self, video_path: str, output_format: str = "txt", stats: Optional[Dict[str, Any]] = None,
+                                on_event: Optional[EventCallback] = None) -> tuple[PhraseLog, Path]:
+        """Транскрибирует видео файл, подавая аудио из ffmpeg в пайплайн по мере декодирования"""
+        if not self.pipeline or not self.role_detector:
+            raise Exception("Пайплайн T-one не инициализирован.")
+
+        logger.info(f"🎤 Потоковая транскрибация: {video_path}")
+
+        try:
+            return self._transcribe_source(
+                lambda: self.stream_audio_from_video(video_path, self.pipeline.CHUNK_SIZE),
+                Path(video_path).stem,
+                output_format,
+                stats,
+                alias=self._file_alias(video_path, stats),
+                on_event=on_event,
+                duration=self.probe_duration(video_path)
+            )
+        except Exception as e:
+            logger.error(f"❌ Ошибка потоковой транскрибации: {e}")
+            raise
+
+    def probe_duration(self, media_path: str) -> Optional[float]:
+        """Длительность файла в секундах (soundfile или ffprobe); None, если определить не удалось"""
+        try:
+            return sf.info(media_path).duration
+        except Exception:
+            pass
+
+        try:
+            result = subprocess.run(
+                ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', media_path],
+                capture_output=True, text=True, timeout=30
+            )
+            return float(result.stdout.strip()) if result.returncode == 0 else None
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            return None
+
+    def read_audio_chunks(self, audio_path: str, chunk_size: int,
+                          start: Optional[float] = None, duration: Optional[float] = None) -> Iterator[np.ndarray]:
+        """Читает аудиофайл блоками фиксированного размера (int32, 8 kHz mono) с постоянным потреблением памяти
+
+        WAV/FLAC/OGG с частотой 8 kHz читаются блоками через soundfile без ресемплинга,
+        остальные файлы декодируются ffmpeg в pipe. start и duration (сек) ограничивают отрезок.
+        """
+        try:
+            info = sf.info(audio_path)
+        except Exception:
+            info = None
+
+        if info is None or info.samplerate != SAMPLE_RATE or info.channels != 1:
+            # Нужен ресемплинг или даунмикс - делегируем ffmpeg
+            yield from self.stream_audio_from_video(audio_path, chunk_size, start=start, duration=duration)
+            return
+
+        if start is None and duration is None:
+            logger.info(f"📊 Аудио: {info.frames} сэмплов, {info.samplerate} Hz")
+            logger.info(f"⏱️ Длительность: {info.frames / info.samplerate:.2f} сек")
+
+        start_frame = int(round((start or 0) * SAMPLE_RATE))
+        frames = int(round(duration * SAMPLE_RATE)) if duration is not None else -1
+
+        # Блоки читаются в один буфер int16 и раскладываются по переиспользуемым чанкам int32;
+        # последний блок дополняется нулями до chunk_size
+        framer = ChunkFramer(chunk_size)
+        pcm = np.empty(chunk_size, dtype=np.int16)
+        for block in sf.blocks(audio_path, dtype='int16', fill_value=0, start=start_frame, frames=frames, out=pcm):
+            yield framer.put(block)
+
+    def transcribe_audio_file(self, audio_path: str, output_format: str = "txt", stats: Optional[Dict[str, Any]] = None,
+                              on_event: Optional[EventCallback] = None) -> tuple[PhraseLog, Path]:
         """Транскрибирует аудиофайл и возвращает результат"""
         if not self.pipeline or not self.role_detector:
             raise Exception("Пайплайн T-one не инициализирован.")
@@ -125,120 +422,479 @@ class StreamingVideoTranscriber:
         logger.info(f"🎤 Транскрибация аудио: {audio_path}")
         
         try:
-            # Загрузка аудио
-            audio_data, sample_rate = librosa.load(audio_path, sr=8000)  # 8kHz для T-one
-            # Нормализуем аудио и конвертируем в int32 в диапазоне [-32768, 32767]
-            audio_data = np.clip(audio_data, -1.0, 1.0)  # Ограничиваем диапазон
-            audio_data = (audio_data * 32767).astype(np.int32)
-            logger.info(f"📊 Аудио: {len(audio_data)} сэмплов, {sample_rate} Hz")
-            logger.info(f"⏱️ Длительность: {len(audio_data) / sample_rate:.2f} сек")
-            
-            # Обработка аудио по чанкам
-            chunk_size = self.pipeline.CHUNK_SIZE
-            total_chunks = (len(audio_data) + chunk_size - 1) // chunk_size
-            
-            dialogue_log = []
-            state = None  # Инициализируем состояние для потоковой обработки
-            
-            for i in range(total_chunks):
-                start_idx = i * chunk_size
-                end_idx = min((i + 1) * chunk_size, len(audio_data))
-                chunk = audio_data[start_idx:end_idx]
-                is_last_chunk = (i == total_chunks - 1)
-                
-                # Проверяем размер чанка и дополняем до нужного размера если необходимо
-                if len(chunk) < chunk_size:
-                    # Дополняем последний чанк нулями до нужного размера
-                    padding = np.zeros(chunk_size - len(chunk), dtype=np.int32)
-                    chunk = np.concatenate([chunk, padding])
-                
-                # Обработка чанка
-                phrases, state = self.pipeline.forward(chunk, state, is_last=is_last_chunk)
-                
-                for phrase in phrases:
-                    role = self.role_detector.detect_role(phrase.text)
-                    dialogue_log.append({
-                        "role": role.value,
-                        "text": phrase.text,
-                        "start": phrase.start_time,
-                        "end": phrase.end_time,
-                    })
-                    
-                    logger.info(f"📝 [{role.value}] {phrase.text}")
-            
-            logger.info(f"✅ Транскрибация завершена: {len(dialogue_log)} фраз")
-            
-            # Сохранение результата
-            video_title = Path(audio_path).stem
-            output_file_path = self._save_transcript(dialogue_log, video_title, output_format)
-            
-            logger.info(f"✅ Транскрипция сохранена: {output_file_path}")
-            return dialogue_log, output_file_path
-            
+            # Аудио читается по чанкам, целиком в память файл не загружается
+            return self._transcribe_source(
+                lambda: self.read_audio_chunks(audio_path, self.pipeline.CHUNK_SIZE),
+                Path(audio_path).stem,
+                output_format,
+                stats,
+                alias=self._file_alias(audio_path, stats),
+                on_event=on_event,
+                duration=self.probe_duration(audio_path)
+            )
+
         except Exception as e:
             logger.error(f"❌ Ошибка транскрибации аудио: {e}")
             raise
-    
-    def _save_transcript(self, dialogue_log: List[Dict[str, Any]], video_title: str, output_format: str) -> Path:
-        """Сохраняет транскрипцию в указанном формате"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        if output_format == "txt":
-            filename = f"{video_title}_transcription_{timestamp}.txt"
-            filepath = self.output_dir / filename
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(f"Транскрипция видео: {video_title}\n")
-                f.write("=" * 50 + "\n\n")
-                
-                for entry in dialogue_log:
-                    time_str = f"{entry['start']:.2f}s - {entry['end']:.2f}s"
-                    f.write(f"[{time_str}] [{entry['role']}] {entry['text']}\n")
-            
-            return filepath
-            
-        elif output_format == "json":
-            filename = f"{video_title}_transcription_{timestamp}.json"
-            filepath = self.output_dir / filename
-            
-            transcript_data = {
-                "video_title": video_title,
-                "timestamp": timestamp,
-                "total_phrases": len(dialogue_log),
-                "phrases": dialogue_log
-            }
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(transcript_data, f, ensure_ascii=False, indent=2)
-            
-            return filepath
-            
+
+    def _transcribe_source(self, open_chunks: Callable[[], Iterator[np.ndarray]], video_title: str, output_format: str,
+                           stats: Optional[Dict[str, Any]] = None, alias: Optional[str] = None,
+                           on_event: Optional[EventCallback] = None,
+                           duration: Optional[float] = None) -> tuple[PhraseLog, Path]:
+        """Транскрибирует источник чанков, используя кэш транскрипций, если он включен
+
+        Готовая запись ищется по псевдониму alias (ключ видео URL или хэш байтов файла), без декодирования.
+        Иначе источник открывается один раз: хэш PCM для ключа кэша считается во время распознавания,
+        чтобы декодирование шло параллельно с моделью, а первая фраза не ждала отдельного прохода
+        по аудио; запись сохраняется в кэш под этим ключом и связывается с alias.
+        Известная длительность duration позволяет сообщать в on_event реальный прогресс.
+        """
+        total_chunks = None
+        if duration:
+            total_chunks = max(1, int(np.ceil(duration * SAMPLE_RATE / self.pipeline.CHUNK_SIZE)))
+        if stats is None:
+            stats = {}
+        stats["cache_hit"] = False
+
+        if self.cache is None:
+            return self._transcribe_chunks(open_chunks(), video_title, output_format, on_event, total_chunks, stats)
+
+        if alias:
+            cached = self._cached_transcript(self.cache.resolve_alias(alias), video_title, output_format, stats)
+            if cached is not None:
+                return cached
+
+        hasher = self.cache.new_hasher()
+
+        def hashed_chunks() -> Iterator[np.ndarray]:
+            for chunk in open_chunks():
+                hasher.update(chunk.tobytes())
+                yield chunk
+
+        dialogue_log, output_file_path = self._transcribe_chunks(hashed_chunks(), video_title, output_format, on_event, total_chunks, stats)
+        self._store_in_cache(hasher.hexdigest(), dialogue_log, alias)
+        return dialogue_log, output_file_path
+
+    def _file_alias(self, media_path: str, stats: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Псевдоним кэша по байтам локального файла; None без кэша"""
+        if self.cache is None:
+            return None
+        with stage_timer(stats, "hash"):
+            return file_alias(media_path)
+
+    def _cached_transcript(self, cache_key: Optional[str], video_title: str, output_format: str,
+                           stats: Dict[str, Any]) -> Optional[tuple[PhraseLog, Path]]:
+        """Результат из кэша транскрипций (с сохранением в нужном формате) или None"""
+        dialogue_log = self.cache.get(cache_key) if cache_key else None
+        if dialogue_log is None:
+            return None
+
+        stats["cache_hit"] = True
+        logger.info(f"⚡ Транскрипция найдена в кэше: {len(dialogue_log)} фраз")
+        with stage_timer(stats, "save"):
+            output_file_path = self._save_transcript(dialogue_log, video_title, output_format)
+        logger.info(f"✅ Транскрипция сохранена: {output_file_path}")
+        return dialogue_log, output_file_path
+
+    def _store_in_cache(self, cache_key: str, dialogue_log: PhraseLog, alias: Optional[str]):
+        self.cache.put(cache_key, dialogue_log)
+        if alias:
+            self.cache.put_alias(alias, cache_key)
+
+    def _transcribe_chunks(self, chunks: Iterable[np.ndarray], video_title: str, output_format: str,
+                           on_event: Optional[EventCallback] = None,
+                           total_chunks: Optional[int] = None,
+                           stats: Optional[Dict[str, Any]] = None) -> tuple[PhraseLog, Path]:
+        """Прогоняет чанки размера CHUNK_SIZE через пайплайн и сохраняет результат
+
+        Каждая фраза сразу передается в on_event("phrase", ...) и дописывается в файл результата,
+        прогресс - в on_event("progress", ...). Файл готов сразу после последнего чанка.
+        """
+        writer = open_transcript_writer(self.output_dir, video_title, output_format)
+        try:
+            dialogue_log = self._recognize_chunks(chunks, on_event, total_chunks, stats, writer)
+        except Exception:
+            writer.abort()
+            raise
+        logger.info(f"✅ Транскрибация завершена: {len(dialogue_log)} фраз")
+
+        with stage_timer(stats, "save"):
+            output_file_path = writer.close()
+        logger.info(f"✅ Транскрипция сохранена: {output_file_path}")
+        return dialogue_log, output_file_path
+
+    def _recognize_chunks(self, chunks: Iterable[np.ndarray], on_event: Optional[EventCallback] = None,
+                          total_chunks: Optional[int] = None, stats: Optional[Dict[str, Any]] = None,
+                          writer: Optional[TranscriptWriter] = None,
+                          skipped_ranges: Optional[List[Tuple[float, float]]] = None) -> PhraseLog:
+        """Распознает чанки с новым состоянием пайплайна и возвращает dialogue_log; фразы сразу пишутся в writer
+
+        При включенном пропуске тишины (vad_threshold) после VAD_HANGOVER_CHUNKS тихих чанков подряд
+        поток пайплайна завершается нулевым чанком с is_last=True, следующие тихие чанки не распознаются,
+        а с первым громким чанком начинается новый поток - с последним пропущенным чанком в качестве
+        предзаписи, чтобы не потерять начало речи.
+        Время фраз нового потока сдвигается на его начало. В stats записываются длительность аудио,
+        доля пропущенной тишины и время этапов decode, forward, roles и save; в skipped_ranges,
+        если передан, добавляются интервалы (сек от первого чанка), не поданные в пайплайн.
+        """
+        dialogue_log = PhraseLog()
+        state = None  # Инициализируем состояние для потоковой обработки
+        chunks_processed = 0
+        last_progress_time = 0.0
+        chunk_seconds = self.pipeline.CHUNK_SIZE / SAMPLE_RATE
+        # Начало текущего потока пайплайна в чанках от начала записи
+        stream_start = 0
+        chunks_fed = 0
+        silent_run = 0
+        skipping = False
+        skipped_from = 0
+        preroll: Optional[np.ndarray] = None
+        # Чанки источника переиспользуют буферы (ChunkFramer), предзапись хранится в своем
+        preroll_buffer = np.zeros(self.pipeline.CHUNK_SIZE, dtype=np.int32)
+
+        if self.batcher is not None:
+            stream, forward = self.batcher.stream(), self.batcher.forward
         else:
-            raise ValueError(f"Неподдерживаемый формат: {output_format}")
+            stream, forward = nullcontext(), self.pipeline.forward
+
+        def run(chunk: np.ndarray, is_last: bool, audio: bool = True):
+            nonlocal state, chunks_fed
+            with stage_timer(stats, "forward"):
+                phrases, state = forward(chunk, state, is_last=is_last)
+            if audio:
+                chunks_fed += 1
+
+            offset = stream_start * chunk_seconds
+            for phrase in phrases:
+                with stage_timer(stats, "roles"):
+                    entry = self.phrase_entry(phrase)
+                entry["start"] += offset
+                entry["end"] += offset
+                dialogue_log.append(entry)
+                if writer:
+                    with stage_timer(stats, "save"):
+                        writer.write(entry)
+
+                logger.info(f"📝 [{entry['role']}] {phrase.text}")
+                if on_event:
+                    on_event("phrase", entry)
+
+        with stream:
+            for chunk, is_last_chunk in iter_with_last_flag(timed_iter(chunks, stats, "decode")):
+                index = chunks_processed
+                chunks_processed += 1
+
+                if self.vad_threshold is None:
+                    # Обработка чанка
+                    run(chunk, is_last_chunk)
+                else:
+                    silent = self._is_silent(chunk)
+                    silent_run = silent_run + 1 if silent else 0
+                    if skipping and silent:
+                        # Тишина после закрытого потока: в пайплайн не подаем
+                        np.copyto(preroll_buffer, chunk)
+                        preroll = preroll_buffer
+                    elif skipping:
+                        # Речь после пропуска: новый поток начинается с предзаписи
+                        skipping, state = False, None
+                        stream_start = index - 1 if preroll is not None else index
+                        if skipped_ranges is not None and stream_start > skipped_from:
+                            skipped_ranges.append((skipped_from * chunk_seconds, stream_start * chunk_seconds))
+                        if preroll is not None:
+                            run(preroll, False)
+                        run(chunk, is_last_chunk)
+                    elif silent_run > VAD_HANGOVER_CHUNKS and not is_last_chunk:
+                        # Достаточно долгая тишина: завершаем фразы потока и начинаем пропуск
+                        run(np.zeros_like(chunk), True, audio=False)
+                        np.copyto(preroll_buffer, chunk)
+                        skipping, state, preroll = True, None, preroll_buffer
+                        skipped_from = index
+                    else:
+                        run(chunk, is_last_chunk)
+
+                if on_event and (is_last_chunk or time.monotonic() - last_progress_time >= PROGRESS_INTERVAL):
+                    last_progress_time = time.monotonic()
+                    if is_last_chunk:
+                        known_total = chunks_processed
+                    elif total_chunks:
+                        # Длительность оценена заранее и может быть неточной - не даем счетчику обогнать итог
+                        known_total = max(total_chunks, chunks_processed)
+                    else:
+                        known_total = None
+                    on_event("progress", {"chunks_processed": chunks_processed, "total_chunks": known_total})
+
+        if skipping and skipped_ranges is not None:
+            skipped_ranges.append((skipped_from * chunk_seconds, chunks_processed * chunk_seconds))
+        if stats is not None:
+            stats["audio_seconds"] = round(chunks_processed * chunk_seconds, 2)
+            stats["skipped_seconds"] = round((chunks_processed - chunks_fed) * chunk_seconds, 2)
+            stats["skipped_ratio"] = round(1 - chunks_fed / chunks_processed, 3) if chunks_processed else 0.0
+        return dialogue_log
+
+    def _is_silent(self, chunk: np.ndarray) -> bool:
+        """Тихий ли чанк: RMS ниже vad_threshold"""
+        samples = chunk.astype(np.float32)
+        return float(np.dot(samples, samples)) / len(samples) < self.vad_threshold ** 2
+
+    def transcribe_segment(self, media_path: str, start: float, end: float,
+                           stats: Optional[Dict[str, Any]] = None) -> PhraseLog:
+        """Распознает отрезок [start, end) сек файла с собственным состоянием пайплайна
+
+        Время фраз отсчитывается от начала файла, результат не сохраняется. В stats["skipped_ranges"]
+        записываются пропущенные интервалы тишины (сек от начала файла).
+        """
+        if not self.pipeline or not self.role_detector:
+            raise Exception("Пайплайн T-one не инициализирован.")
+
+        logger.info(f"✂️ Транскрибация отрезка {start:.1f}-{end:.1f} сек: {media_path}")
+        skipped_ranges: List[Tuple[float, float]] = []
+        dialogue_log = self._recognize_chunks(
+            self.read_audio_chunks(media_path, self.pipeline.CHUNK_SIZE, start, end - start),
+            stats=stats,
+            skipped_ranges=skipped_ranges
+        )
+        dialogue_log.shift(start)
+        if stats is not None:
+            stats["skipped_ranges"] = [(start + skip_start, start + skip_end) for skip_start, skip_end in skipped_ranges]
+        return dialogue_log
+
+    def transcribe_segmented(self, media_path: str, output_format: str,
+                             run_segments: Callable[[List[Dict[str, float]], Callable[[int], None]],
+                                                    List[Tuple[PhraseLog, Dict[str, Any]]]],
+                             segment_seconds: float, overlap: float, stats: Optional[Dict[str, Any]] = None,
+                             on_event: Optional[EventCallback] = None) -> tuple[PhraseLog, Path]:
+        """Транскрибирует длинный файл отрезками, распознаваемыми параллельно
+
+        Файл делится на отрезки около segment_seconds по самым тихим местам с перекрытием overlap;
+        run_segments(segments, on_segment_done) распознает их (например, в разных процессах
+        через transcribe_segment) и возвращает фразы и статистику каждого отрезка. Фразы склеиваются
+        с удалением дублей в перекрытиях. Пайплайн в этом процессе не нужен: кэш транскрипций,
+        разбиение, склейка и сохранение выполняются здесь, распознавание - в run_segments.
+        """
+        started = time.monotonic()
+        chunk_size = self.pipeline.CHUNK_SIZE if self.pipeline else StreamingCTCPipeline.CHUNK_SIZE
+        if stats is None:
+            stats = {}
+        stats["cache_hit"] = False
+        video_title = Path(media_path).stem
+
+        # Псевдоним тот же, что у последовательной транскрибации этого файла, и по нему находится
+        # результат любого из двух способов. Хэш PCM отрезки не считают (это был бы лишний проход
+        # декодирования), а склейка отрезков дает не совсем тот же результат, что сплошной проход,
+        # поэтому запись ключуется псевдонимом и параметрами разбиения, а не хэшем PCM
+        alias = self._file_alias(media_path, stats)
+        if alias is not None:
+            cached = self._cached_transcript(self.cache.resolve_alias(alias), video_title, output_format, stats)
+            if cached is not None:
+                finish_job_stats(stats, time.monotonic() - started)
+                return cached
+
+        duration = self.probe_duration(media_path)
+        if not duration:
+            raise Exception("Не удалось определить длительность файла.")
+
+        segments = plan_segments(
+            duration,
+            segment_seconds,
+            overlap,
+            lambda start, length: next(self.read_audio_chunks(media_path, int(length * SAMPLE_RATE), start, length)),
+            SAMPLE_RATE
+        )
+        stats["segments"] = len(segments)
+        logger.info(f"✂️ {media_path}: {duration:.0f} сек, {len(segments)} отрезков по ~{segment_seconds:.0f} сек")
+
+        segment_chunks = [int(np.ceil((s["end"] - s["start"]) * SAMPLE_RATE / chunk_size)) for s in segments]
+        total_chunks = sum(segment_chunks)
+        processed = [0]
+
+        def on_segment_done(index: int):
+            processed[0] += segment_chunks[index]
+            if on_event:
+                on_event("progress", {"chunks_processed": processed[0], "total_chunks": total_chunks})
+
+        results = run_segments(segments, on_segment_done)
+        dialogue_log = merge_segments(segments, [entries for entries, _ in results])
+        # Отрезки распознаются с перекрытием, поэтому длительность берется у файла,
+        # а пропущенная тишина считается только в собственных границах каждого отрезка
+        audio_seconds = duration
+        skipped_seconds = sum(
+            owned_seconds(segment, segment_stats.get("skipped_ranges", []))
+            for segment, (_, segment_stats) in zip(segments, results)
+        )
+        stats["audio_seconds"] = round(audio_seconds, 2)
+        stats["skipped_seconds"] = round(skipped_seconds, 2)
+        stats["skipped_ratio"] = round(skipped_seconds / audio_seconds, 3) if audio_seconds else 0.0
+        # Время этапов отрезков суммируется: при параллельном распознавании сумма больше общего времени задачи
+        for _, segment_stats in results:
+            for stage, seconds in segment_stats.get("stages", {}).items():
+                add_stage_time(stats, stage, seconds)
+        logger.info(f"✅ Транскрибация завершена: {len(dialogue_log)} фраз")
+        if on_event:
+            for entry in dialogue_log:
+                on_event("phrase", entry)
+
+        with stage_timer(stats, "save"):
+            output_file_path = self._save_transcript(dialogue_log, video_title, output_format)
+        logger.info(f"✅ Транскрипция сохранена: {output_file_path}")
+        if alias is not None:
+            hasher = self.cache.new_hasher()
+            hasher.update(f"{alias}:segments:{segment_seconds:g}:{overlap:g}".encode("utf-8"))
+            self._store_in_cache(hasher.hexdigest(), dialogue_log, alias)
+        finish_job_stats(stats, time.monotonic() - started)
+        return dialogue_log, output_file_path
+
+    def phrase_entry(self, phrase: TextPhrase) -> Dict[str, Any]:
+        """Запись dialogue_log для распознанной фразы с ролью говорящего"""
+        role = self.role_detector.detect_role(phrase.text)
+        return {
+            "role": role.value,
+            "text": phrase.text,
+            "start": phrase.start_time,
+            "end": phrase.end_time,
+        }
+
+    def _save_transcript(self, dialogue_log: PhraseLog, video_title: str, output_format: str) -> Path:
+        """Сохраняет готовую транскрипцию в указанном формате"""
+        writer = open_transcript_writer(self.output_dir, video_title, output_format)
+        try:
+            writer.write_all(dialogue_log)
+        except Exception:
+            writer.abort()
+            raise
+        return writer.close()
     
-    def transcribe_video(self, video_input: str, output_format: str = "txt") -> tuple[List[Dict[str, Any]], Path]:
-        """Основной метод для транскрибации видео (URL или локальный файл)"""
+    def transcribe_video(self, video_input: str, output_format: str = "txt", streaming: bool = True,
+                         stats: Optional[Dict[str, Any]] = None,
+                         on_event: Optional[EventCallback] = None) -> tuple[PhraseLog, Path]:
+        """Основной метод для транскрибации видео (URL или локальный файл)
+
+        В потоковом режиме (streaming=True) локальный файл декодируется ffmpeg прямо в пайплайн,
+        без промежуточного WAV. Если передан словарь stats, в него записывается статистика обработки
+        (в том числе время этапов и коэффициент реального времени), а on_event получает фразы
+        и прогресс по мере распознавания.
+        """
         if not self.init_pipeline():
             raise Exception("Не удалось инициализировать пайплайн T-one.")
-        
+
+        if stats is None:
+            stats = {}
+        started = time.monotonic()
+        result = self._transcribe_input(video_input, output_format, streaming, stats, on_event)
+        finish_job_stats(stats, time.monotonic() - started)
+        return result
+
+    def _transcribe_input(self, video_input: str, output_format: str, streaming: bool,
+                          stats: Dict[str, Any], on_event: Optional[EventCallback]) -> tuple[PhraseLog, Path]:
+        """Выбор способа транскрибации по типу входа"""
         # Определяем тип входа
-        if video_input.startswith(('http://', 'https://')):
+        if video_input.startswith(('http://', 'https://')) and (streaming or self.download_cache is not None):
+            # Это URL - кэши, прогрессивная транскрибация или скачивание
+            return self._transcribe_url(video_input, output_format, stats, progressive=streaming and self.progressive,
+                                        on_event=on_event)
+        elif video_input.startswith(('http://', 'https://')):
             # Это URL - скачиваем видео
-            audio_path = self.download_video_audio(video_input)
+            with stage_timer(stats, "download"):
+                audio_path = self.download_video_audio(video_input)
+        elif streaming:
+            # Локальный файл - декодируем и распознаем одновременно
+            return self.transcribe_video_stream(video_input, output_format, stats, on_event)
         else:
             # Это локальный файл - извлекаем аудио
-            audio_path = self.extract_audio_from_video(video_input)
+            with stage_timer(stats, "extract"):
+                audio_path = self.extract_audio_from_video(video_input)
         
         if not audio_path:
             raise Exception("Не удалось получить аудио из видео.")
         
         try:
-            return self.transcribe_audio_file(audio_path, output_format)
+            return self.transcribe_audio_file(audio_path, output_format, stats, on_event)
         finally:
             # Очищаем временные файлы
             if Path(audio_path).exists():
                 os.remove(audio_path)
     
+    def _transcribe_url(self, video_url: str, output_format: str, stats: Optional[Dict[str, Any]] = None,
+                        progressive: bool = True,
+                        on_event: Optional[EventCallback] = None) -> tuple[PhraseLog, Path]:
+        """Транскрибация URL: кэш транскрипций, затем прогрессивный режим или скачивание (через кэш скачиваний)
+
+        В прогрессивном режиме ffmpeg читает медиапоток напрямую, и распознавание идет
+        параллельно с получением данных, без ожидания полного скачивания.
+        """
+        if stats is None:
+            stats = {}
+
+        try:
+            with stage_timer(stats, "metadata"), \
+                    yt_dlp.YoutubeDL({'format': 'bestaudio/best', 'noplaylist': True, 'quiet': True}) as ydl:
+                info_dict = ydl.extract_info(video_url, download=False)
+            cache_key = DownloadCache.make_key(info_dict)
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения информации о видео: {e}")
+            raise Exception("Не удалось получить аудио из видео.")
+
+        video_title = yt_dlp.utils.sanitize_filename(info_dict.get('title') or cache_key)
+        if self.cache is not None:
+            # Повторный URL находится в кэше транскрипций без скачивания и декодирования
+            stats["cache_hit"] = False
+            cached = self._cached_transcript(self.cache.resolve_alias(cache_key), video_title, output_format, stats)
+            if cached is not None:
+                return cached
+
+        return self._transcribe_url_media(video_url, info_dict, cache_key, video_title, output_format, stats,
+                                          progressive, on_event)
+
+    def _transcribe_url_media(self, video_url: str, info_dict: Dict[str, Any], cache_key: str, video_title: str,
+                              output_format: str, stats: Dict[str, Any], progressive: bool,
+                              on_event: Optional[EventCallback]) -> tuple[PhraseLog, Path]:
+        """Транскрибация медиапотока URL: прогрессивно или после скачивания (через кэш скачиваний)"""
+        already_downloaded = self.download_cache is not None and self.download_cache.contains(cache_key)
+        if progressive and not already_downloaded and info_dict.get('url') \
+                and info_dict.get('protocol') in PROGRESSIVE_PROTOCOLS:
+            logger.info(f"🌊 Прогрессивная транскрибация: {video_url}")
+            return self._transcribe_source(
+                lambda: self.stream_audio_from_video(
+                    info_dict['url'], self.pipeline.CHUNK_SIZE, info_dict.get('http_headers')
+                ),
+                video_title,
+                output_format,
+                stats,
+                alias=cache_key,
+                on_event=on_event,
+                duration=info_dict.get('duration')
+            )
+
+        def transcribe_downloaded(audio_path: Optional[str]) -> tuple[PhraseLog, Path]:
+            if not audio_path:
+                raise Exception("Не удалось получить аудио из видео.")
+            logger.info(f"🎤 Транскрибация аудио: {audio_path}")
+            return self._transcribe_source(
+                lambda: self.read_audio_chunks(audio_path, self.pipeline.CHUNK_SIZE),
+                Path(audio_path).stem,
+                output_format,
+                stats,
+                alias=cache_key,
+                on_event=on_event,
+                duration=self.probe_duration(audio_path) or info_dict.get('duration')
+            )
+
+        if self.download_cache is not None:
+            # Берем аудио из кэша или скачиваем один раз на все одновременные запросы
+            def download(target_dir: Path) -> Optional[str]:
+                with stage_timer(stats, "download"):
+                    return self.download_video_audio(video_url, target_dir, info_dict=info_dict)
+
+            with self.download_cache.entry(cache_key, download) as audio_path:
+                return transcribe_downloaded(audio_path)
+
+        with stage_timer(stats, "download"):
+            audio_path = self.download_video_audio(video_url, info_dict=info_dict)
+        try:
+            return transcribe_downloaded(audio_path)
+        finally:
+            if audio_path and Path(audio_path).exists():
+                os.remove(audio_path)
+
     def cleanup(self):
         """Очистка временных файлов"""
         if self.temp_dir.exists():
@@ -246,13 +902,160 @@ class StreamingVideoTranscriber:
             shutil.rmtree(self.temp_dir)
             logger.info(f"🧹 Временная директория очищена: {self.temp_dir}")
 
-if __name__ == "__main__":
-    # Тестирование
-    transcriber = StreamingVideoTranscriber()
-    
+# Расширения медиафайлов, которые CLI берет из каталога
+MEDIA_EXTENSIONS = {
+    ".mp4", ".mkv", ".avi", ".mov", ".webm", ".flv", ".wmv", ".m4v", ".ts",
+    ".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus", ".aac", ".wma",
+}
+
+# Транскрибатор процесса-воркера CLI
+_cli_transcriber: Optional[StreamingVideoTranscriber] = None
+
+
+def positive_int(value: str) -> int:
+    """Тип аргумента CLI: целое число не меньше 1"""
     try:
-        # Пример использования
-        print("🎬 Тестирование транскрибатора...")
-        # Здесь можно добавить тестовый код
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается целое число: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"должно быть не меньше 1: {number}")
+    return number
+
+
+def find_media_files(inputs: List[str], recursive: bool = False) -> List[Path]:
+    """Медиафайлы из списка файлов, каталогов и glob-шаблонов, без повторов, в порядке имен"""
+    files = []
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            candidates = path.rglob("*") if recursive else path.iterdir()
+            files.extend(sorted(p for p in candidates if p.is_file() and p.suffix.lower() in MEDIA_EXTENSIONS))
+        elif path.is_file():
+            files.append(path)
+        else:
+            files.extend(sorted(Path(p) for p in glob.glob(item, recursive=recursive) if Path(p).is_file()))
+    return list(dict.fromkeys(p.resolve() for p in files))
+
+
+def cli_output_name(media_path: Path, output_format: str) -> str:
+    """Имя результата CLI: имя файла и хэш его полного пути, чтобы одноименные файлы из разных каталогов не совпадали"""
+    path_hash = hashlib.sha256(str(media_path.resolve()).encode("utf-8")).hexdigest()[:10]
+    return f"{media_path.stem}_{path_hash}_transcription.{output_format}"
+
+
+def existing_output(output_dir: Path, media_path: Path, output_format: str) -> Optional[Path]:
+    """Готовый результат для файла от прошлого запуска (файлы .part не считаются)"""
+    output_path = output_dir / cli_output_name(media_path, output_format)
+    return output_path if output_path.is_file() else None
+
+
+def _cli_init_worker(output_dir: str, log_level: int, threads: int):
+    global _cli_transcriber
+    logging.basicConfig(level=log_level, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    _cli_transcriber = StreamingVideoTranscriber(output_dir=output_dir)
+    # Процессы пула завершаются без atexit, временные файлы чистим через финализатор multiprocessing
+    util.Finalize(_cli_transcriber, _cli_transcriber.cleanup, exitpriority=10)
+    _cli_transcriber.init_pipeline(use_gpu=False, threads=threads)
+
+
+def _cli_transcribe(media_path: str, output_format: str) -> Dict[str, Any]:
+    """Транскрибация одного файла в воркере CLI: путь результата, длительность аудио и время обработки"""
+    stats: Dict[str, Any] = {}
+    started = time.monotonic()
+    dialogue_log, output_path = _cli_transcriber.transcribe_video(media_path, output_format, stats=stats)
+    # Результат переименовывается в постоянное имя только целиком: по нему запуск и возобновляется
+    final_path = _cli_transcriber.output_dir / cli_output_name(Path(media_path), output_format)
+    os.replace(output_path, final_path)
+    audio_seconds = stats.get("audio_seconds")
+    if audio_seconds is None:
+        # Результат из кэша транскрипций: аудио не декодировалось
+        audio_seconds = _cli_transcriber.probe_duration(media_path) or 0.0
+    return {
+        "output_path": str(final_path),
+        "phrases": len(dialogue_log),
+        "audio_seconds": audio_seconds,
+        "seconds": time.monotonic() - started,
+        "cache_hit": stats.get("cache_hit", False),
+    }
+
+
+def main():
+    """Пакетная транскрибация файлов без веб-сервиса: пул процессов, по пайплайну на процесс"""
+    # pipeline_pool сам импортирует этот модуль
+    from pipeline_pool import default_workers, default_worker_threads
+
+    parser = argparse.ArgumentParser(description="Пакетная транскрибация медиафайлов")
+    parser.add_argument("inputs", nargs="+", help="Файлы, каталоги или glob-шаблоны (например, 'archive/**/*.mp3')")
+    parser.add_argument("-o", "--output-dir", default="transcriptions", help="Каталог результатов (по умолчанию transcriptions)")
+    parser.add_argument("-f", "--format", default="txt", choices=["txt", "json", "jsonl"], help="Формат результата")
+    parser.add_argument("-w", "--workers", type=positive_int, default=default_workers(),
+                        help="Число процессов (по умолчанию TRANSCRIBER_WORKERS или число ядер)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Обходить подкаталоги и ** в шаблонах")
+    parser.add_argument("--force", action="store_true", help="Транскрибировать и файлы, для которых результат уже есть")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Подробный лог обработки (каждая фраза)")
+    args = parser.parse_args()
+
+    log_level = logging.INFO if args.verbose else logging.WARNING
+    logging.basicConfig(level=log_level, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    media_files = find_media_files(args.inputs, args.recursive)
+    if not media_files:
+        print("❌ Медиафайлы не найдены")
+        return 1
+
+    # Возобновление: файлы с готовым результатом пропускаются
+    pending = [
+        path for path in media_files
+        if args.force or existing_output(output_dir, path, args.format) is None
+    ]
+    skipped = len(media_files) - len(pending)
+    print(f"🎬 Файлов: {len(media_files)}, уже готово: {skipped}, к обработке: {len(pending)}, процессов: {args.workers}")
+    if not pending:
+        return 0
+
+    started = time.monotonic()
+    audio_total = 0.0
+    failed = 0
+    workers = min(args.workers, len(pending))
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_cli_init_worker,
+        initargs=(str(output_dir), log_level, default_worker_threads(workers))
+    )
+    try:
+        futures = {executor.submit(_cli_transcribe, str(path), args.format): path for path in pending}
+        for done, future in enumerate(as_completed(futures), start=1):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ [{done}/{len(pending)}] {path.name}: {e}")
+                continue
+
+            audio_total += result["audio_seconds"]
+            speed = result["audio_seconds"] / result["seconds"] if result["seconds"] else 0.0
+            source = ", из кэша" if result["cache_hit"] else ""
+            print(f"✅ [{done}/{len(pending)}] {path.name}: {result['phrases']} фраз, "
+                  f"{result['audio_seconds']:.0f} сек аудио за {result['seconds']:.1f} сек ({speed:.1f}x{source}) "
+                  f"-> {result['output_path']}")
+    except KeyboardInterrupt:
+        print("⏹️ Остановлено; готовые файлы будут пропущены при следующем запуске")
+        return 130
     finally:
-        transcriber.cleanup()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    elapsed = time.monotonic() - started
+    print("=" * 60)
+    print(f"📊 Готово: {len(pending) - failed}, ошибок: {failed}, пропущено: {skipped}")
+    print(f"📊 Аудио: {audio_total:.0f} сек за {elapsed:.1f} сек - "
+          f"{audio_total / elapsed if elapsed else 0.0:.2f} сек аудио в секунду")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+Хранилище задач транскрибации: SQLite (переживает перезапуск, общее для процессов) или память
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+logger = logging.getLogger(__name__)
+
+# Статусы задач, которые еще не завершились
+ACTIVE_STATUSES = ("queued", "processing")
+
+
+def default_task_ttl() -> float:
+    """Сколько секунд хранится завершенная задача: TASK_TTL (по умолчанию 7 дней, 0 - без ограничения)"""
+    return float(os.environ.get("TASK_TTL", str(7 * 24 * 3600)))
+
+
+def default_max_tasks() -> int:
+    """Сколько последних завершенных задач хранится: TASK_MAX_COUNT (по умолчанию 1000, 0 - без ограничения)"""
+    return max(0, int(os.environ.get("TASK_MAX_COUNT", "1000")))
+
+
+def default_janitor_interval() -> float:
+    """Период очистки устаревших задач: TASK_JANITOR_INTERVAL (по умолчанию 300 сек)"""
+    return max(1.0, float(os.environ.get("TASK_JANITOR_INTERVAL", "300")))
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def summarize_task(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Копия задачи без полного транскрипта в результате"""
+    summary = dict(task)
+    if summary.get("result"):
+        summary["result"] = {k: v for k, v in summary["result"].items() if k != "transcript"}
+    return summary
+
+
+class TaskStore(ABC):
+    """Интерфейс хранилища задач; задача - словарь с полями id, status, start_time и произвольными остальными"""
+
+    @classmethod
+    def from_env(cls) -> "TaskStore":
+        """Хранилище по настройкам окружения: TASK_STORE=sqlite (по умолчанию) или memory"""
+        kind = os.environ.get("TASK_STORE", "sqlite").lower()
+        if kind == "memory":
+            return MemoryTaskStore(os.environ.get("TASK_RESULTS_DIR", "data/results"))
+        if kind == "sqlite":
+            return SQLiteTaskStore(os.environ.get("TASK_STORE_PATH", "data/tasks.db"))
+        raise ValueError(f"Неизвестное хранилище задач: {kind}")
+
+    @abstractmethod
+    def create(self, task: Dict[str, Any]):
+        ...
+
+    def create_many(self, tasks: List[Dict[str, Any]]):
+        """Создает задачи пакета разом"""
+        for task in tasks:
+            self.create(task)
+
+    @abstractmethod
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Копия задачи или None"""
+        ...
+
+    @abstractmethod
+    def update(self, task_id: str, **fields) -> Optional[Dict[str, Any]]:
+        """Обновляет поля задачи и возвращает ее новое состояние (None, если задачи нет)"""
+        ...
+
+    @abstractmethod
+    def delete(self, task_id: str):
+        ...
+
+    @abstractmethod
+    def list(self, statuses: Optional[List[str]] = None, limit: Optional[int] = None, offset: int = 0,
+             summary: bool = False, batch_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Задачи от новых к старым, при необходимости с фильтром по статусам и пакету; summary - без транскрипта"""
+        ...
+
+    @abstractmethod
+    def counts(self, batch_id: Optional[str] = None) -> Dict[str, int]:
+        """Число задач (всех или пакета batch_id) по статусам"""
+        ...
+
+    @abstractmethod
+    def create_batch(self, batch: Dict[str, Any]):
+        """Сохраняет пакет задач (поля id, created и произвольные остальные); задачи пакета ссылаются на него через batch_id"""
+        ...
+
+    @abstractmethod
+    def get_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def save_transcript(self, task_id: str, transcript: List[Dict[str, Any]]):
+        """Сохраняет транскрипт задачи отдельно от нее, чтобы задачи и их списки оставались легкими"""
+        ...
+
+    @abstractmethod
+    def load_transcript(self, task_id: str) -> Optional[List[Dict[str, Any]]]:
+        ...
+
+    @abstractmethod
+    def expire(self, ttl: float, max_finished: int) -> List[Dict[str, Any]]:
+        """Удаляет завершенные задачи старше ttl секунд и сверх max_finished последних; возвращает удаленные
+
+        Пакеты, у которых не осталось задач, удаляются вместе с ними.
+        """
+        ...
+
+    def recover_interrupted(self, message: str) -> List[Dict[str, Any]]:
+        """Незавершенные задачи процессов, которых больше нет: выполнявшиеся помечает ошибкой message,
+        а ожидавшие в очереди забирает этому процессу и возвращает в порядке создания для повторной постановки
+        """
+        return []
+
+    def close(self):
+        pass
+
+
+class MemoryTaskStore(TaskStore):
+    """Задачи в памяти процесса: теряются при перезапуске и не видны другим процессам
+
+    В памяти только метаданные задач, транскрипты лежат JSON файлами в results_dir.
+    """
+
+    def __init__(self, results_dir: str):
+        self.results_dir = Path(results_dir)
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._updated: Dict[str, float] = {}
+        self._batches: Dict[str, Dict[str, Any]] = {}
+
+    def create(self, task: Dict[str, Any]):
+        self._tasks[task["id"]] = dict(task)
+        self._updated[task["id"]] = time.time()
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        task = self._tasks.get(task_id)
+        return dict(task) if task is not None else None
+
+    def update(self, task_id: str, **fields) -> Optional[Dict[str, Any]]:
+        task = self._tasks.get(task_id)
+        if task is None:
+            return None
+        task.update(fields)
+        self._updated[task_id] = time.time()
+        return dict(task)
+
+    def delete(self, task_id: str):
+        self._tasks.pop(task_id, None)
+        self._updated.pop(task_id, None)
+        self._transcript_path(task_id).unlink(missing_ok=True)
+
+    def list(self, statuses: Optional[List[str]] = None, limit: Optional[int] = None, offset: int = 0,
+             summary: bool = False, batch_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        tasks = sorted(self._tasks.values(), key=lambda task: task["start_time"], reverse=True)
+        if batch_id is not None:
+            tasks = [task for task in tasks if task.get("batch_id") == batch_id]
+        if statuses is not None:
+            tasks = [task for task in tasks if task["status"] in statuses]
+        end = offset + limit if limit is not None else None
+        return [summarize_task(task) if summary else dict(task) for task in tasks[offset:end]]
+
+    def counts(self, batch_id: Optional[str] = None) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for task in self._tasks.values():
+            if batch_id is None or task.get("batch_id") == batch_id:
+                counts[task["status"]] = counts.get(task["status"], 0) + 1
+        return counts
+
+    def create_batch(self, batch: Dict[str, Any]):
+        self._batches[batch["id"]] = dict(batch)
+
+    def get_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        batch = self._batches.get(batch_id)
+        return dict(batch) if batch is not None else None
+
+    def _transcript_path(self, task_id: str) -> Path:
+        return self.results_dir / f"{task_id}.json"
+
+    def save_transcript(self, task_id: str, transcript: List[Dict[str, Any]]):
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.results_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(transcript, f, ensure_ascii=False)
+        os.replace(temp_path, self._transcript_path(task_id))
+
+    def load_transcript(self, task_id: str) -> Optional[List[Dict[str, Any]]]:
+        try:
+            with open(self._transcript_path(task_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def expire(self, ttl: float, max_finished: int) -> List[Dict[str, Any]]:
+        finished = sorted(
+            (task for task in self._tasks.values() if task["status"] not in ACTIVE_STATUSES),
+            key=lambda task: task["start_time"], reverse=True
+        )
+        deadline = time.time() - ttl
+        expired = [
+            task for index, task in enumerate(finished)
+            if (max_finished and index >= max_finished) or (ttl and self._updated[task["id"]] < deadline)
+        ]
+        for task in expired:
+            self.delete(task["id"])
+
+        if expired:
+            remaining = {task.get("batch_id") for task in self._tasks.values()}
+            for batch_id in [batch_id for batch_id in self._batches if batch_id not in remaining]:
+                del self._batches[batch_id]
+        return expired
+
+
+class SQLiteTaskStore(TaskStore):
+    """Задачи в SQLite (WAL): переживают перезапуск сервиса и общие для нескольких процессов uvicorn
+
+    Статус и время создания вынесены в индексированные столбцы, остальные поля задачи хранятся в JSON.
+    У каждого процесса свое соединение на поток; задача помнит создавший ее процесс (owner),
+    чтобы после перезапуска пометить ошибкой задачи, которые уже никто не выполнит, и поставить
+    заново те, что не успели начаться.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._local = threading.local()
+
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                " id TEXT PRIMARY KEY,"
+                " status TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " updated REAL NOT NULL,"
+                " owner TEXT NOT NULL,"
+                " batch_id TEXT,"
+                " data TEXT NOT NULL)"
+            )
+            # База, созданная до появления пакетов
+            if "batch_id" not in {row[1] for row in db.execute("PRAGMA table_info(tasks)")}:
+                db.execute("ALTER TABLE tasks ADD COLUMN batch_id TEXT")
+            db.execute("CREATE INDEX IF NOT EXISTS tasks_batch ON tasks (batch_id, status)")
+            db.execute("CREATE INDEX IF NOT EXISTS tasks_status_created ON tasks (status, created)")
+            db.execute("CREATE INDEX IF NOT EXISTS tasks_created ON tasks (created)")
+            db.execute("CREATE INDEX IF NOT EXISTS tasks_updated ON tasks (updated)")
+            # Транскрипты отдельно: чтение задачи и списков не разбирает их JSON
+            db.execute("CREATE TABLE IF NOT EXISTS transcripts (id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+            db.execute("CREATE TABLE IF NOT EXISTS batches (id TEXT PRIMARY KEY, created REAL NOT NULL, data TEXT NOT NULL)")
+        logger.info(f"🗄️ Хранилище задач SQLite: {self.path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _task_row(self, task: Dict[str, Any]) -> tuple:
+        now = time.time()
+        return (task["id"], task["status"], task.get("start_time", now), now, self.owner, task.get("batch_id"),
+                json.dumps(task, ensure_ascii=False))
+
+    def create(self, task: Dict[str, Any]):
+        self._connect().execute(
+            "INSERT INTO tasks (id, status, created, updated, owner, batch_id, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            self._task_row(task)
+        )
+
+    def create_many(self, tasks: List[Dict[str, Any]]):
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany(
+                "INSERT INTO tasks (id, status, created, updated, owner, batch_id, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [self._task_row(task) for task in tasks]
+            )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT data FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, task_id: str, **fields) -> Optional[Dict[str, Any]]:
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT data FROM tasks WHERE id = ?", (task_id,)).fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None
+            task = json.loads(row[0])
+            task.update(fields)
+            db.execute(
+                "UPDATE tasks SET status = ?, updated = ?, data = ? WHERE id = ?",
+                (task["status"], time.time(), json.dumps(task, ensure_ascii=False), task_id)
+            )
+            db.execute("COMMIT")
+            return task
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def delete(self, task_id: str):
+        db = self._connect()
+        db.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+        db.execute("DELETE FROM transcripts WHERE id = ?", (task_id,))
+
+    def list(self, statuses: Optional[List[str]] = None, limit: Optional[int] = None, offset: int = 0,
+             summary: bool = False, batch_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        # Транскрипт вырезается на стороне SQLite, чтобы не разбирать его JSON ради списка
+        column = "json_remove(data, '$.result.transcript')" if summary else "data"
+        conditions, params = [], []
+        if batch_id is not None:
+            conditions.append("batch_id = ?")
+            params.append(batch_id)
+        if statuses is not None:
+            conditions.append(f"status IN ({', '.join('?' for _ in statuses)})")
+            params += statuses
+        query = f"SELECT {column} FROM tasks"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY created DESC LIMIT ? OFFSET ?"
+        params += [limit if limit is not None else -1, offset]
+        return [json.loads(row[0]) for row in self._connect().execute(query, params)]
+
+    def counts(self, batch_id: Optional[str] = None) -> Dict[str, int]:
+        if batch_id is None:
+            rows = self._connect().execute("SELECT status, COUNT(*) FROM tasks GROUP BY status")
+        else:
+            rows = self._connect().execute(
+                "SELECT status, COUNT(*) FROM tasks WHERE batch_id = ? GROUP BY status", (batch_id,)
+            )
+        return {status: count for status, count in rows}
+
+    def create_batch(self, batch: Dict[str, Any]):
+        self._connect().execute(
+            "INSERT INTO batches (id, created, data) VALUES (?, ?, ?)",
+            (batch["id"], batch["created"], json.dumps(batch, ensure_ascii=False))
+        )
+
+    def get_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT data FROM batches WHERE id = ?", (batch_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_transcript(self, task_id: str, transcript: List[Dict[str, Any]]):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO transcripts (id, data) VALUES (?, ?)",
+            (task_id, json.dumps(transcript, ensure_ascii=False))
+        )
+
+    def load_transcript(self, task_id: str) -> Optional[List[Dict[str, Any]]]:
+        row = self._connect().execute("SELECT data FROM transcripts WHERE id = ?", (task_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def expire(self, ttl: float, max_finished: int) -> List[Dict[str, Any]]:
+        db = self._connect()
+        finished = f"status NOT IN ({', '.join('?' for _ in ACTIVE_STATUSES)})"
+        column = "json_remove(data, '$.result.transcript')"
+        rows = []
+        if ttl:
+            rows += db.execute(
+                f"SELECT id, {column} FROM tasks WHERE {finished} AND updated < ?",
+                (*ACTIVE_STATUSES, time.time() - ttl)
+            ).fetchall()
+        if max_finished:
+            rows += db.execute(
+                f"SELECT id, {column} FROM tasks WHERE {finished} ORDER BY created DESC LIMIT -1 OFFSET ?",
+                (*ACTIVE_STATUSES, max_finished)
+            ).fetchall()
+
+        expired = {task_id: json.loads(data) for task_id, data in rows}
+        if expired:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                for task_id in expired:
+                    db.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+                    db.execute("DELETE FROM transcripts WHERE id = ?", (task_id,))
+                db.execute(
+                    "DELETE FROM batches WHERE NOT EXISTS (SELECT 1 FROM tasks WHERE tasks.batch_id = batches.id)"
+                )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return list(expired.values())
+
+    def recover_interrupted(self, message: str) -> List[Dict[str, Any]]:
+        db = self._connect()
+        placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+        rows = db.execute(
+            f"SELECT id, status, owner FROM tasks WHERE status IN ({placeholders}) ORDER BY created", ACTIVE_STATUSES
+        ).fetchall()
+
+        interrupted = 0
+        requeued = []
+        for task_id, status, owner in rows:
+            pid = int(owner.split(":", 1)[0])
+            # Тот же PID с другой меткой - прежний процесс, PID которого достался нам (например, PID 1 в контейнере)
+            if owner == self.owner or (pid != os.getpid() and _process_alive(pid)):
+                continue
+            if status != "queued":
+                self.update(task_id, status="error", message=message, progress=0)
+                interrupted += 1
+                continue
+            # Несколько процессов сервиса могут восстанавливаться одновременно: задачу забирает один
+            claimed = db.execute(
+                "UPDATE tasks SET owner = ?, updated = ? WHERE id = ? AND owner = ? AND status = 'queued'",
+                (self.owner, time.time(), task_id, owner)
+            ).rowcount
+            if claimed:
+                task = self.get(task_id)
+                if task is not None:
+                    requeued.append(task)
+        if interrupted or requeued:
+            logger.info(f"🗄️ После перезапуска: прервано задач {interrupted}, снова в очереди {len(requeued)}")
+        return requeued
+
+    def close(self):
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Кэш транскрипций по содержимому аудио
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from importlib import metadata
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+
+from phrase_log import PhraseLog
+
+logger = logging.getLogger(__name__)
+
+# Блок чтения файла при подсчете его хэша
+FILE_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def model_version() -> str:
+    """Версия модели для ключа кэша: TRANSCRIBER_MODEL_VERSION или версия пакета tone"""
+    value = os.environ.get("TRANSCRIBER_MODEL_VERSION")
+    if value:
+        return value
+    try:
+        return metadata.version("tone")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def file_alias(path: str) -> str:
+    """Псевдоним записи кэша по байтам файла: чтение файла намного дешевле его декодирования"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(FILE_HASH_BLOCK_SIZE):
+            hasher.update(block)
+    return f"file:{hasher.hexdigest()}"
+
+
+class TranscriptCache:
+    """Дисковый кэш dialogue_log, адресуемый хэшем декодированного PCM 8 kHz и версиями модели и пайплайна
+
+    Ключ считается во время распознавания, поэтому до него запись находится по псевдониму:
+    ключу видео для URL или хэшу байтов локального файла (file_alias).
+    Каждая запись - отдельный JSON файл; время изменения файла обновляется при чтении,
+    и при превышении max_bytes удаляются давно не использованные записи (LRU).
+    Псевдонимы - маленькие файлы со ссылкой на ключ записи; они входят в размер кэша
+    и удаляются вместе с записью, на которую указывают.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, pipeline_version: str):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.version = f"{model_version()}:{pipeline_version}"
+
+    @classmethod
+    def from_env(cls, pipeline_version: str) -> Optional["TranscriptCache"]:
+        """Кэш по настройкам окружения; None, если TRANSCRIPT_CACHE=0"""
+        if os.environ.get("TRANSCRIPT_CACHE", "1").lower() in ("0", "false", "no"):
+            return None
+        return cls(
+            cache_dir=os.environ.get("TRANSCRIPT_CACHE_DIR", "cache/transcripts"),
+            max_bytes=int(os.environ.get("TRANSCRIPT_CACHE_MAX_MB", "512")) * 1024 * 1024,
+            pipeline_version=pipeline_version
+        )
+
+    def new_hasher(self):
+        """Хэш, в который передаются байты PCM по мере декодирования"""
+        hasher = hashlib.sha256()
+        hasher.update(self.version.encode("utf-8"))
+        return hasher
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _alias_path(self, alias: str) -> Path:
+        alias_key = hashlib.sha256(f"{self.version}:{alias}".encode("utf-8")).hexdigest()
+        return self.cache_dir / "aliases" / alias_key
+
+    def resolve_alias(self, alias: str) -> Optional[str]:
+        """Ключ записи по псевдониму (например, extractor_key-id видео), чтобы найти ее без декодирования аудио"""
+        try:
+            return self._alias_path(alias).read_text(encoding="utf-8").strip() or None
+        except FileNotFoundError:
+            return None
+
+    def put_alias(self, alias: str, key: str):
+        path = self._alias_path(alias)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(key)
+        os.replace(temp_path, path)
+
+    def get(self, key: str) -> Optional[PhraseLog]:
+        """Возвращает сохраненный dialogue_log или None"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                dialogue_log = PhraseLog.from_entries(json.load(f))
+            os.utime(path)
+            return dialogue_log
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, key: str, dialogue_log: PhraseLog):
+        """Сохраняет dialogue_log и при необходимости вытесняет старые записи"""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Пишем во временный файл и переименовываем, чтобы другие процессы не прочитали запись наполовину
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                dialogue_log.write_json(f)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        self.evict()
+
+    def _entries(self) -> List[Tuple[Path, os.stat_result]]:
+        entries = []
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                entries.append((path, path.stat()))
+            except FileNotFoundError:
+                continue
+        return entries
+
+    def _aliases(self) -> List[Tuple[Path, os.stat_result]]:
+        aliases = []
+        for path in self.cache_dir.glob("aliases/*"):
+            try:
+                aliases.append((path, path.stat()))
+            except FileNotFoundError:
+                continue
+        return aliases
+
+    def evict(self):
+        """Удаляет давно не использованные записи, пока размер кэша (с псевдонимами) больше max_bytes
+
+        Вместе с записями удаляются указывающие на них псевдонимы и брошенные файлы блокировок.
+        """
+        entries = self._entries()
+        aliases = self._aliases()
+        total = sum(stat.st_size for _, stat in entries) + sum(stat.st_size for _, stat in aliases)
+        if total <= self.max_bytes:
+            return
+
+        evicted = set()
+        for path, stat in sorted(entries, key=lambda entry: entry[1].st_mtime):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            evicted.add(path.stem)
+            total -= stat.st_size
+            logger.info(f"🧹 Запись кэша транскрипций вытеснена: {path.name}")
+
+        for path, _ in aliases:
+            try:
+                key = path.read_text(encoding="utf-8").strip()
+            except FileNotFoundError:
+                continue
+            if key in evicted or not self._path(key).exists():
+                path.unlink(missing_ok=True)
+
+    def usage(self) -> Dict[str, Any]:
+        """Число записей и занимаемый объем"""
+        entries = self._entries()
+        aliases = self._aliases()
+        return {
+            "entries": len(entries),
+            "aliases": len(aliases),
+            "size_bytes": sum(stat.st_size for _, stat in entries) + sum(stat.st_size for _, stat in aliases),
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Запись транскрипции в файл по мере распознавания фраз
+"""
+
+import fcntl
+import itertools
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Iterable, Tuple
+
+# Как часто (сек) записанные фразы сбрасываются из буфера в файл
+FLUSH_INTERVAL = 1.0
+
+
+class TranscriptWriter:
+    """Пишет фразы в файл <имя>.part по одной и переименовывает его в итоговый файл при закрытии
+
+    Буфер сбрасывается не реже раза в FLUSH_INTERVAL сек, поэтому файл .part можно читать (tail -f)
+    во время обработки, а после падения процесса в нем остаются уже распознанные фразы.
+    Имя файла уникально: задачи с одинаковым названием, начатые в одну секунду, получают суффикс _2, _3, ...
+    Пока файл открыт, на .part держится блокировка flock: по ней remove_stale_parts отличает файлы
+    идущих задач (в любом процессе) от брошенных - после падения процесса блокировка снимается сама.
+    """
+
+    extension = ""
+
+    def __init__(self, output_dir: Path, video_title: str):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.path, self.part_path, fd = self._create_part(Path(output_dir), f"{video_title}_transcription_{timestamp}")
+        self.phrases = 0
+        self._file = os.fdopen(fd, "w", encoding="utf-8")
+        self._last_flush = time.monotonic()
+        self._write_header(video_title, timestamp)
+
+    def _create_part(self, output_dir: Path, base_name: str) -> Tuple[Path, Path, int]:
+        """Создает .part с O_EXCL под свободным итоговым именем
+
+        .part существует, пока писатель не переименует его в итоговый файл, поэтому имя занято,
+        если есть любой из двух файлов; итоговый файл проверяется после создания .part.
+        """
+        for attempt in itertools.count(1):
+            name = base_name if attempt == 1 else f"{base_name}_{attempt}"
+            path = output_dir / f"{name}.{self.extension}"
+            part_path = path.with_name(path.name + ".part")
+            try:
+                fd = os.open(part_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            except FileExistsError:
+                continue
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            if not self._holds(part_path, fd):
+                # Очистка успела удалить файл до блокировки - имя снова свободно
+                os.close(fd)
+                continue
+            if not path.exists():
+                return path, part_path, fd
+            os.close(fd)
+            part_path.unlink()
+
+    @staticmethod
+    def _holds(part_path: Path, fd: int) -> bool:
+        """Открытый fd - все еще файл part_path, а не удаленный"""
+        try:
+            return os.path.samestat(os.fstat(fd), os.stat(part_path))
+        except FileNotFoundError:
+            return False
+
+    def write(self, entry: Dict[str, Any]):
+        """Дописывает фразу dialogue_log"""
+        self._write_entry(entry)
+        self.phrases += 1
+        if time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+            self._file.flush()
+            self._last_flush = time.monotonic()
+
+    def write_all(self, entries: Iterable[Dict[str, Any]]):
+        for entry in entries:
+            self.write(entry)
+
+    def close(self) -> Path:
+        """Завершает файл и переименовывает .part в итоговое имя"""
+        self._write_footer()
+        self._file.flush()
+        # Переименование до закрытия: блокировка держится, пока файл еще называется .part
+        try:
+            os.replace(self.part_path, self.path)
+        finally:
+            self._file.close()
+        return self.path
+
+    def abort(self):
+        """Закрывает и удаляет незавершенный файл после ошибки задачи"""
+        self.part_path.unlink(missing_ok=True)
+        self._file.close()
+
+    def _write_header(self, video_title: str, timestamp: str):
+        pass
+
+    def _write_entry(self, entry: Dict[str, Any]):
+        raise NotImplementedError
+
+    def _write_footer(self):
+        pass
+
+
+class TxtTranscriptWriter(TranscriptWriter):
+    extension = "txt"
+
+    def _write_header(self, video_title: str, timestamp: str):
+        self._file.write(f"Транскрипция видео: {video_title}\n")
+        self._file.write("=" * 50 + "\n\n")
+
+    def _write_entry(self, entry: Dict[str, Any]):
+        self._file.write(f"[{entry['start']:.2f}s - {entry['end']:.2f}s] [{entry['role']}] {entry['text']}\n")
+
+
+class JsonTranscriptWriter(TranscriptWriter):
+    """JSON-документ: число фраз известно только в конце, поэтому total_phrases идет после списка phrases"""
+
+    extension = "json"
+
+    def _write_header(self, video_title: str, timestamp: str):
+        header = json.dumps({"video_title": video_title, "timestamp": timestamp}, ensure_ascii=False, indent=2)
+        self._file.write(header[:-2] + ',\n  "phrases": [')
+
+    def _write_entry(self, entry: Dict[str, Any]):
+        self._file.write(",\n    " if self.phrases else "\n    ")
+        self._file.write(json.dumps(entry, ensure_ascii=False))
+
+    def _write_footer(self):
+        self._file.write(f"\n  ],\n  \"total_phrases\": {self.phrases}\n}}\n" if self.phrases else f"],\n  \"total_phrases\": 0\n}}\n")
+
+
+class JsonLinesTranscriptWriter(TranscriptWriter):
+    """JSON Lines: фраза на строку, каждая строка - готовая запись даже в незавершенном файле"""
+
+    extension = "jsonl"
+
+    def _write_entry(self, entry: Dict[str, Any]):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+TRANSCRIPT_WRITERS = {
+    writer.extension: writer for writer in (TxtTranscriptWriter, JsonTranscriptWriter, JsonLinesTranscriptWriter)
+}
+
+
+def open_transcript_writer(output_dir: Path, video_title: str, output_format: str) -> TranscriptWriter:
+    """Писатель транскрипции в формате output_format (txt, json или jsonl)"""
+    writer = TRANSCRIPT_WRITERS.get(output_format)
+    if writer is None:
+        raise ValueError(f"Неподдерживаемый формат: {output_format}")
+    return writer(output_dir, video_title)
+
+
+def remove_stale_parts(output_dir: Path) -> int:
+    """Удаляет файлы .part, оставшиеся от упавших процессов
+
+    Брошенный файл определяется по блокировке, а не по возрасту: .part долгой задачи может не меняться
+    сколь угодно долго, пока в записи нет речи, но его писатель держит flock до close() или abort().
+    """
+    removed = 0
+    for part_path in Path(output_dir).glob("*.part"):
+        try:
+            fd = os.open(part_path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            continue
+        else:
+            part_path.unlink(missing_ok=True)
+            removed += 1
+        finally:
+            os.close(fd)
+    return removed
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Прием загрузки multipart/form-data из потока тела запроса: файл пишется на диск по мере получения
+"""
+
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional
+
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    import multipart
+    from multipart.multipart import parse_options_header
+
+# Текстовые поля формы (формат, приоритет) короткие, длинные не принимаются
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Тело запроса больше допустимого размера"""
+
+
+class UploadReceiver:
+    """Разбирает multipart/form-data по мере получения тела запроса
+
+    Содержимое поля file_field копится в памяти до flush(), который дописывает его в файл в target_dir
+    под именем из формы; текстовые поля собираются в fields. Размер тела считается при приеме, поэтому
+    запрос без Content-Length прерывается UploadTooLarge, как только превысит max_bytes. Ошибки формата
+    формы - ValueError.
+    """
+
+    def __init__(self, content_type: str, target_dir: Path, max_bytes: int, file_field: str):
+        media_type, params = parse_options_header(content_type)
+        boundary = params.get(b"boundary")
+        if media_type != b"multipart/form-data" or not boundary:
+            raise ValueError("Ожидается multipart/form-data")
+
+        self.target_dir = target_dir
+        self.max_bytes = max_bytes
+        self.file_field = file_field
+        self.filename: Optional[str] = None
+        self.file_path: Optional[Path] = None
+        self.fields: Dict[str, str] = {}
+        self.received = 0
+        self.pending = 0
+        self._chunks: List[bytes] = []
+        self._file: Optional[BinaryIO] = None
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: Dict[bytes, bytes] = {}
+        self._part_name: Optional[str] = None
+        self._part_is_file = False
+        self._field_value = bytearray()
+        self._parser = multipart.MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def feed(self, data: bytes):
+        """Передает очередной блок тела запроса парсеру"""
+        self.received += len(data)
+        if self.received > self.max_bytes:
+            raise UploadTooLarge()
+        self._parser.write(data)
+
+    def finish(self):
+        """Завершает разбор после последнего блока; файл должен быть в форме"""
+        self._parser.finalize()
+        self.flush()
+        self.close()
+        if self.file_path is None:
+            raise ValueError("Видео файл не предоставлен")
+
+    def flush(self):
+        """Дописывает накопленное содержимое файла на диск (блокирующий вызов)"""
+        if self._chunks:
+            self._file.write(b"".join(self._chunks))
+            self._chunks.clear()
+            self.pending = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._part_name = None
+        self._part_is_file = False
+        self._field_value = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._part_name = options.get(b"name", b"").decode("utf-8", errors="replace")
+        if self._part_name != self.file_field:
+            return
+
+        filename = options.get(b"filename", b"").decode("utf-8", errors="replace")
+        name = Path(filename.replace("\\", "/")).name
+        if name in ("", ".", ".."):
+            raise ValueError("У загруженного файла нет имени")
+        if self.file_path is not None:
+            raise ValueError("Форма содержит больше одного файла")
+
+        self.filename = filename
+        self.file_path = self.target_dir / name
+        self._file = open(self.file_path, "wb")
+        self._part_is_file = True
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._part_is_file:
+            self._chunks.append(data[start:end])
+            self.pending += end - start
+            return
+
+        self._field_value += data[start:end]
+        if len(self._field_value) > MAX_FIELD_BYTES:
+            raise ValueError(f"Поле формы {self._part_name} слишком длинное")
+
+    def _on_part_end(self):
+        if not self._part_is_file and self._part_name:
+            self.fields[self._part_name] = self._field_value.decode("utf-8", errors="replace")